@@ -1,12 +1,53 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
-from datetime import datetime
 
-from config import HOST, PORT, DEBUG, API_PREFIX, API_TITLE, API_DESCRIPTION, API_VERSION
+from config import HOST, PORT, DEBUG, API_PREFIX, API_TITLE, API_DESCRIPTION, API_VERSION, DEFAULT_HISTORY_PAGE_SIZE, DEFAULT_CONVERSATIONS_PAGE_SIZE, DEFAULT_SEARCH_PAGE_SIZE, IMPORT_BATCH_SIZE, RETENTION_INTERVAL_SECONDS, SPEECH_WAIT_SECONDS, AUDIO_CACHE_MAX_AGE, logger
 from chatbots import create_chatbot
+from database.transfer import from_ndjson, to_ndjson
+from sessions import SessionRegistry
+
+async def run_retention_periodically():
+    """
+    Archive, purge and compact conversation storage at a fixed interval.
+    """
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            result = await chatbot.database.run_retention()
+            for conversation_id in result["purged"]:
+                sessions.remove(conversation_id)
+            logger.info(
+                f"Retention pass archived {len(result['archived'])} and purged "
+                f"{len(result['purged'])} conversations, released {result['pages_released']} pages"
+            )
+        except Exception as e:
+            logger.error(f"Retention pass failed: {e}", exc_info=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run background maintenance and release the chatbot's resources when the server shuts down.
+    """
+    retention_task = None
+    if RETENTION_INTERVAL_SECONDS > 0:
+        retention_task = asyncio.create_task(run_retention_periodically())
+
+    yield
+
+    if retention_task is not None:
+        retention_task.cancel()
+        try:
+            await retention_task
+        except asyncio.CancelledError:
+            pass
+    await chatbot.close()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -15,6 +56,7 @@ app = FastAPI(
     version=API_VERSION,
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -49,6 +91,8 @@ class TokenUsage(BaseModel):
     prompt_tokens: int = 0
     completion_tokens: int = 0
     total_tokens: int = 0
+    # Prompt tokens read from cached content, billed at the cached rate
+    cached_tokens: int = 0
 
 class MessageResponse(BaseModel):
     messages: List[Dict[str, Any]]
@@ -59,12 +103,24 @@ class HistoryResponse(BaseModel):
     messages: List[Dict[str, Any]]
     created_at: Optional[str] = None
     last_activity: Optional[str] = None
+    next_cursor: Optional[str] = None
 
 class StatusResponse(BaseModel):
     success: bool
 
 class ConversationsResponse(BaseModel):
     conversations: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class ImportResponse(BaseModel):
+    conversations: int
+    messages: int
+    skipped: int
 
 class HealthResponse(BaseModel):
     status: str
@@ -72,41 +128,47 @@ class HealthResponse(BaseModel):
     title: str
     description: str
 
-# Store active conversations
-active_conversations = {}
+# Recently used conversations, so existence checks skip the database
+sessions = SessionRegistry()
 
-# Helper function to check if a conversation exists and add it to active_conversations if needed
-def ensure_conversation_active(conversation_id: str) -> bool:
+# Helper function to look up a conversation's session, loading it from the database if needed
+async def get_active_session(conversation_id: str) -> Optional[Dict[str, Any]]:
     """
-    Check if a conversation exists in the database and add it to active_conversations if needed.
+    Get the session of a conversation, registering it from the database if needed.
     
     Args:
         conversation_id: The ID of the conversation to check
         
     Returns:
-        True if the conversation exists, False otherwise
+        The conversation's created_at and last_activity, or None if it doesn't exist
     """
-    # First check if it's already in our active_conversations dictionary
-    if conversation_id in active_conversations:
-        return True
+    session = sessions.get(conversation_id)
+    if session is not None:
+        return session
     
-    # If not, check if it exists in the database
     try:
-        # Use the database's conversation check method directly instead of relying on history
-        # This will work even if the conversation exists but has no messages
-        if chatbot.database.conversation_exists(conversation_id):
-            # Conversation exists in the database, add it to active_conversations
-            active_conversations[conversation_id] = {
-                "created_at": datetime.now().isoformat(),  # We don't know the real creation time, so use now
-                "last_activity": datetime.now().isoformat()
-            }
-            return True
-    except Exception:
+        info = await chatbot.get_conversation_info(conversation_id)
+    except Exception as e:
         # If there's an error checking the database, assume the conversation doesn't exist
-        pass
+        logger.error(f"Failed to look up conversation {conversation_id}: {e}")
+        return None
     
-    # Conversation doesn't exist
-    return False
+    if info is None:
+        return None
+    return sessions.put(conversation_id, info)
+
+def to_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format one Server-Sent Events message.
+    
+    Args:
+        event: The event name
+        data: The event payload, sent as a single line of JSON
+        
+    Returns:
+        The message, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # API routes
 @app.post(f"{API_PREFIX}/conversations", response_model=ConversationResponse, tags=["Conversations"])
@@ -117,19 +179,85 @@ async def create_conversation():
     Returns:
         A dictionary containing the new conversation ID
     """
-    conversation_id = chatbot.create_conversation()
+    conversation_id = await chatbot.create_conversation()
     
-    # Store creation time
-    active_conversations[conversation_id] = {
-        "created_at": datetime.now().isoformat(),
-        "last_activity": datetime.now().isoformat()
-    }
+    # Register the session with the creation time the database recorded
+    session = sessions.put(conversation_id, await chatbot.get_conversation_info(conversation_id))
     
     return {
         "conversation_id": conversation_id,
-        "created_at": active_conversations[conversation_id]["created_at"]
+        "created_at": session["created_at"]
     }
 
+@app.get(f"{API_PREFIX}/conversations/export", tags=["Conversations"])
+async def export_conversations():
+    """
+    Export every conversation as newline-delimited JSON.
+    
+    The response is streamed: each conversation is one "conversation" line
+    followed by one "message" line per message, oldest first.
+    
+    Returns:
+        A streaming application/x-ndjson response
+    """
+    async def lines():
+        async for record in chatbot.export_conversations():
+            yield to_ndjson(record)
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
+    )
+
+@app.post(f"{API_PREFIX}/conversations/import", response_model=ImportResponse, tags=["Conversations"])
+async def import_conversations(request: Request):
+    """
+    Import conversations from a newline-delimited JSON body in the export format.
+    
+    The body is read as a stream and written in batched transactions.
+    Conversations that already exist are skipped.
+    
+    Args:
+        request: The request whose body holds the NDJSON records
+        
+    Returns:
+        Counts of imported conversations and messages and skipped conversations
+        
+    Raises:
+        400: If a line is malformed. Batches before that line stay imported.
+    """
+    totals = {"conversations": 0, "messages": 0, "skipped": 0}
+    skipped = set()
+    batch = []
+    line_number = 0
+    
+    async def write_batch():
+        for key, value in (await chatbot.import_records(batch, skipped)).items():
+            totals[key] += value
+        batch.clear()
+    
+    try:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    batch.append(from_ndjson(line, line_number))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    await write_batch()
+        
+        if buffer.strip():
+            batch.append(from_ndjson(buffer, line_number + 1))
+        if batch:
+            await write_batch()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (imported so far: {totals})")
+    
+    return totals
+
 @app.post(f"{API_PREFIX}/conversations/{{conversation_id}}/messages", response_model=MessageResponse, tags=["Messages"])
 async def send_message(conversation_id: str, message_request: MessageRequest):
     """
@@ -147,79 +275,146 @@ async def send_message(conversation_id: str, message_request: MessageRequest):
         500: If there's an error processing the message
     """
     # Check if conversation exists
-    if not ensure_conversation_active(conversation_id):
+    if await get_active_session(conversation_id) is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     try:
         # Send message to chatbot - add await here
         response = await chatbot.send_message(conversation_id, message_request.message)
         
-        # Update last activity time
-        active_conversations[conversation_id]["last_activity"] = datetime.now().isoformat()
+        # Pick up the last activity time of the messages just stored
+        info = await chatbot.get_conversation_info(conversation_id)
+        if info is not None:
+            sessions.put(conversation_id, info)
         
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post(f"{API_PREFIX}/conversations/{{conversation_id}}/messages/stream", tags=["Messages"])
+async def stream_message(conversation_id: str, message_request: MessageRequest):
+    """
+    Send a message to the chatbot and stream the reply as Server-Sent Events.
+    
+    A "delta" event carries each piece of text as soon as it is generated.
+    A "done" event carries the full reply with its audio, lipsync data and
+    token usage, once the reply has been stored. "audio" events then
+    announce the reply's speech segments in order as they become playable.
+    
+    Args:
+        conversation_id: The ID of the conversation
+        message_request: The message to send
+        
+    Returns:
+        A streaming text/event-stream response
+        
+    Raises:
+        400: If the message is empty
+        404: If the conversation is not found
+    """
+    # Check if conversation exists
+    if await get_active_session(conversation_id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    # Validate up front; once streaming starts the status code is already sent
+    if not message_request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    async def events():
+        async for event in chatbot.stream_message(conversation_id, message_request.message):
+            yield to_sse(event["event"], event["data"])
+        
+        # Pick up the last activity time of the messages just stored
+        info = await chatbot.get_conversation_info(conversation_id)
+        if info is not None:
+            sessions.put(conversation_id, info)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get(f"{API_PREFIX}/conversations/{{conversation_id}}", response_model=HistoryResponse, tags=["Conversations"])
-async def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str, limit: Optional[int] = Query(None, ge=1, le=500),
+                           before: Optional[str] = None):
     """
     Get the message history for a specific conversation.
     
     Args:
         conversation_id: The ID of the conversation to retrieve
+        limit: Optional page size. When set, only the newest page is returned
+        before: Cursor from a previous page's next_cursor, to fetch older messages
         
     Returns:
         A list of messages in the conversation
         
     Raises:
+        400: If the cursor is invalid
         404: If the conversation is not found
     """
     # Check if conversation exists
-    if not ensure_conversation_active(conversation_id):
+    session = await get_active_session(conversation_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     try:
-        # Get conversation history
-        history = chatbot.get_conversation_history(conversation_id)
+        # Get conversation history, one keyset page at a time if requested
+        next_cursor = None
+        if limit is None and before is None:
+            history = await chatbot.get_conversation_history(conversation_id)
+        else:
+            history, next_cursor = await chatbot.get_conversation_page(
+                conversation_id, limit or DEFAULT_HISTORY_PAGE_SIZE, before
+            )
         
         return {
             "conversation_id": conversation_id,
             "messages": history,
-            "created_at": active_conversations[conversation_id]["created_at"],
-            "last_activity": active_conversations[conversation_id]["last_activity"]
+            "created_at": session["created_at"],
+            "last_activity": session["last_activity"],
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get(f"{API_PREFIX}/conversations", response_model=ConversationsResponse, tags=["Conversations"])
-async def get_all_conversations():
+async def get_all_conversations(limit: Optional[int] = Query(None, ge=1, le=500),
+                                offset: int = Query(0, ge=0),
+                                cursor: Optional[str] = None):
     """
-    Get a list of all conversations.
+    Get a list of all conversations, most recently active first.
     
+    Args:
+        limit: Optional page size
+        offset: Number of conversations to skip (ignored when a cursor is given)
+        cursor: Cursor from a previous page's next_cursor
+        
     Returns:
         A list of all conversations with their IDs and metadata
+        
+    Raises:
+        400: If the cursor is invalid
     """
     try:
-        # Get all conversations
-        conversations = chatbot.get_all_conversations()
-        print(conversations)
-        # Add metadata from active_conversations
-        for conversation in conversations:
-            conversation_id = conversation["id"]
-            if conversation_id in active_conversations:
-                conversation["created_at"] = active_conversations[conversation_id]["created_at"]
-                conversation["last_activity"] = active_conversations[conversation_id]["last_activity"]
-            else:
-                # Add conversation to active_conversations if it's not there
-                active_conversations[conversation_id] = {
-                    "created_at": datetime.now().isoformat(),
-                    "last_activity": datetime.now().isoformat()
-                }
-                conversation["created_at"] = active_conversations[conversation_id]["created_at"]
-                conversation["last_activity"] = active_conversations[conversation_id]["last_activity"]
-        
-        return {"conversations": conversations}
+        # Get all conversations, or one page of them
+        next_cursor = None
+        if cursor is not None:
+            conversations, next_cursor = await chatbot.get_conversations_page(
+                limit or DEFAULT_CONVERSATIONS_PAGE_SIZE, cursor
+            )
+        elif limit is not None and offset == 0:
+            conversations, next_cursor = await chatbot.get_conversations_page(limit)
+        else:
+            conversations = await chatbot.get_all_conversations(limit, offset)
+        
+        # Listing doesn't register sessions; the summaries already carry their timestamps
+        return {"conversations": conversations, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -238,23 +433,197 @@ async def delete_conversation(conversation_id: str):
         404: If the conversation is not found
     """
     # Check if conversation exists
-    if not ensure_conversation_active(conversation_id):
+    if await get_active_session(conversation_id) is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     try:
         # Delete conversation
-        result = chatbot.delete_conversation(conversation_id)
+        result = await chatbot.delete_conversation(conversation_id)
         
         if result:
-            # Remove from active conversations
-            if conversation_id in active_conversations:
-                del active_conversations[conversation_id]
+            sessions.remove(conversation_id)
             return {"success": True}
         else:
             raise HTTPException(status_code=500, detail="Failed to delete conversation")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get(f"{API_PREFIX}/search", response_model=SearchResponse, tags=["Conversations"])
+async def search_messages(q: str = Query(..., min_length=1, max_length=500),
+                          limit: int = Query(DEFAULT_SEARCH_PAGE_SIZE, ge=1, le=100),
+                          cursor: Optional[str] = None):
+    """
+    Search the messages of all conversations by keywords, newest matches first.
+    
+    Args:
+        q: Keywords that must all appear in a message; end a word with * to match prefixes
+        limit: Page size
+        cursor: Cursor from a previous page's next_cursor
+        
+    Returns:
+        Matching messages with their conversation IDs and a highlighted snippet
+        
+    Raises:
+        400: If the query or cursor is invalid
+    """
+    try:
+        results, next_cursor = await chatbot.search_messages(q, limit, cursor)
+        return {"query": q, "results": results, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def serve_speech(message_id: str, wait: float, segment: Optional[int] = None) -> Response:
+    """
+    Serve the synthesized speech of a reply or of one of its segments.
+    
+    Args:
+        message_id: ID of the reply
+        wait: Seconds to wait for synthesis before answering 202
+        segment: Number of the segment (default: the whole reply)
+        
+    Returns:
+        The audio file, or an empty 202 response if it isn't ready yet
+        
+    Raises:
+        HTTPException: 404 if the audio is unknown or expired, 500 if synthesis failed
+    """
+    try:
+        path = await chatbot.get_speech(message_id, wait, segment)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    except asyncio.TimeoutError:
+        return Response(status_code=202, headers={"Retry-After": "1"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # The cache may have evicted the file since it was synthesized
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Audio expired")
+    
+    return FileResponse(
+        path,
+        headers={"Cache-Control": f"public, max-age={AUDIO_CACHE_MAX_AGE}, immutable"}
+    )
+
+@app.get(f"{API_PREFIX}/audio/{{message_id}}", tags=["Audio"])
+async def get_audio(message_id: str, wait: float = Query(SPEECH_WAIT_SECONDS, ge=0, le=120)):
+    """
+    Get the synthesized speech of a reply, waiting for it if it isn't ready yet.
+    
+    The file is served with Range support, so players can seek and resume,
+    and may be cached by clients since a message's audio never changes.
+    
+    Args:
+        message_id: ID of the reply, as in the reply's audioUrl
+        wait: Seconds to wait for synthesis before answering 202
+        
+    Returns:
+        The audio file, or an empty 202 response if it isn't ready yet
+        
+    Raises:
+        404: If no speech is known for the message or its file was evicted
+        500: If speech synthesis failed
+    """
+    return await serve_speech(message_id, wait)
+
+@app.get(f"{API_PREFIX}/audio/{{message_id}}/segments/{{index}}", tags=["Audio"])
+async def get_audio_segment(message_id: str, index: int,
+                            wait: float = Query(SPEECH_WAIT_SECONDS, ge=0, le=120)):
+    """
+    Get the synthesized speech of one sentence segment of a reply.
+    
+    Segments are synthesized concurrently and can be played in order while
+    later ones are still being synthesized.
+    
+    Args:
+        message_id: ID of the reply
+        index: Number of the segment, as in the reply's audioSegments
+        wait: Seconds to wait for synthesis before answering 202
+        
+    Returns:
+        The audio file, or an empty 202 response if it isn't ready yet
+        
+    Raises:
+        404: If the segment is unknown or its file was evicted
+        500: If speech synthesis failed
+    """
+    return await serve_speech(message_id, wait, index)
+
+async def serve_lipsync(message_id: str, wait: float, segment: Optional[int] = None) -> Response:
+    """
+    Serve the lipsync cues of a reply or of one of its segments.
+    
+    Args:
+        message_id: ID of the reply
+        wait: Seconds to wait for synthesis before answering 202
+        segment: Number of the segment (default: the whole reply)
+        
+    Returns:
+        The cues as JSON, or an empty 202 response if the audio isn't ready yet
+        
+    Raises:
+        HTTPException: 404 if the audio is unknown or expired, 500 if synthesis or analysis failed
+    """
+    try:
+        lipsync = await chatbot.get_lipsync(message_id, wait, segment)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    except asyncio.TimeoutError:
+        return Response(status_code=202, headers={"Retry-After": "1"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    sound_file = f"{API_PREFIX}/audio/{message_id}" + (f"/segments/{segment}" if segment is not None else "")
+    # The cues may be cached and shared between requests, so they are left as they are
+    body = {**lipsync, "metadata": {**lipsync.get("metadata", {}), "soundFile": sound_file}}
+    return JSONResponse(
+        body,
+        headers={"Cache-Control": f"public, max-age={AUDIO_CACHE_MAX_AGE}, immutable"}
+    )
+
+@app.get(f"{API_PREFIX}/audio/{{message_id}}/lipsync", tags=["Audio"])
+async def get_lipsync(message_id: str, wait: float = Query(SPEECH_WAIT_SECONDS, ge=0, le=120)):
+    """
+    Get the lipsync mouth cues of a reply's speech.
+    
+    The cues are computed from the synthesized audio, so they match its
+    timing exactly.
+    
+    Args:
+        message_id: ID of the reply
+        wait: Seconds to wait for synthesis before answering 202
+        
+    Returns:
+        The cues, or an empty 202 response if the audio isn't ready yet
+        
+    Raises:
+        404: If no speech is known for the message or its file was evicted
+        500: If speech synthesis or the analysis failed
+    """
+    return await serve_lipsync(message_id, wait)
+
+@app.get(f"{API_PREFIX}/audio/{{message_id}}/segments/{{index}}/lipsync", tags=["Audio"])
+async def get_segment_lipsync(message_id: str, index: int,
+                              wait: float = Query(SPEECH_WAIT_SECONDS, ge=0, le=120)):
+    """
+    Get the lipsync mouth cues of one sentence segment of a reply.
+    
+    Args:
+        message_id: ID of the reply
+        index: Number of the segment, as in the reply's audioSegments
+        wait: Seconds to wait for synthesis before answering 202
+        
+    Returns:
+        The cues, or an empty 202 response if the audio isn't ready yet
+        
+    Raises:
+        404: If the segment is unknown or its file was evicted
+        500: If speech synthesis or the analysis failed
+    """
+    return await serve_lipsync(message_id, wait, index)
+
 @app.get(f"{API_PREFIX}/health", response_model=HealthResponse, tags=["System"])
 async def health_check():
     """
@@ -270,6 +639,16 @@ async def health_check():
         "description": API_DESCRIPTION
     }
 
+@app.get(f"{API_PREFIX}/metrics", tags=["System"])
+async def get_metrics():
+    """
+    Runtime metrics endpoint.
+    
+    Returns:
+        Counters of the session registry and the chatbot's caches and storage layers
+    """
+    return {"sessions": sessions.stats(), **chatbot.get_metrics()}
+
 # Run the application
 if __name__ == "__main__":
     import uvicorn
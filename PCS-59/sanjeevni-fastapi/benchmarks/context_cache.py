@@ -0,0 +1,97 @@
+"""
+Walk the cached prompt prefix through its lifecycle against the local fake
+Gemini server, and compare turn latency and billed prompt tokens with and
+without it.
+
+The fake server spends --token-delay seconds per uncached prompt token, so
+resending the system prompt and tool declarations costs time as it would
+with a real model. Caching is forced on whatever the size of the prefix
+(GEMINI_CONTEXT_CACHE_MIN_TOKENS=0). Midway a tool is registered, which
+must switch requests to a new cached content, and the TTL is short so the
+handle is extended along the way.
+
+Usage: python benchmarks/context_cache.py [--turns 12] [--ttl SECONDS] [--token-delay SECONDS] [--no-cache]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gemini import FakeGemini
+
+
+async def run(turns: int, ttl: int, token_delay: float, cache: bool) -> None:
+    fake = FakeGemini(delay=0.05, token_delay=token_delay)
+    port = fake.start()
+
+    # Configure the app before importing it
+    os.environ.update({
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{port}/",
+        "GEMINI_CONTEXT_CACHE": str(cache),
+        "GEMINI_CONTEXT_CACHE_TTL_SECONDS": str(ttl),
+        "GEMINI_CONTEXT_CACHE_MIN_TOKENS": "0",
+        "STORAGE_BACKEND": "memory",
+        "AUDIO_DIR": tempfile.mkdtemp(),
+    })
+    import app as server
+    from tools import tool_registry
+
+    chatbot = server.chatbot
+    # Only the LLM round trip is measured; speech synthesis would call out to Google
+    chatbot.speech.submit = lambda *args, **kwargs: None
+
+    print(f"Context cache {'on' if cache else 'off'}, TTL {ttl}s, {token_delay * 1000:.1f} ms per uncached token\n")
+    print(f"{'turn':>4} {'latency':>8} {'prompt':>7} {'cached':>7} {'billed':>7}  cached content")
+
+    transport = httpx.ASGITransport(app=server.app)
+    billed_total = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        conversation_id = (await client.post("/api/v1/conversations")).json()["conversation_id"]
+        for turn in range(1, turns + 1):
+            if turn == turns // 2 + 1:
+                tool_registry.register_tool(
+                    "lookup_clinic", "Find the nearest clinic to the patient",
+                    {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+                    lambda city: {"clinic": f"{city} General"},
+                )
+                print("     -- registered a tool --")
+
+            started = time.perf_counter()
+            response = await client.post(
+                f"/api/v1/conversations/{conversation_id}/messages", json={"message": "I have a headache"}
+            )
+            response.raise_for_status()
+            elapsed = time.perf_counter() - started
+
+            usage = response.json()["token_usage"]
+            billed = usage["prompt_tokens"] - usage["cached_tokens"]
+            billed_total += billed
+            name = chatbot.prefix_cache.stats()["name"] or "-"
+            print(f"{turn:>4} {elapsed * 1000:>6.0f}ms {usage['prompt_tokens']:>7} "
+                  f"{usage['cached_tokens']:>7} {billed:>7}  {name}")
+
+            if turn == turns // 4:
+                # Let most of the TTL pass, so the next turn extends the handle
+                await asyncio.sleep(ttl * 0.85)
+
+    print(f"\nUncached prompt tokens over {turns} turns: {billed_total}")
+    print(f"Prefix cache: {chatbot.prefix_cache.stats()}")
+    print(f"Fake server calls: {fake.calls}")
+    await chatbot.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--ttl", type=int, default=4, help="seconds the cached content lives")
+    parser.add_argument("--token-delay", type=float, default=0.0005, help="seconds per uncached prompt token")
+    parser.add_argument("--no-cache", action="store_true", help="send the prefix with every request, as before")
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.ttl, args.token_delay, not args.no_cache))
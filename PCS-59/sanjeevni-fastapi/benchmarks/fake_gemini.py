@@ -0,0 +1,195 @@
+"""
+A local stand-in for the Gemini API, for benchmarks and manual testing.
+
+Serves generateContent and the cachedContents endpoints (create, list,
+get, extend, delete) with in-memory state. A reply takes a fixed delay
+plus a delay per prompt token that isn't read from cached content, like
+the prompt processing of a real model, and reports its token usage the
+way the API does, including cachedContentTokenCount.
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port>/.
+
+Usage: python benchmarks/fake_gemini.py [--port 8765] [--delay SECONDS] [--token-delay SECONDS]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokens import count_tokens
+
+REPLY = "Take rest and drink water."
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _not_found(name: str) -> web.Response:
+    return web.json_response(
+        {"error": {"code": 404, "message": f"CachedContent not found: {name}", "status": "NOT_FOUND"}},
+        status=404,
+    )
+
+
+class FakeGemini:
+    """In-memory fake of the Gemini endpoints the chatbot uses."""
+
+    def __init__(self, delay: float = 0.5, token_delay: float = 0.0):
+        """
+        Args:
+            delay: Seconds every reply takes
+            token_delay: Extra seconds per prompt token not read from cached content
+        """
+        self.delay = delay
+        self.token_delay = token_delay
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+
+    def _count(self, call: str) -> None:
+        self.calls[call] = self.calls.get(call, 0) + 1
+
+    def _live(self, name: str) -> Optional[Dict[str, Any]]:
+        cached = self.caches.get(name)
+        if cached is None or cached["expires"] <= datetime.now(timezone.utc):
+            self.caches.pop(name, None)
+            return None
+        return cached
+
+    @staticmethod
+    def _resource(cached: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "name": cached["name"],
+            "displayName": cached["displayName"],
+            "model": cached["model"],
+            "createTime": cached["createTime"],
+            "updateTime": cached["updateTime"],
+            "expireTime": _timestamp(cached["expires"]),
+            "usageMetadata": {"totalTokenCount": cached["tokens"]},
+        }
+
+    async def create_cache(self, request: web.Request) -> web.Response:
+        self._count("create")
+        body = await request.json()
+        now = datetime.now(timezone.utc)
+        name = f"cachedContents/fake{next(self._ids)}"
+        self.caches[name] = {
+            "name": name,
+            "displayName": body.get("displayName", ""),
+            "model": body.get("model", ""),
+            "createTime": _timestamp(now),
+            "updateTime": _timestamp(now),
+            "expires": now + timedelta(seconds=float(body.get("ttl", "3600s").rstrip("s"))),
+            "tokens": count_tokens(json.dumps({k: body.get(k) for k in ("systemInstruction", "tools", "contents")})),
+        }
+        return web.json_response(self._resource(self.caches[name]))
+
+    async def list_caches(self, request: web.Request) -> web.Response:
+        self._count("list")
+        live = [self._resource(c) for name in list(self.caches) if (c := self._live(name))]
+        return web.json_response({"cachedContents": live})
+
+    async def get_cache(self, request: web.Request) -> web.Response:
+        self._count("get")
+        name = f"cachedContents/{request.match_info['id']}"
+        cached = self._live(name)
+        return web.json_response(self._resource(cached)) if cached else _not_found(name)
+
+    async def update_cache(self, request: web.Request) -> web.Response:
+        self._count("update")
+        name = f"cachedContents/{request.match_info['id']}"
+        cached = self._live(name)
+        if cached is None:
+            return _not_found(name)
+        body = await request.json()
+        now = datetime.now(timezone.utc)
+        cached["expires"] = now + timedelta(seconds=float(body.get("ttl", "3600s").rstrip("s")))
+        cached["updateTime"] = _timestamp(now)
+        return web.json_response(self._resource(cached))
+
+    async def delete_cache(self, request: web.Request) -> web.Response:
+        self._count("delete")
+        name = f"cachedContents/{request.match_info['id']}"
+        return web.json_response({}) if self.caches.pop(name, None) else _not_found(name)
+
+    async def generate(self, request: web.Request) -> web.Response:
+        self._count("generate")
+        body = await request.json()
+        cached_tokens = 0
+        if body.get("cachedContent"):
+            cached = self._live(body["cachedContent"])
+            if cached is None:
+                return _not_found(body["cachedContent"])
+            cached_tokens = cached["tokens"]
+
+        prompt_tokens = count_tokens(json.dumps({k: body.get(k) for k in ("systemInstruction", "tools", "contents")}))
+        await asyncio.sleep(self.delay + prompt_tokens * self.token_delay)
+
+        usage = {
+            "promptTokenCount": prompt_tokens + cached_tokens,
+            "candidatesTokenCount": count_tokens(REPLY),
+            "totalTokenCount": prompt_tokens + cached_tokens + count_tokens(REPLY),
+        }
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": REPLY}]}}],
+            "usageMetadata": usage,
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/{version}/cachedContents", self.create_cache)
+        app.router.add_get("/{version}/cachedContents", self.list_caches)
+        app.router.add_get("/{version}/cachedContents/{id}", self.get_cache)
+        app.router.add_patch("/{version}/cachedContents/{id}", self.update_cache)
+        app.router.add_delete("/{version}/cachedContents/{id}", self.delete_cache)
+        app.router.add_post("/{path:.*}", self.generate)
+        return app
+
+    def start(self) -> int:
+        """
+        Serve on its own thread and event loop, so it keeps answering even
+        while a caller blocks its own loop.
+
+        Returns:
+            The port the server listens on
+        """
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        ports = []
+
+        async def serve():
+            runner = web.AppRunner(self.app())
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            ports.append(site._server.sockets[0].getsockname()[1])
+
+        def main():
+            loop.run_until_complete(serve())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=main, daemon=True).start()
+        ready.wait()
+        return ports[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds every reply takes")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="extra seconds per uncached prompt token")
+    args = parser.parse_args()
+    web.run_app(FakeGemini(args.delay, args.token_delay).app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,89 @@
+"""
+Measure how reply latency scales with concurrent users, against a local
+fake Gemini server that answers every request after a fixed delay.
+
+Requests go through the FastAPI app in-process, so they all share one
+event loop like a single uvicorn worker. With --blocking the chatbot
+calls the synchronous client instead, as it did before it moved to
+client.aio, for comparison.
+
+Usage: python benchmarks/gemini_concurrency.py [--delay SECONDS] [--levels 1,4,16,64] [--blocking]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gemini import FakeGemini
+
+
+async def send_all(client: httpx.AsyncClient, conversations: list) -> list:
+    """Send one message in each conversation at once and return each latency."""
+    async def send(conversation_id: str) -> float:
+        started = time.perf_counter()
+        response = await client.post(
+            f"/api/v1/conversations/{conversation_id}/messages", json={"message": "I have a headache"}
+        )
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    return await asyncio.gather(*(send(cid) for cid in conversations))
+
+
+async def run(levels: list, delay: float, blocking: bool) -> None:
+    port = FakeGemini(delay).start()
+
+    # Configure the app before importing it
+    os.environ.update({
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{port}/",
+        "STORAGE_BACKEND": "memory",
+        "AUDIO_DIR": tempfile.mkdtemp(),
+    })
+    import app as server
+
+    chatbot = server.chatbot
+    # Only the LLM round trip is measured; speech synthesis would call out to Google
+    chatbot.speech.submit = lambda *args, **kwargs: None
+    if blocking:
+        models = chatbot.client.models
+
+        async def generate_content(**kwargs):
+            return models.generate_content(**kwargs)
+
+        chatbot.client.aio.models.generate_content = generate_content
+
+    mode = "synchronous client" if blocking else "async client"
+    print(f"Fake model delay {delay * 1000:.0f} ms, {mode}\n")
+    print(f"{'users':>6} {'elapsed':>9} {'replies/s':>10} {'p50':>8} {'p95':>8}")
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        for users in levels:
+            conversations = [
+                (await client.post("/api/v1/conversations")).json()["conversation_id"] for _ in range(users)
+            ]
+            started = time.perf_counter()
+            latencies = sorted(await send_all(client, conversations))
+            elapsed = time.perf_counter() - started
+
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{users:>6} {elapsed:>8.2f}s {users / elapsed:>10.1f} {p50 * 1000:>6.0f}ms {p95 * 1000:>6.0f}ms")
+
+    await chatbot.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds the fake model takes per reply")
+    parser.add_argument("--levels", default="1,4,16,64", help="comma-separated numbers of concurrent users")
+    parser.add_argument("--blocking", action="store_true", help="use the synchronous client, as before")
+    args = parser.parse_args()
+    asyncio.run(run([int(n) for n in args.levels.split(",")], args.delay, args.blocking))
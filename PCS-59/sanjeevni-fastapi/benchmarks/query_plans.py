@@ -0,0 +1,107 @@
+"""
+Show query plans and timings of the hot conversation queries before and
+after the schema migrations.
+
+Usage: python benchmarks/query_plans.py [conversations] [messages_per_conversation]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.migrations import migrate, latest_version
+
+QUERIES = {
+    "history": (
+        "SELECT rowid, role, content FROM messages WHERE conversation_id = ? ORDER BY timestamp, rowid",
+        True,
+    ),
+    "recent window": (
+        "SELECT rowid, role, content FROM messages WHERE conversation_id = ? "
+        "ORDER BY timestamp DESC, rowid DESC LIMIT 11",
+        True,
+    ),
+    "list conversations": (
+        "SELECT c.id, c.created_at, COUNT(m.id) AS message_count, MAX(m.timestamp) AS last_activity "
+        "FROM conversations c LEFT JOIN messages m ON c.id = m.conversation_id "
+        "GROUP BY c.id ORDER BY last_activity DESC",
+        False,
+    ),
+    "delete messages": (
+        "DELETE FROM messages WHERE conversation_id = ?",
+        True,
+    ),
+}
+
+
+def populate(conn: sqlite3.Connection, conversations: int, per_conversation: int) -> list:
+    """Fill the database with synthetic conversations, interleaved like real traffic."""
+    ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    start = datetime(2025, 1, 1)
+    conn.executemany(
+        "INSERT INTO conversations (id, created_at) VALUES (?, ?)",
+        [(cid, start.isoformat()) for cid in ids],
+    )
+    rows = []
+    for turn in range(per_conversation):
+        for n, cid in enumerate(ids):
+            ts = (start + timedelta(seconds=turn * conversations + n)).isoformat()
+            role = "user" if turn % 2 == 0 else "assistant"
+            rows.append((str(uuid.uuid4()), cid, role, f"message {turn} of {cid}", ts))
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    return ids
+
+
+def report(conn: sqlite3.Connection, sample_id: str, label: str) -> None:
+    """Print the plan and median timing of each query."""
+    print(f"\n=== {label} ===")
+    for name, (sql, takes_id) in QUERIES.items():
+        params = (sample_id,) if takes_id else ()
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - started)
+            # Keep the data for the next run
+            conn.rollback()
+        timings.sort()
+
+        print(f"\n{name}: {timings[len(timings) // 2] * 1000:.2f} ms")
+        for row in plan:
+            print(f"    {row[3]}")
+
+
+def main(argv: list) -> int:
+    conversations = int(argv[1]) if len(argv) > 1 else 2000
+    per_conversation = int(argv[2]) if len(argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        migrate(conn, target=1)
+        ids = populate(conn, conversations, per_conversation)
+        sample_id = ids[len(ids) // 2]
+        print(f"{conversations} conversations x {per_conversation} messages")
+
+        report(conn, sample_id, "schema version 1 (no indexes)")
+
+        migrate(conn)
+        conn.execute("ANALYZE")
+        report(conn, sample_id, f"schema version {latest_version()}")
+        conn.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
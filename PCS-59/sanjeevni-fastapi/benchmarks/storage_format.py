@@ -0,0 +1,186 @@
+"""
+Compare file size and read/write latency of the v1 and v2 message storage
+formats on the same synthetic conversations.
+
+Usage: python benchmarks/storage_format.py [conversations] [messages_per_conversation]
+"""
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.encoding import (
+    decode_id,
+    decode_payload,
+    decode_role,
+    decode_timestamp,
+    encode_id,
+    encode_payload,
+    encode_role,
+    encode_timestamp,
+    register_functions,
+)
+from database.migrations import migrate
+
+WORDS = (
+    "patient reports mild severe headache fever cough fatigue nausea dizziness "
+    "since yesterday morning evening after meals blood pressure medication dose "
+    "recommend hydration rest follow up with physician if symptoms persist"
+).split()
+
+READS = {
+    "v1": (
+        "SELECT id, role, content, timestamp, tool_calls, tool_results FROM messages "
+        "WHERE conversation_id = ? ORDER BY timestamp, rowid"
+    ),
+    "v2": (
+        "SELECT public_id, role, content, timestamp, tool_calls, tool_results FROM messages "
+        "WHERE conversation_id = ? ORDER BY timestamp, seq"
+    ),
+}
+
+
+def synthetic_messages(conversations: int, per_conversation: int) -> list:
+    """Build interleaved messages with a realistic mix of short and long payloads."""
+    rng = random.Random(42)
+    ids = [str(uuid.uuid4()) for _ in range(conversations)]
+    start = datetime(2025, 1, 1)
+    messages = []
+    for turn in range(per_conversation):
+        for n, cid in enumerate(ids):
+            user = turn % 2 == 0
+            words = rng.randint(5, 30) if user else rng.randint(40, 250)
+            tool_calls = None
+            if not user and rng.random() < 0.2:
+                tool_calls = json.dumps([{"name": "lookup", "args": {"query": " ".join(rng.choices(WORDS, k=60))}}])
+            messages.append((
+                str(uuid.uuid4()), cid, "user" if user else "assistant",
+                " ".join(rng.choices(WORDS, k=words)),
+                (start + timedelta(seconds=turn * conversations + n, microseconds=rng.randint(0, 999999))).isoformat(),
+                tool_calls,
+            ))
+    return ids, messages
+
+
+def insert_v1(conn: sqlite3.Connection, messages: list) -> None:
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, timestamp, tool_calls) VALUES (?, ?, ?, ?, ?, ?)",
+        messages,
+    )
+
+
+def insert_v2(conn: sqlite3.Connection, messages: list) -> None:
+    conn.executemany(
+        "INSERT INTO messages (public_id, conversation_id, role, content, timestamp, tool_calls) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (encode_id(mid), cid, encode_role(role), encode_payload(content),
+             encode_timestamp(ts), encode_payload(calls))
+            for mid, cid, role, content, ts, calls in messages
+        ],
+    )
+
+
+def read_history(conn: sqlite3.Connection, version: str, conversation_id: str) -> list:
+    """Read and decode one conversation the way the API returns it."""
+    history = []
+    for mid, role, content, ts, calls, results in conn.execute(READS[version], (conversation_id,)):
+        history.append({
+            "id": decode_id(mid),
+            "role": decode_role(role),
+            "content": decode_payload(content),
+            "timestamp": decode_timestamp(ts),
+            "tool_calls": json.loads(decode_payload(calls)) if calls else None,
+        })
+    return history
+
+
+def median_ms(func, repeat: int = 20) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def build(path: str, version: int, ids: list, messages: list) -> float:
+    """Create a database at the given schema version and return the insert time in seconds."""
+    conn = sqlite3.connect(path)
+    register_functions(conn)
+    migrate(conn, 6 if version == 1 else None)
+    conn.executemany(
+        "INSERT INTO conversations (id, created_at) VALUES (?, ?)",
+        [(cid, "2025-01-01T00:00:00") for cid in ids],
+    )
+    started = time.perf_counter()
+    (insert_v1 if version == 1 else insert_v2)(conn, messages)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.execute("VACUUM")
+    conn.close()
+    return elapsed
+
+
+def main(argv: list) -> int:
+    conversations = int(argv[1]) if len(argv) > 1 else 1000
+    per_conversation = int(argv[2]) if len(argv) > 2 else 50
+
+    ids, messages = synthetic_messages(conversations, per_conversation)
+    sample_ids = ids[::max(1, len(ids) // 50)]
+    print(f"{conversations} conversations x {per_conversation} messages")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for version in (1, 2):
+            path = os.path.join(tmp, f"v{version}.db")
+            insert_seconds = build(path, version, ids, messages)
+
+            conn = sqlite3.connect(path)
+            register_functions(conn)
+            name = f"v{version}"
+            results[name] = {
+                "file_mb": os.path.getsize(path) / 2 ** 20,
+                "bytes_per_message": os.path.getsize(path) / len(messages),
+                "insert_us_per_message": insert_seconds / len(messages) * 1e6,
+                "history_ms": median_ms(lambda: [read_history(conn, name, cid) for cid in sample_ids])
+                / len(sample_ids),
+            }
+            conn.close()
+
+        # Converting an existing v1 file must give the same result as writing v2 directly
+        converted = os.path.join(tmp, "converted.db")
+        shutil.copy(os.path.join(tmp, "v1.db"), converted)
+        conn = sqlite3.connect(converted)
+        register_functions(conn)
+        conn.execute("PRAGMA foreign_keys=ON")
+        started = time.perf_counter()
+        migrate(conn)
+        convert_seconds = time.perf_counter() - started
+        conn.execute("VACUUM")
+        original = sqlite3.connect(os.path.join(tmp, "v1.db"))
+        same = all(
+            read_history(conn, "v2", cid) == read_history(original, "v1", cid)
+            for cid in sample_ids
+        )
+        original.close()
+        conn.close()
+
+    print(f"\n{'':24}{'v1':>12}{'v2':>12}")
+    for key in ("file_mb", "bytes_per_message", "insert_us_per_message", "history_ms"):
+        print(f"{key:24}{results['v1'][key]:12.2f}{results['v2'][key]:12.2f}")
+    print(f"\nconverted v1 -> v2 in {convert_seconds:.2f}s, histories identical: {same}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,10 +1,20 @@
-from typing import Dict, List, Any, Optional
+import asyncio
+from typing import AsyncIterator, Dict, Iterable, List, Any, Optional, Set, Tuple
 import uuid
 from abc import ABC, abstractmethod
 
-from database import DriveThruDatabase
-from config import MAX_CONVERSATION_HISTORY, logger, get_system_prompt
+from database import AsyncDatabase, storage_registry
+from config import (
+    DATABASE_POOL_SIZE,
+    DATABASE_SHARDS,
+    STORAGE_BACKEND,
+    SPEECH_WAIT_SECONDS,
+    logger,
+    get_system_prompt,
+)
 from tools import tool_registry
+from speech import SpeechJobs
+from chatbots.context import ContextBuilder
 
 class BaseChatbot(ABC):
     """
@@ -19,10 +29,17 @@ class BaseChatbot(ABC):
         Args:
             database_path: Path to the conversation database file
         """
-        self.database = DriveThruDatabase(database_path)
+        database = storage_registry.create_backend(STORAGE_BACKEND, database_path)
+        # One database thread per pooled connection across all shards
+        self.database = AsyncDatabase(database, max_workers=DATABASE_POOL_SIZE * DATABASE_SHARDS)
+        # Replies are spoken by background jobs keyed by message ID
+        self.speech = SpeechJobs()
+        # Prompts carry as much history as fits the token budget; older
+        # messages are folded into a running summary by _summarize
+        self.context = ContextBuilder(self.database, self._summarize)
         self.tools = None
     
-    def create_conversation(self) -> str:
+    async def create_conversation(self) -> str:
         """
         Create a new conversation and return its ID.
         
@@ -30,10 +47,10 @@ class BaseChatbot(ABC):
             Conversation ID
         """
         conversation_id = str(uuid.uuid4())
-        self.database.create_conversation(conversation_id)
+        await self.database.create_conversation(conversation_id)
         return conversation_id
     
-    def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+    async def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """
         Get the conversation history.
         
@@ -43,9 +60,37 @@ class BaseChatbot(ABC):
         Returns:
             List of messages in the conversation
         """
-        return self.database.get_conversation(conversation_id)
+        return await self.database.get_conversation(conversation_id)
     
-    def delete_conversation(self, conversation_id: str) -> bool:
+    async def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of a conversation.
+        
+        Args:
+            conversation_id: ID of the conversation
+            
+        Returns:
+            The conversation's creation time, message count and last activity,
+            or None if it doesn't exist
+        """
+        return await self.database.get_conversation_info(conversation_id)
+    
+    async def get_conversation_page(self, conversation_id: str, limit: int,
+                                    before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation history, newest page first.
+        
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page
+            
+        Returns:
+            The messages of the page and the cursor for the next, older page
+        """
+        return await self.database.get_messages_page(conversation_id, limit, before)
+    
+    async def delete_conversation(self, conversation_id: str) -> bool:
         """
         Delete a conversation.
         
@@ -55,16 +100,175 @@ class BaseChatbot(ABC):
         Returns:
             True if the conversation was deleted, False otherwise
         """
-        return self.database.delete_conversation(conversation_id)
+        return await self.database.delete_conversation(conversation_id)
     
-    def get_all_conversations(self) -> List[Dict[str, Any]]:
+    async def get_all_conversations(self, limit: Optional[int] = None,
+                                    offset: int = 0) -> List[Dict[str, Any]]:
         """
-        Get all conversations.
+        Get all conversations, most recently active first.
         
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+            
         Returns:
             List of all conversations
         """
-        return self.database.get_all_conversations()
+        return await self.database.get_all_conversations(limit, offset)
+    
+    async def get_conversations_page(self, limit: int,
+                                     after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list, most recently active first.
+        
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page
+            
+        Returns:
+            The conversations of the page and the cursor for the next page
+        """
+        return await self.database.get_conversations_page(limit, after)
+    
+    async def search_messages(self, query: str, limit: int,
+                              before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search all stored messages by keywords, newest matches first.
+        
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+            
+        Returns:
+            The matching messages of the page and the cursor for the next page
+        """
+        return await self.database.search_messages(query, limit, before)
+    
+    def export_conversations(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream every stored conversation as export records.
+        
+        Returns:
+            An async iterator of conversation and message records
+        """
+        return self.database.export_conversations()
+    
+    async def import_records(self, records: Iterable[Dict[str, Any]],
+                             skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records in a single transaction.
+        
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+            
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+        """
+        return await self.database.import_records(records, skipped)
+    
+    async def get_speech(self, message_id: str, timeout: float, segment: Optional[int] = None) -> str:
+        """
+        Wait for the synthesized speech of a reply, or of one of its segments.
+        
+        Args:
+            message_id: ID of the spoken message
+            timeout: Maximum number of seconds to wait
+            segment: Number of the segment (default: the whole reply)
+            
+        Returns:
+            Path of the audio file
+            
+        Raises:
+            KeyError: If no speech was synthesized for the message or segment, or it has been forgotten
+            asyncio.TimeoutError: If the audio isn't ready within the timeout
+            RuntimeError: If synthesis failed
+        """
+        return await self.speech.wait(message_id, timeout, segment)
+    
+    async def get_lipsync(self, message_id: str, timeout: float, segment: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Wait for the lipsync cues of a reply, or of one of its segments.
+        
+        Args:
+            message_id: ID of the spoken message
+            timeout: Maximum number of seconds to wait for the audio
+            segment: Number of the segment (default: the whole reply)
+            
+        Returns:
+            The metadata and mouth cues of the audio
+            
+        Raises:
+            KeyError: If no speech is known for the message or segment, or its audio is gone
+            asyncio.TimeoutError: If the audio isn't ready within the timeout
+            RuntimeError: If synthesis or the analysis failed
+        """
+        return await self.speech.lipsync(message_id, timeout, segment)
+    
+    async def _speech_events(self, message_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Announce the speech segments of a reply as their audio becomes ready.
+        
+        Args:
+            message_id: ID of the spoken message
+            
+        Yields:
+            {"event": "audio", "data": {"index": ..., "count": ..., "url": ..., "lipsync": ...}}
+            for each segment, in order, with the segment's lipsync cues (None
+            if they couldn't be computed). A segment that fails or times out
+            ends the events; the error is only logged.
+        """
+        count = len(self.speech.segment_urls(message_id))
+        try:
+            async for index, url in self.speech.iter_segments(message_id, SPEECH_WAIT_SECONDS):
+                try:
+                    lipsync = await self.get_lipsync(message_id, SPEECH_WAIT_SECONDS, index)
+                except RuntimeError as e:
+                    logger.warning(f"No lipsync for {url}: {e}")
+                    lipsync = None
+                yield {"event": "audio", "data": {"index": index, "count": count, "url": url, "lipsync": lipsync}}
+        except (KeyError, asyncio.TimeoutError, RuntimeError) as e:
+            logger.warning(f"Stopped announcing speech of {message_id}: {e!r}")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the chatbot and its storage.
+        
+        Returns:
+            A dictionary of metric groups
+        """
+        return {
+            **self.database.get_metrics(),
+            "speech": self.speech.stats(),
+            "context": self.context.stats(),
+            "tools": tool_registry.stats(),
+        }
+    
+    async def close(self) -> None:
+        """
+        Release the resources held by the chatbot.
+        """
+        await self.context.close()
+        await self.speech.close()
+        tool_registry.shutdown()
+        await self.database.close()
+
+    async def _summarize(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Fold messages into the running summary of a conversation.
+        
+        Providers that can summarize override this; by default nothing is
+        summarized and history that doesn't fit the budget is left out.
+        
+        Args:
+            summary: The previous summary, or None if there is none yet
+            messages: The messages to fold in, oldest first
+            
+        Returns:
+            The new summary, or None if the messages couldn't be summarized
+        """
+        return None
     
     @abstractmethod
     def _prepare_tools(self):
@@ -75,7 +279,7 @@ class BaseChatbot(ABC):
         pass
     
     @abstractmethod
-    def send_message(self, conversation_id: str, message: str, max_tool_call_depth: int = 10) -> Dict[str, Any]:
+    async def send_message(self, conversation_id: str, message: str, max_tool_call_depth: int = 10) -> Dict[str, Any]:
         """
         Send a message to the chatbot and get a response.
         This method must be implemented by each chatbot subclass.
@@ -89,3 +293,29 @@ class BaseChatbot(ABC):
             A dictionary containing the response and conversation ID
         """
         pass
+    
+    async def stream_message(self, conversation_id: str, message: str,
+                             lang: str = "en") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message to the chatbot and stream the response as events.
+        
+        Providers that can stream generation override this; the default
+        sends the message normally and emits the whole reply at once.
+        
+        Args:
+            conversation_id: The ID of the conversation
+            message: The message to send
+            lang: Language for TTS
+            
+        Yields:
+            {"event": "delta", "data": {"text": ...}} for each piece of the reply,
+            then {"event": "done", "data": ...} with the reply, audio, lipsync
+            and token usage
+        """
+        response = await self.send_message(conversation_id, message)
+        if response.get("messages"):
+            reply = response["messages"][0]
+        else:
+            reply = {"message": response.get("response", "")}
+        yield {"event": "delta", "data": {"text": reply["message"]}}
+        yield {"event": "done", "data": {**reply, "token_usage": response.get("token_usage")}}
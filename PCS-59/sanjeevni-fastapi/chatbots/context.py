@@ -0,0 +1,236 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    CONTEXT_PAGE_SIZE,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_TOKEN_BUDGET,
+    logger,
+)
+from database import AsyncDatabase
+from tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+# Folds messages (oldest first) into the previous summary (None for the
+# first one) and returns the new summary, or None if it can't
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[Optional[str]]]
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """
+    Get the prompt size of a stored message.
+
+    Args:
+        message: A message as returned by the database
+
+    Returns:
+        The tokens its content takes, as counted when it was stored, plus
+        the per-message overhead
+    """
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message["content"])
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """
+    Fits a conversation's history into a prompt-token budget.
+
+    Prompts carry the conversation's running summary, if it has one, and
+    then the newest messages the summary doesn't cover, as many as fit the
+    rest of the budget. After each reply, compact() checks in the
+    background whether those messages have outgrown the budget and, if
+    so, folds the oldest of them into the summary, so prompts stay the
+    same size however long the conversation runs.
+
+    Token counts are stored with each message, so building a prompt reads
+    only the recent messages it ends up using, from the conversation cache
+    when the conversation is active, and counts nothing.
+    """
+
+    def __init__(self, database: AsyncDatabase, summarize: Summarizer,
+                 budget: int = CONTEXT_TOKEN_BUDGET,
+                 summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS,
+                 page_size: int = CONTEXT_PAGE_SIZE):
+        """
+        Initialize the builder.
+
+        Args:
+            database: Database the history and summaries are read from and stored to
+            summarize: Function that folds messages into the summary
+            budget: Most tokens of history (summary included) a prompt carries
+            summary_max_tokens: Longest summary the summarizer is asked for
+            page_size: Messages read by the first query; each further query reads twice as many
+        """
+        self.database = database
+        self.summarize = summarize
+        self.budget = budget
+        self.summary_max_tokens = summary_max_tokens
+        self.page_size = page_size
+
+        self._compactions: "Dict[str, asyncio.Task[None]]" = {}
+
+        self.summaries = 0
+        self.folded = 0
+        self.failed = 0
+
+    async def _unsummarized(self, conversation_id: str, summary: Optional[Dict[str, Any]],
+                            limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Read the messages the summary doesn't cover, newest first.
+
+        Reads the most recent page_size messages, doubling the window until
+        it reaches the summary, the limit or the start of the conversation.
+        Recent messages are what the conversation cache holds, so an active
+        conversation is read from memory.
+
+        Args:
+            conversation_id: ID of the conversation
+            summary: The conversation's summary, or None
+            limit: Stop before the messages exceed this many tokens; the
+                newest message is always included (default: no limit)
+
+        Returns:
+            The messages, oldest first, and whether older messages the
+            summary doesn't cover were left out
+        """
+        through = summary["through"] if summary else None
+        window = self.page_size
+        while True:
+            recent = await self.database.get_recent_messages(conversation_id, window)
+            messages: List[Dict[str, Any]] = []
+            tokens = 0
+            for message in reversed(recent):
+                if message["id"] == through:
+                    messages.reverse()
+                    return messages, False
+                cost = message_tokens(message)
+                if limit is not None and messages and tokens + cost > limit:
+                    messages.reverse()
+                    return messages, True
+                messages.append(message)
+                tokens += cost
+            if len(recent) < window:
+                messages.reverse()
+                return messages, False
+            window *= 2
+
+    async def build(self, conversation_id: str) -> Dict[str, Any]:
+        """
+        Get the history a prompt for the conversation carries.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            {"summary": ..., "messages": [...], "tokens": ...}: the summary
+            of the older messages (None if there is none), the newest
+            messages that fit the budget, oldest first, and the tokens both
+            take together
+        """
+        summary = await self.database.get_summary(conversation_id)
+        used = summary["tokens"] + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+        messages, truncated = await self._unsummarized(conversation_id, summary, self.budget - used)
+        if truncated:
+            # Compaction is behind or failing; the oldest messages are dropped meanwhile
+            logger.warning(f"History of conversation {conversation_id} exceeds the context budget; "
+                           f"sending the newest {len(messages)} messages")
+
+        return {
+            "summary": summary["text"] if summary else None,
+            "messages": messages,
+            "tokens": used + sum(message_tokens(message) for message in messages),
+        }
+
+    def compact(self, conversation_id: str) -> None:
+        """
+        Fold old messages into the summary in the background, if needed.
+
+        Must be called from the event loop. Does nothing while a compaction
+        of the same conversation is running.
+
+        Args:
+            conversation_id: ID of the conversation
+        """
+        if conversation_id in self._compactions:
+            return
+        task = asyncio.get_running_loop().create_task(self._compact(conversation_id))
+        self._compactions[conversation_id] = task
+        task.add_done_callback(lambda _: self._compactions.pop(conversation_id, None))
+
+    async def _compact(self, conversation_id: str) -> None:
+        """Fold the oldest unsummarized messages into the summary once they outgrow the budget."""
+        try:
+            # Room for messages next to a summary of the largest size. A
+            # quarter of it is kept free for the next turn's message.
+            room = self.budget - self.summary_max_tokens - MESSAGE_OVERHEAD_TOKENS
+
+            # Reading stops at the threshold, so a conversation that needs
+            # no folding costs no more than building its prompt
+            summary = await self.database.get_summary(conversation_id)
+            _, over = await self._unsummarized(conversation_id, summary, room * 3 // 4)
+            if not over:
+                return
+
+            messages, _ = await self._unsummarized(conversation_id, summary)
+            remaining = sum(message_tokens(message) for message in messages)
+
+            # Fold down to half the room, so this runs every few turns and
+            # not on every one; the newest message always stays
+            folded = 0
+            while folded < len(messages) - 1 and remaining > room // 2:
+                remaining -= message_tokens(messages[folded])
+                folded += 1
+
+            # Summarize in chunks no larger than a prompt would be, saving
+            # after each so an interrupted compaction keeps its progress
+            text = summary["text"] if summary else None
+            start = 0
+            while start < folded:
+                end, tokens = start, 0
+                while end < folded and (end == start or tokens + message_tokens(messages[end]) <= room):
+                    tokens += message_tokens(messages[end])
+                    end += 1
+                chunk = messages[start:end]
+
+                text = await self.summarize(text, chunk)
+                if not text:
+                    logger.warning(f"No summary for conversation {conversation_id}; history left as is")
+                    self.failed += 1
+                    return
+                await self.database.set_summary(conversation_id, text, chunk[-1]["id"], count_tokens(text))
+                self.summaries += 1
+                self.folded += len(chunk)
+                start = end
+
+            logger.info(f"Folded {folded} messages of conversation {conversation_id} into its summary")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error summarizing conversation {conversation_id}: {e}", exc_info=True)
+            self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the budget and compaction counters.
+
+        Returns:
+            The token budget, running compactions, summaries written,
+            messages folded into them and failed compactions
+        """
+        return {
+            "budget": self.budget,
+            "running": len(self._compactions),
+            "summaries": self.summaries,
+            "folded": self.folded,
+            "failed": self.failed,
+        }
+
+    async def close(self) -> None:
+        """Cancel every compaction still running."""
+        pending = list(self._compactions.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._compactions.clear()
@@ -1,15 +1,25 @@
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional
 from config import (
     GEMINI_API_KEY,
     GEMINI_MODEL,
+    GEMINI_BASE_URL,
+    GEMINI_TIMEOUT_SECONDS,
+    GEMINI_CONNECT_TIMEOUT_SECONDS,
+    GEMINI_MAX_CONNECTIONS,
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_SUMMARY_PROMPT,
     logger,
     get_system_prompt,
-    MAX_CONVERSATION_HISTORY,
 )
 from tools import tool_registry
 from chatbots.base import BaseChatbot
+from chatbots.prefix_cache import PrefixCache
+from chatbots.response_cache import ResponseCache
+from speech import split_sentences
 import json
-import base64
+
+import httpx
 
 # Import the Google Generative AI client and types
 from google import genai
@@ -31,8 +41,32 @@ class GeminiChatbot(BaseChatbot):
         super().__init__(database_path)
         self.model_name = GEMINI_MODEL
 
-        # Initialize the Gemini client with the API key
-        self.client = genai.Client(api_key=GEMINI_API_KEY)
+        # One connection pool for every request, so concurrent replies reuse
+        # connections and a burst can't open unbounded sockets
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(GEMINI_TIMEOUT_SECONDS, connect=GEMINI_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+
+        # Initialize the Gemini client with the API key; requests go through
+        # client.aio so the event loop keeps serving others while they wait
+        self.client = genai.Client(
+            api_key=GEMINI_API_KEY,
+            http_options=types.HttpOptions(
+                base_url=GEMINI_BASE_URL or None,
+                timeout=int(GEMINI_TIMEOUT_SECONDS * 1000),
+                httpx_async_client=self.http_client,
+            ),
+        )
+
+        # The system prompt and tool declarations are sent as cached content
+        self.prefix_cache = PrefixCache(self.client, self.model_name)
+
+        # Replies to turns that recur across conversations are reused
+        self.response_cache = ResponseCache()
 
         # Get available tools and convert to Tool objects
         self._prepare_tools()
@@ -43,201 +77,232 @@ class GeminiChatbot(BaseChatbot):
         """
         # Get tool definitions from the registry
         function_declarations = tool_registry.get_tool_definitions()
+        self._tools_version = tool_registry.version
+        self._system_prompt = get_system_prompt()
 
         # Create Tool object if we have function declarations
         if function_declarations:
             self.tools = types.Tool(function_declarations=function_declarations)
             self.config = types.GenerateContentConfig(
-                tools=[self.tools], system_instruction=get_system_prompt()
+                tools=[self.tools], system_instruction=self._system_prompt
             )
         else:
             self.tools = None
             self.config = types.GenerateContentConfig(
-                system_instruction=get_system_prompt()
+                system_instruction=self._system_prompt
             )
 
-    def _prepare_messages(self, conversation_id: str) -> List[types.Content]:
+        self.prefix_cache.set_prefix(self.config)
+
+    async def _generation_config(self) -> types.GenerateContentConfig:
+        """
+        Get the generation config for a request.
+
+        Tools registered and system prompt changes since the config was
+        built are picked up first.
+
+        Returns:
+            The config, referring to the cached prompt prefix when there is one
+        """
+        if tool_registry.version != self._tools_version or get_system_prompt() != self._system_prompt:
+            logger.info("Tools or system prompt changed; rebuilding the generation config")
+            self._prepare_tools()
+        return await self.prefix_cache.config()
+
+    async def _generate(self, contents: List[types.Content]) -> types.GenerateContentResponse:
+        """
+        Generate a response, caching the prompt prefix again if it has gone.
+
+        Args:
+            contents: The conversation to respond to
+
+        Returns:
+            The response
+        """
+        try:
+            return await self.client.aio.models.generate_content(
+                model=self.model_name, contents=contents, config=await self._generation_config()
+            )
+        except Exception as e:
+            if not self.prefix_cache.invalidate(e):
+                raise
+        return await self.client.aio.models.generate_content(
+            model=self.model_name, contents=contents, config=await self._generation_config()
+        )
+
+    @staticmethod
+    def _token_usage(usage: Optional[types.GenerateContentResponseUsageMetadata]) -> Dict[str, int]:
+        """
+        Get the token usage of a response.
+
+        Args:
+            usage: The response's usage metadata
+
+        Returns:
+            Prompt and total tokens, and how many of the prompt tokens were
+            read from cached content
+        """
+        if usage is None:
+            return {"prompt_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+        return {
+            "prompt_tokens": usage.prompt_token_count or 0,
+            "total_tokens": usage.total_token_count or 0,
+            "cached_tokens": usage.cached_content_token_count or 0,
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the chatbot, its storage and its caches.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        return {
+            **super().get_metrics(),
+            "prefix_cache": self.prefix_cache.stats(),
+            "response_cache": self.response_cache.stats(),
+        }
+
+    async def close(self) -> None:
+        """
+        Release the resources held by the chatbot, including its connection pool.
+        """
+        await super().close()
+        await self.http_client.aclose()
+
+    async def _prepare_messages(self, conversation_id: str,
+                                context: Optional[Dict[str, Any]] = None) -> List[types.Content]:
         """
         Prepare messages for the Gemini API from the conversation history.
 
+        The history is what the context builder fits into the token budget:
+        the running summary of older messages, if any, and the newest
+        messages after it.
+
         Args:
             conversation_id: ID of the conversation
+            context: History already built for this turn (default: build it)
 
         Returns:
             List of Content objects in the format expected by Gemini
         """
-        history = self.database.get_conversation(conversation_id)
-
-        # Limit history to the last MAX_CONVERSATION_HISTORY messages
-        if len(history) > MAX_CONVERSATION_HISTORY:
-            logger.info(
-                f"Limiting conversation history to last {MAX_CONVERSATION_HISTORY} messages"
-            )
-            history = history[-MAX_CONVERSATION_HISTORY:]
+        if context is None:
+            context = await self.context.build(conversation_id)
 
         # Convert the conversation history to Content objects
         contents = []
-        for message in history:
+        for message in context["messages"]:
             role = "user" if message["role"] == "user" else "model"
-            contents.append(
-                types.Content(role=role, parts=[types.Part(text=message["content"])])
-            )
+            content = message["content"]
+            if not content or content.strip() == "":
+                logger.warning(f"Skipping empty message with role {role}")
+                continue
+            contents.append(types.Content(role=role, parts=[types.Part(text=content)]))
+
+        if context["summary"]:
+            summary = types.Part(text=f"Summary of our conversation so far:\n{context['summary']}")
+            # Joined to a leading user turn, so user and model turns still alternate
+            if contents and contents[0].role == "user":
+                contents[0].parts.insert(0, summary)
+            else:
+                contents.insert(0, types.Content(role="user", parts=[summary]))
 
         return contents
 
-    async def _get_audio_buffer(self, text: str, lang: str = "hi") -> bytes:
+    async def _summarize(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> Optional[str]:
         """
-        Get audio buffer for text-to-speech conversion using free TTS libraries.
-        Also saves the audio file to the audio directory.
-        
+        Fold messages into the running summary of a conversation with Gemini.
+
         Args:
-            text: The text to convert to speech
-            lang: The language code (default: "hi" for Hindi)
-            
+            summary: The previous summary, or None if there is none yet
+            messages: The messages to fold in, oldest first
+
         Returns:
-            A bytes object containing the audio data
+            The new summary, or None if Gemini returned none
         """
-        try:
-            # Ensure audio directory exists
-            import os
-            audio_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audio")
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            # Generate a unique filename based on timestamp and text hash
-            import time
-            import hashlib
-            text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-            timestamp = int(time.time())
-            filename = f"{timestamp}_{text_hash}_{lang}.mp3"
-            filepath = os.path.join(audio_dir, filename)
-            
-            # Try using gTTS (Google Text-to-Speech) first
-            # This doesn't require a Google Cloud subscription
-            from gtts import gTTS
-            import io
-            
-            logger.info(f"Converting text to speech using gTTS. Language: {lang}")
-            
-            # Create gTTS object
-            tts = gTTS(text=text, lang=lang, slow=False)
-            
-            # Save to file
-            tts.save(filepath)
-            logger.info(f"Saved audio file to {filepath}")
-            
-            # Read the file into a buffer to return
-            with open(filepath, 'rb') as f:
-                audio_data = f.read()
-            
-            # Return the audio content as bytes
-            return audio_data
-            
-        except Exception as e:
-            logger.warning(f"Error using gTTS: {e}. Falling back to pyttsx3.")
-            return await self._fallback_tts(text, lang)
-    
-    async def _fallback_tts(self, text: str, lang: str = "hi") -> bytes:
-        """
-        Fallback TTS method using pyttsx3 (offline text-to-speech engine).
-        Also saves the audio file to the audio directory.
-        
+        transcript = "\n".join(
+            f"{'Patient' if message['role'] == 'user' else 'Assistant'}: {message['content']}"
+            for message in messages
+        )
+        prompt = f"Current summary:\n{summary or '(none)'}\n\nMessages:\n{transcript}"
+
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=CONTEXT_SUMMARY_PROMPT,
+                max_output_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+            ),
+        )
+        text = self._text_of(response).strip()
+        return text or None
+
+    def _format_reply(self, response_text: str, message_id: str,
+                      facial_expression: str = "smile", animation: str = "Talking") -> Dict[str, Any]:
+        """
+        Build the reply object the avatar frontend renders.
+
         Args:
-            text: The text to convert to speech
-            lang: The language code
-            
+            response_text: The assistant's reply
+            message_id: ID of the stored reply, whose speech was submitted
+            facial_expression: Expression the avatar shows while speaking
+            animation: Animation the avatar plays while speaking
+
         Returns:
-            A bytes object containing the audio data
+            The reply with the URLs of its speech, of its sentence segments
+            and of its lipsync cues. The cues of a segment are served at the
+            segment's URL followed by /lipsync.
         """
-        try:
-            import pyttsx3
-            import os
-            import time
-            import hashlib
-            
-            logger.info("Using pyttsx3 fallback for text-to-speech")
-            
-            # Ensure audio directory exists
-            audio_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audio")
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            # Generate a unique filename
-            text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-            timestamp = int(time.time())
-            filename = f"{timestamp}_{text_hash}_{lang}.wav"
-            filepath = os.path.join(audio_dir, filename)
-            
-            # Initialize the TTS engine
-            engine = pyttsx3.init()
-            
-            # Try to set a voice based on language code (if available)
-            voices = engine.getProperty('voices')
-            for voice in voices:
-                # This is a rough approximation - voice IDs vary by system
-                if lang in voice.id.lower():
-                    engine.setProperty('voice', voice.id)
-                    break
-            
-            # Set properties
-            engine.setProperty('rate', 150)  # Speed of speech
-            
-            # Save to file
-            engine.save_to_file(text, filepath)
-            engine.runAndWait()
-            logger.info(f"Saved audio file to {filepath}")
-            
-            # Read the saved file and return its contents
-            with open(filepath, 'rb') as f:
-                audio_data = f.read()
-            
-            return audio_data
-                        
-        except Exception as e:
-            logger.error(f"Error in fallback TTS: {e}", exc_info=True)
-            logger.warning("All TTS methods failed. Returning empty audio buffer.")
-            return bytes()
+        audio_url = self.speech.url_for(message_id)
+        return {
+            "message": response_text,
+            "audioUrl": audio_url,
+            "audioSegments": self.speech.segment_urls(message_id),
+            "lipsyncUrl": f"{audio_url}/lipsync",
+            "facialExpression": facial_expression,
+            "animation": animation,
+        }
+
+    @staticmethod
+    def _function_calls(response: types.GenerateContentResponse) -> List[Dict[str, Any]]:
+        """
+        Collect the function calls of a response or stream chunk.
 
-    def _get_lipsync_data(self) -> dict:
+        Args:
+            response: A generate_content response or one streamed chunk
+
+        Returns:
+            The calls as {"name", "args"} dictionaries
         """
-        Get lipsync data for the response.
+        function_calls = []
+        for candidate in response.candidates or []:
+            if candidate.content and candidate.content.parts:
+                for part in candidate.content.parts:
+                    if part.function_call:
+                        args = part.function_call.args or {}
+                        function_calls.append({
+                            "name": part.function_call.name,
+                            "args": json.loads(args) if isinstance(args, str) else dict(args),
+                        })
+        return function_calls
+
+    @staticmethod
+    def _text_of(chunk: types.GenerateContentResponse) -> str:
         """
-        return {
-                "metadata": {"soundFile": "/audios/api_1.wav", "duration": 5.32},
-                "mouthCues": [
-                    {"start": 0.00, "end": 0.77, "value": "X"},
-                    {"start": 0.77, "end": 0.85, "value": "B"},
-                    {"start": 0.85, "end": 0.99, "value": "E"},
-                    {"start": 0.99, "end": 1.41, "value": "F"},
-                    {"start": 1.41, "end": 1.55, "value": "B"},
-                    {"start": 1.55, "end": 1.63, "value": "A"},
-                    {"start": 1.63, "end": 1.70, "value": "C"},
-                    {"start": 1.70, "end": 1.83, "value": "F"},
-                    {"start": 1.83, "end": 1.97, "value": "G"},
-                    {"start": 1.97, "end": 2.04, "value": "C"},
-                    {"start": 2.04, "end": 2.18, "value": "B"},
-                    {"start": 2.18, "end": 2.25, "value": "C"},
-                    {"start": 2.25, "end": 2.60, "value": "B"},
-                    {"start": 2.60, "end": 2.67, "value": "C"},
-                    {"start": 2.67, "end": 2.88, "value": "B"},
-                    {"start": 2.88, "end": 3.02, "value": "C"},
-                    {"start": 3.02, "end": 3.23, "value": "B"},
-                    {"start": 3.23, "end": 3.31, "value": "A"},
-                    {"start": 3.31, "end": 3.80, "value": "B"},
-                    {"start": 3.80, "end": 3.87, "value": "C"},
-                    {"start": 3.87, "end": 4.01, "value": "H"},
-                    {"start": 4.01, "end": 4.08, "value": "B"},
-                    {"start": 4.08, "end": 4.29, "value": "C"},
-                    {"start": 4.29, "end": 4.38, "value": "A"},
-                    {"start": 4.38, "end": 4.42, "value": "B"},
-                    {"start": 4.42, "end": 4.60, "value": "C"},
-                    {"start": 4.60, "end": 4.74, "value": "B"},
-                    {"start": 4.74, "end": 4.87, "value": "X"},
-                    {"start": 4.87, "end": 4.93, "value": "B"},
-                    {"start": 4.93, "end": 4.98, "value": "C"},
-                    {"start": 4.98, "end": 5.19, "value": "B"},
-                    {"start": 5.19, "end": 5.32, "value": "X"},
-                ],
-            }
-        
+        Get the text of a streamed chunk without the SDK's warnings about non-text parts.
+
+        Args:
+            chunk: One streamed chunk
+
+        Returns:
+            The chunk's text, or an empty string
+        """
+        if not chunk.candidates or not chunk.candidates[0].content:
+            return ""
+        return "".join(
+            part.text for part in chunk.candidates[0].content.parts or []
+            if part.text and not part.thought
+        )
 
     async def send_message(
         self,
@@ -265,54 +330,44 @@ class GeminiChatbot(BaseChatbot):
             logger.error("Empty message provided")
             raise ValueError("Message cannot be empty")
 
-        # Get conversation history
-        conversation = self.database.get_conversation(conversation_id)
-
         # Add user message to conversation
-        self.database.add_message(conversation_id, "user", message)
+        await self.database.add_message(conversation_id, "user", message)
 
         try:
-            # Prepare messages for the API
-            contents = self._prepare_messages(conversation_id)
+            context = await self.context.build(conversation_id)
+
+            # A turn seen before in the same context gets the same reply
+            cache_key = self.response_cache.key(message, context, self.prefix_cache.display_name)
+            response_text = self.response_cache.get(cache_key)
+            if response_text is not None:
+                stored = await self.database.add_message(conversation_id, "assistant", response_text)
+                self.speech.submit(stored["id"], response_text, lang)
+                self.context.compact(conversation_id)
+                return {
+                    "messages": [self._format_reply(response_text, stored["id"])],
+                    "token_usage": {"prompt_tokens": 0, "total_tokens": 0, "cached_tokens": 0},
+                }
 
-            # Create the model
-            model = self.client.models
+            # Prepare messages for the API
+            contents = await self._prepare_messages(conversation_id, context)
 
             # Generate response
-            response = model.generate_content(
-                model=self.model_name, contents=contents, config=self.config
-            )
-            
-            print(response)
-            
-            token_usage = {
-                "prompt_tokens": response.usage_metadata.prompt_token_count,
-                "total_tokens": response.usage_metadata.total_token_count,
-            }
+            response = await self._generate(contents)
+
+            token_usage = self._token_usage(response.usage_metadata)
 
             # Check if there are function calls in the response
-            function_calls = []
-            if hasattr(response, "candidates") and response.candidates:
-                for candidate in response.candidates:
-                    if hasattr(candidate, "content") and candidate.content:
-                        for part in candidate.content.parts:
-                            if hasattr(part, "function_call") and part.function_call:
-                                function_calls.append(
-                                    {
-                                        "name": part.function_call.name,
-                                        "args": json.loads(part.function_call.args),
-                                    }
-                                )
+            function_calls = self._function_calls(response)
 
             # Process function calls if any
             if function_calls:
                 logger.info(f"Found {len(function_calls)} function calls in response")
 
                 # Process the function calls
-                function_results = self._process_tool_calls(function_calls)
+                function_results = await self._process_tool_calls(function_calls)
 
                 # Handle the results of the function calls
-                result = self._handle_tool_results(
+                result = await self._handle_tool_results(
                     message,
                     function_calls,
                     function_results,
@@ -325,23 +380,19 @@ class GeminiChatbot(BaseChatbot):
             else:
                 # No function calls, just get the text response
                 response_text = response.text
+                # Replies built from tool results depend on more than the context
+                self.response_cache.put(cache_key, response_text)
 
             # Add assistant response to conversation
-            self.database.add_message(conversation_id, "assistant", response_text)
+            stored = await self.database.add_message(conversation_id, "assistant", response_text)
 
-            # Get audio buffer
-            audio_buffer = await self._get_audio_buffer(response_text, lang)
+            # Synthesize speech in the background; the reply only carries its URLs
+            self.speech.submit(stored["id"], response_text, lang)
+            # Fold old messages into the summary in the background if they outgrow the budget
+            self.context.compact(conversation_id)
 
             # Format response in the requested structure
-            messages = [
-                {
-                    "message": response_text,
-                    "audio": base64.b64encode(audio_buffer).decode("utf-8"),
-                    "lipsync": self._get_lipsync_data(),
-                    "facialExpression": "smile",  # Default expression
-                    "animation": "Talking",  # Default animation
-                }
-            ]
+            messages = [self._format_reply(response_text, stored["id"])]
 
             return {"messages": messages, "token_usage": token_usage}
 
@@ -350,32 +401,150 @@ class GeminiChatbot(BaseChatbot):
             error_message = f"I encountered an error: {str(e)}"
 
             # Add error message to conversation
-            self.database.add_message(conversation_id, "assistant", error_message)
-
-            # Create an empty audio buffer for the error message
-            try:
-                audio_buffer = await self._get_audio_buffer(error_message, lang)
-            except Exception as audio_error:
-                logger.error(f"Error generating audio for error message: {audio_error}")
-                audio_buffer = bytes()  # Empty buffer if audio generation fails
+            stored = await self.database.add_message(conversation_id, "assistant", error_message)
+            self.speech.submit(stored["id"], error_message, lang)
 
-            # Format error response in the same structure as successful responses
-            messages = [
-                {
-                    "message": error_message,
-                    "audio": base64.b64encode(audio_buffer).decode("utf-8"),
-                    "lipsync": self._get_lipsync_data(),
-                    "facialExpression": "concerned",  # Use a concerned expression for errors
-                    "animation": "Idle",  # Use a neutral animation for errors
-                }
-            ]
+            # Format error response in the same structure as successful responses,
+            # with a concerned expression and a neutral animation
+            messages = [self._format_reply(error_message, stored["id"], "concerned", "Idle")]
 
             return {
                 "messages": messages,
-                "token_usage": {"prompt_tokens": 0, "total_tokens": 0}
+                "token_usage": {"prompt_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+            }
+
+    async def stream_message(
+        self,
+        conversation_id: str,
+        message: str,
+        lang: str = "en",
+        max_tool_call_depth: int = 10,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message to the chatbot and stream the response as it is generated.
+
+        Text is forwarded chunk by chunk from generate_content_stream.
+        Sentences are synthesized as soon as they are complete, while the
+        rest of the reply is still being generated. The full reply is stored
+        once generation finishes, and its speech segments are announced in
+        order as their audio becomes ready. A reply from the response cache
+        arrives as a single delta.
+
+        Args:
+            conversation_id: The ID of the conversation
+            message: The message to send
+            lang: Language for TTS (default: "en")
+            max_tool_call_depth: Maximum depth of recursive tool calls (default: 10)
+
+        Yields:
+            {"event": "delta", "data": {"text": ...}} for each chunk of text, then
+            {"event": "done", "data": ...} with the full reply, audio and lipsync URLs
+            and token usage. The done event's message is authoritative: after
+            an error it replaces the text streamed so far. Then
+            {"event": "audio", "data": {"index": ..., "count": ..., "url": ..., "lipsync": ...}}
+            for each speech segment, in order, once it can be played.
+
+        Raises:
+            ValueError: If the message is empty
+        """
+        logger.info(f"Streaming message for conversation: {conversation_id}")
+
+        if not message or message.strip() == "":
+            logger.error("Empty message provided")
+            raise ValueError("Message cannot be empty")
+
+        await self.database.add_message(conversation_id, "user", message)
+
+        try:
+            context = await self.context.build(conversation_id)
+
+            # A turn seen before in the same context gets the same reply
+            cache_key = self.response_cache.key(message, context, self.prefix_cache.display_name)
+            response_text = self.response_cache.get(cache_key)
+            function_calls = []
+            if response_text is not None:
+                token_usage = {"prompt_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+                yield {"event": "delta", "data": {"text": response_text}}
+            else:
+                contents = await self._prepare_messages(conversation_id, context)
+
+                # The async client keeps the event loop free between chunks
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=self.model_name, contents=contents, config=await self._generation_config()
+                )
+
+                pieces = []
+                usage = None
+                spoken = 0
+                async for chunk in stream:
+                    usage = chunk.usage_metadata or usage
+                    function_calls.extend(self._function_calls(chunk))
+                    text = self._text_of(chunk)
+                    if text:
+                        pieces.append(text)
+                        yield {"event": "delta", "data": {"text": text}}
+
+                        # Start speaking the sentences completed so far
+                        sentences = split_sentences("".join(pieces), final=False)
+                        self.speech.prefetch(sentences[spoken:], lang)
+                        spoken = len(sentences)
+
+                token_usage = self._token_usage(usage)
+                response_text = "".join(pieces)
+
+                # Replies built from tool results depend on more than the context
+                if not function_calls:
+                    self.response_cache.put(cache_key, response_text)
+
+            if function_calls:
+                logger.info(f"Found {len(function_calls)} function calls in streamed response")
+
+                # The answer built from tool results arrives in one piece
+                function_results = await self._process_tool_calls(function_calls)
+                result = await self._handle_tool_results(
+                    message,
+                    function_calls,
+                    function_results,
+                    max_tool_call_depth,
+                    total_tokens=token_usage,
+                )
+                tool_text = result["response_text"]
+                token_usage = result["token_usage"]
+
+                if response_text:
+                    tool_text = "\n\n" + tool_text
+                response_text += tool_text
+                yield {"event": "delta", "data": {"text": tool_text}}
+
+            stored = await self.database.add_message(conversation_id, "assistant", response_text)
+            self.speech.submit(stored["id"], response_text, lang)
+            self.context.compact(conversation_id)
+            yield {
+                "event": "done",
+                "data": {**self._format_reply(response_text, stored["id"]), "token_usage": token_usage},
+            }
+
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}", exc_info=True)
+            # The next request creates the cached prefix again if it was the cause
+            self.prefix_cache.invalidate(e)
+            error_message = f"I encountered an error: {str(e)}"
+
+            stored = await self.database.add_message(conversation_id, "assistant", error_message)
+            self.speech.submit(stored["id"], error_message, lang)
+
+            yield {
+                "event": "done",
+                "data": {
+                    **self._format_reply(error_message, stored["id"], "concerned", "Idle"),
+                    "token_usage": {"prompt_tokens": 0, "total_tokens": 0, "cached_tokens": 0},
+                },
             }
 
-    def _handle_tool_results(
+        async for event in self._speech_events(stored["id"]):
+            yield event
+
+    async def _handle_tool_results(
         self,
         original_message: str,
         function_calls: List[Dict],
@@ -403,7 +572,7 @@ class GeminiChatbot(BaseChatbot):
             return {
                 "response_text": "I've reached the maximum depth of tool calls and cannot process further.",
                 "token_usage": total_tokens
-                or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0},
             }
 
         if recursive_calls is None:
@@ -414,7 +583,11 @@ class GeminiChatbot(BaseChatbot):
                 "prompt_tokens": 0,
                 "completion_tokens": 0,
                 "total_tokens": 0,
+                "cached_tokens": 0,
             }
+        # Usage of the first call doesn't count completion tokens separately
+        total_tokens.setdefault("completion_tokens", 0)
+        total_tokens.setdefault("cached_tokens", 0)
 
         try:
             # Prepare the message with function results
@@ -450,18 +623,14 @@ class GeminiChatbot(BaseChatbot):
                 )
 
             # Generate the final response
-            model = self.client.get_model(self.model_name)
-            response = model.generate_content(
-                contents=messages, generation_config=self.config
-            )
+            response = await self._generate(messages)
 
             # Update token usage
+            usage = self._token_usage(response.usage_metadata)
             current_call = {
                 "token_usage": {
-                    "prompt_tokens": response.usage_metadata.prompt_token_count,
-                    "total_tokens": response.usage_metadata.total_token_count,
-                    "completion_tokens": response.usage_metadata.total_token_count
-                    - response.usage_metadata.prompt_token_count,
+                    **usage,
+                    "completion_tokens": usage["total_tokens"] - usage["prompt_tokens"],
                 }
             }
 
@@ -472,22 +641,12 @@ class GeminiChatbot(BaseChatbot):
                 "completion_tokens"
             ]
             total_tokens["total_tokens"] += current_call["token_usage"]["total_tokens"]
+            total_tokens["cached_tokens"] += current_call["token_usage"]["cached_tokens"]
 
             response_text = response.text
 
             # Check if there are more function calls in the response
-            new_function_calls = []
-            if hasattr(response, "candidates") and response.candidates:
-                for candidate in response.candidates:
-                    if hasattr(candidate, "content") and candidate.content:
-                        for part in candidate.content.parts:
-                            if hasattr(part, "function_call"):
-                                new_function_calls.append(
-                                    {
-                                        "name": part.function_call.name,
-                                        "args": json.loads(part.function_call.args),
-                                    }
-                                )
+            new_function_calls = self._function_calls(response)
 
             # Process any new function calls recursively
             if new_function_calls:
@@ -501,10 +660,10 @@ class GeminiChatbot(BaseChatbot):
                 )
 
                 # Process the new function calls
-                new_function_results = self._process_tool_calls(new_function_calls)
+                new_function_results = await self._process_tool_calls(new_function_calls)
 
                 # Handle the results recursively
-                result = self._handle_tool_results(
+                result = await self._handle_tool_results(
                     original_message,
                     new_function_calls,
                     new_function_results,
@@ -525,66 +684,23 @@ class GeminiChatbot(BaseChatbot):
             # Return whatever text we have if there's an error
             return {
                 "response_text": f"I encountered an error processing the tool results: {str(e)}",
-                "token_usage": current_call["token_usage"],
+                "token_usage": total_tokens,
             }
 
-    def _prepare_conversation_history(
-        self, conversation: List[Dict]
-    ) -> List[types.Content]:
-        """
-        Prepare the conversation history for the Gemini API.
-
-        Args:
-            conversation: The conversation history
-
-        Returns:
-            List of Content objects in the format expected by Gemini
-        """
-        # Limit history to the last MAX_CONVERSATION_HISTORY messages
-        if len(conversation) > MAX_CONVERSATION_HISTORY:
-            logger.info(
-                f"Limiting conversation history to last {MAX_CONVERSATION_HISTORY} messages"
-            )
-            conversation = conversation[-MAX_CONVERSATION_HISTORY:]
-
-        contents = []
-        for message in conversation:
-            role = "user" if message["role"] == "user" else "model"
-            # Ensure content is not empty
-            content = message["content"]
-            if not content or content.strip() == "":
-                logger.warning(f"Skipping empty message with role {role}")
-                continue
-
-            contents.append(types.Content(role=role, parts=[types.Part(text=content)]))
-
-        return contents
-
-    def _process_tool_calls(self, function_calls: List[Dict]) -> List[Dict]:
+    async def _process_tool_calls(self, function_calls: List[Dict]) -> List[Dict]:
         """
         Process tool calls and get results.
 
+        The calls run concurrently, each within its tool's timeout.
+
         Args:
             function_calls: The function calls to process
 
         Returns:
-            List of results for the function calls
-        """
-        results = []
-        for call in function_calls:
-            tool_name = call["name"]
-            args = call["args"]
-
-            try:
-                # Execute the tool
-                result = tool_registry.execute_tool(tool_name, args)
-                results.append({"name": tool_name, "response": result})
-            except Exception as e:
-                results.append(
-                    {
-                        "name": tool_name,
-                        "response": {"status": "error", "error": str(e)},
-                    }
-                )
-
-        return results
+            List of results for the function calls, in the order of the calls
+        """
+        responses = await tool_registry.execute_tools(function_calls)
+        return [
+            {"name": call["name"], "response": response}
+            for call, response in zip(function_calls, responses)
+        ]
@@ -35,7 +35,7 @@ class OpenAIChatbot(BaseChatbot):
         
         # TODO: Convert tool definitions to OpenAI format if needed
         
-    def send_message(self, conversation_id: str, message: str, max_tool_call_depth: int = 10) -> Dict[str, Any]:
+    async def send_message(self, conversation_id: str, message: str, max_tool_call_depth: int = 10) -> Dict[str, Any]:
         """
         Send a message to the chatbot and get a response.
         
@@ -55,14 +55,14 @@ class OpenAIChatbot(BaseChatbot):
             raise ValueError("Message cannot be empty")
         
         # Add user message to conversation
-        self.database.add_message(conversation_id, "user", message)
+        await self.database.add_message(conversation_id, "user", message)
         
         # TODO: Implement OpenAI API call with tool calling
         # This is a placeholder response
         placeholder_response = "This is a placeholder for the OpenAI implementation. The actual implementation will be added when OpenAI integration is needed."
         
         # Add assistant response to conversation
-        self.database.add_message(conversation_id, "assistant", placeholder_response)
+        await self.database.add_message(conversation_id, "assistant", placeholder_response)
         
         return {
             "conversation_id": conversation_id,
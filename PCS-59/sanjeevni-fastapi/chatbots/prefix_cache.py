@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+
+from google import genai
+from google.genai import errors, types
+
+from config import (
+    GEMINI_CONTEXT_CACHE,
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+    GEMINI_CONTEXT_CACHE_RETRY_SECONDS,
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+    logger,
+)
+from tokens import count_tokens
+
+# Display names of the cached contents this app creates start with this
+CACHE_NAME_PREFIX = "sanjeevni-prefix"
+
+
+class PrefixCache:
+    """
+    Gemini cached content holding the static prefix of every request.
+
+    The system instruction and tool declarations are the same for every
+    request, so they are stored once as cached content and requests refer
+    to it by name: the API neither receives nor re-processes them, and
+    bills them at the cached rate.
+
+    The cached content is named after a hash of the model and the prefix.
+    Every worker with the same configuration finds and shares the same
+    one, and a prefix that changes (a new system prompt in config.py, a
+    newly registered tool) gets a new one; the old one expires on its own.
+    The handle's lifetime is extended while it is in use.
+
+    If caching fails or the prefix is too small to be cached, requests
+    carry the prefix themselves as before.
+    """
+
+    def __init__(self, client: genai.Client, model: str, enabled: bool = GEMINI_CONTEXT_CACHE,
+                 ttl: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+                 min_tokens: int = GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+                 retry_after: float = GEMINI_CONTEXT_CACHE_RETRY_SECONDS):
+        """
+        Initialize the cache. Nothing is created until the first request.
+
+        Args:
+            client: Client the cached content is managed with
+            model: Model the cached content is created for
+            enabled: Whether to cache at all
+            ttl: Seconds the cached content lives after it was created or extended
+            min_tokens: Smallest estimated prefix worth caching
+            retry_after: Seconds to go uncached after a failed attempt
+        """
+        self.client = client
+        self.model = model
+        self.enabled = enabled
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+
+        self._config: Optional[types.GenerateContentConfig] = None
+        self._cached_config: Optional[types.GenerateContentConfig] = None
+        self._display_name: Optional[str] = None
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.uncached = 0
+        self.created = 0
+        self.reused = 0
+        self.extended = 0
+        self.failures = 0
+
+    @property
+    def display_name(self) -> Optional[str]:
+        """Name of the cached content for the current prefix; changes whenever the prefix does."""
+        return self._display_name
+
+    def set_prefix(self, config: types.GenerateContentConfig) -> None:
+        """
+        Set the configuration whose system instruction and tools are cached.
+
+        A configuration with the same prefix as the current one keeps the
+        current cached content.
+
+        Args:
+            config: The full generation config requests would use uncached
+        """
+        self._config = config
+        prefix = {
+            "model": self.model,
+            "system_instruction": config.system_instruction,
+            "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in config.tools or []],
+        }
+        serialized = json.dumps(prefix, sort_keys=True)
+        display_name = f"{CACHE_NAME_PREFIX}-{hashlib.sha256(serialized.encode()).hexdigest()[:16]}"
+        if display_name == self._display_name:
+            return
+
+        if self._display_name is not None:
+            logger.info(f"Prompt prefix changed; requests will use cached content {display_name}")
+        self._display_name = display_name
+        self._name = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._cached_config = config.model_copy(update={"system_instruction": None, "tools": None})
+
+        if self.enabled and count_tokens(serialized) < self.min_tokens:
+            logger.info(f"Prompt prefix is below {self.min_tokens} tokens; sending it uncached")
+            self._retry_at = float("inf")
+
+    async def config(self) -> types.GenerateContentConfig:
+        """
+        Get the generation config for a request.
+
+        Returns:
+            A config referring to the cached prefix, or the full config if
+            the prefix isn't cached
+        """
+        if self._expires_at > time.time() + self.ttl / 5:
+            self.hits += 1
+            return self._cached_config
+        if not self.enabled or time.time() < self._retry_at:
+            self.uncached += 1
+            return self._config
+
+        async with self._lock:
+            # Another request may have refreshed the handle while we waited
+            if self._expires_at <= time.time() + self.ttl / 5:
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    logger.warning(f"Could not cache the prompt prefix, sending it uncached: {e}")
+                    self.failures += 1
+                    self._retry_at = time.time() + self.retry_after
+                    self.uncached += 1
+                    return self._config
+
+        self.hits += 1
+        return self._cached_config
+
+    async def _refresh(self) -> None:
+        """Extend the handle, or find or create the cached content if there is none."""
+        ttl = f"{self.ttl}s"
+        cached = None
+
+        if self._name is not None:
+            try:
+                cached = await self.client.aio.caches.update(
+                    name=self._name, config=types.UpdateCachedContentConfig(ttl=ttl)
+                )
+                self.extended += 1
+            except errors.ClientError as e:
+                # Expired or deleted in the meantime
+                logger.info(f"Could not extend cached content {self._name}: {e}")
+
+        if cached is None:
+            # Another worker may have created it already
+            async for candidate in await self.client.aio.caches.list():
+                if (candidate.display_name == self._display_name and candidate.expire_time
+                        and candidate.expire_time.timestamp() > time.time() + self.ttl / 5):
+                    cached = candidate
+                    self.reused += 1
+                    break
+
+        if cached is None:
+            cached = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name=self._display_name,
+                    system_instruction=self._config.system_instruction,
+                    tools=self._config.tools,
+                    ttl=ttl,
+                ),
+            )
+            self.created += 1
+            logger.info(f"Cached the prompt prefix as {cached.name}")
+
+        self._name = cached.name
+        self._expires_at = cached.expire_time.timestamp() if cached.expire_time else time.time() + self.ttl
+        self._cached_config = self._cached_config.model_copy(update={"cached_content": cached.name})
+
+    def invalidate(self, error: Exception) -> bool:
+        """
+        Drop the handle if a request failed because its cached content is gone.
+
+        Args:
+            error: The error the request failed with
+
+        Returns:
+            True if the handle was dropped, so the request may be retried
+        """
+        if self._name is None or not isinstance(error, errors.ClientError):
+            return False
+        if error.code not in (403, 404) or "cache" not in str(error).lower():
+            return False
+
+        logger.warning(f"Cached content {self._name} is gone: {error}")
+        self._name = None
+        self._expires_at = 0.0
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the state and counters of the cache.
+
+        Returns:
+            The cached content's name and seconds until it expires, requests
+            sent with and without it, and how often it was created, found,
+            extended or failed
+        """
+        return {
+            "enabled": self.enabled,
+            "name": self._name,
+            "expires_in": max(0, round(self._expires_at - time.time())) if self._name else None,
+            "hits": self.hits,
+            "uncached": self.uncached,
+            "created": self.created,
+            "reused": self.reused,
+            "extended": self.extended,
+            "failures": self.failures,
+        }
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import (
+    RESPONSE_CACHE_MAX_CONTEXT_MESSAGES,
+    RESPONSE_CACHE_MAX_MESSAGE_CHARS,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+
+# Punctuation and symbols don't change what a short message asks
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Reduce a user message to the form it is cached under.
+
+    "Hi!", " hi " and "HI." all become "hi".
+
+    Args:
+        message: The message as the user sent it
+
+    Returns:
+        The message case-folded, without punctuation and with single spaces
+    """
+    message = unicodedata.normalize("NFKC", message).casefold()
+    message = _PUNCTUATION.sub(" ", message)
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+class _Reply:
+    """One cached reply."""
+
+    __slots__ = ("text", "expires_at")
+
+    def __init__(self, text: str, expires_at: float):
+        self.text = text
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    Bounded, expiring cache of generated replies.
+
+    A reply is keyed on the normalized user message and a hash of the
+    context window the model saw with it: the conversation summary and
+    the earlier messages of the prompt, plus the scope (model, system
+    prompt and tools). The same message in the same context gets the same
+    reply, without a round trip to the model.
+
+    Only turns that can recur across conversations are cached: short
+    messages with at most a few earlier messages in their context, which
+    in practice means opening turns. Replies that depended on tool calls
+    are never stored (see the chatbot). Entries expire a fixed time after
+    they were stored, so replies are regenerated now and then, and the
+    least recently used are dropped once the cache is full.
+
+    Used from the event loop only, so it takes no locks.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_context_messages: int = RESPONSE_CACHE_MAX_CONTEXT_MESSAGES,
+                 max_message_chars: int = RESPONSE_CACHE_MAX_MESSAGE_CHARS):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of replies kept (0 disables the cache)
+            ttl: Seconds a reply is kept after it was stored
+            max_context_messages: Turns with more earlier messages in their
+                context are not cached
+            max_message_chars: Longer messages are not cached
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_context_messages = max_context_messages
+        self.max_message_chars = max_message_chars
+
+        self._replies: "OrderedDict[str, _Reply]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, message: str, context: Dict[str, Any], scope: str) -> Optional[str]:
+        """
+        Get the key a turn's reply is cached under.
+
+        Args:
+            message: The user message
+            context: The history the prompt carries, as built by
+                ContextBuilder, ending with the user message
+            scope: Identifies everything else the reply depends on, such as
+                the model, system prompt and tools
+
+        Returns:
+            The key, or None if the turn isn't cacheable
+        """
+        normalized = normalize_message(message)
+        history = context["messages"][:-1]
+        cacheable = (
+            self.max_entries > 0
+            and normalized
+            and len(normalized) <= self.max_message_chars
+            and context["summary"] is None
+            and len(history) <= self.max_context_messages
+            # Another request may have written to the conversation since
+            and context["messages"] and context["messages"][-1]["content"] == message
+        )
+        if not cacheable:
+            self.skipped += 1
+            return None
+
+        material = json.dumps({
+            "scope": scope,
+            "message": normalized,
+            "history": [[m["role"], m["content"]] for m in history],
+        })
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """
+        Look up a cached reply.
+
+        Args:
+            key: Key from key(), or None for a turn that isn't cacheable
+
+        Returns:
+            The reply, or None if there is none
+        """
+        if key is None:
+            return None
+
+        reply = self._replies.get(key)
+        if reply is not None and reply.expires_at <= time.monotonic():
+            del self._replies[key]
+            self.expirations += 1
+            reply = None
+
+        if reply is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._replies.move_to_end(key)
+        return reply.text
+
+    def put(self, key: Optional[str], text: str) -> None:
+        """
+        Store a reply.
+
+        Args:
+            key: Key from key(); nothing is stored for None
+            text: The reply
+        """
+        if key is None or not text:
+            return
+
+        now = time.monotonic()
+        self._replies[key] = _Reply(text, now + self.ttl)
+        self._replies.move_to_end(key)
+        self.stores += 1
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired replies, then trim to the size limit, least recently used first."""
+        expired = [key for key, reply in self._replies.items() if reply.expires_at <= now]
+        for key in expired:
+            del self._replies[key]
+        self.expirations += len(expired)
+
+        while len(self._replies) > self.max_entries:
+            self._replies.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached reply."""
+        self._replies.clear()
+
+    def __len__(self) -> int:
+        return len(self._replies)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+
+        Returns:
+            Size, limits, hits, misses, turns skipped as not cacheable,
+            stores, evictions, expirations and the hit rate of cacheable turns
+        """
+        self._evict(time.monotonic())
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._replies),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
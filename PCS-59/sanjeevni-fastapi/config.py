@@ -16,6 +16,21 @@ logger = logging.getLogger("insightai")
 # Gemini API configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+# Override of the API endpoint, e.g. a proxy or a local fake server (empty uses Google's)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+# Seconds a request to the API may take, and the connection pool shared by all requests
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+GEMINI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CONNECT_TIMEOUT_SECONDS", "10"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Context caching: the system prompt and tool declarations are stored once
+# as cached content that requests refer to, instead of being resent with each
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "True").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# The API rejects smaller cached content; estimated smaller prefixes are sent as they are
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# After a failed attempt to cache, requests go uncached this long before the next one
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "600"))
 
 # FastAPI app configuration
 HOST = os.getenv("HOST", "127.0.0.1")
@@ -79,4 +94,96 @@ def get_system_prompt():
     )
 
 # Conversation settings
-MAX_CONVERSATION_HISTORY = 10
+DEFAULT_HISTORY_PAGE_SIZE = 50
+DEFAULT_CONVERSATIONS_PAGE_SIZE = 50
+DEFAULT_SEARCH_PAGE_SIZE = 20
+
+# Context window: prompts carry the newest messages that fit the token
+# budget (summary included); older messages are folded into a running
+# summary of the conversation once they no longer fit
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "500"))
+# Messages read per query while filling the budget
+CONTEXT_PAGE_SIZE = int(os.getenv("CONTEXT_PAGE_SIZE", "20"))
+# Instructions for folding older messages into the summary
+CONTEXT_SUMMARY_PROMPT = """
+You maintain the running summary of a medical checkup conversation between a patient and an assistant.
+You are given the current summary, if there is one, and the messages that follow it.
+Return an updated summary that replaces the current one. Keep every symptom with its severity, duration and
+onset, relevant history, medications, allergies, answers the patient gave and questions still open.
+Drop greetings and small talk. Write plain third-person notes, no longer than needed.
+"""
+
+# Response cache: replies to turns that recur across conversations ("hi",
+# "I have a headache" as an opening line) are reused instead of generated
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# Turns with more earlier messages in their context, or longer messages, aren't cached
+RESPONSE_CACHE_MAX_CONTEXT_MESSAGES = int(os.getenv("RESPONSE_CACHE_MAX_CONTEXT_MESSAGES", "2"))
+RESPONSE_CACHE_MAX_MESSAGE_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_MESSAGE_CHARS", "200"))
+
+# Tool calls of a turn run concurrently on this many threads, each within
+# its tool's timeout (tools may set their own)
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "8"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+
+# Database settings
+# Storage backend registered in database.registry: "sqlite" (persistent) or
+# "memory" (nothing persisted; for development and load tests)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "8"))
+DATABASE_BUSY_TIMEOUT = float(os.getenv("DATABASE_BUSY_TIMEOUT", "5.0"))
+DATABASE_SYNCHRONOUS = os.getenv("DATABASE_SYNCHRONOUS", "NORMAL")
+DATABASE_CACHE_SIZE_KB = int(os.getenv("DATABASE_CACHE_SIZE_KB", "16384"))
+DATABASE_MMAP_SIZE = int(os.getenv("DATABASE_MMAP_SIZE", str(128 * 1024 * 1024)))
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "128"))
+# Message payloads at least this large are stored zlib-compressed (0 disables)
+DATABASE_COMPRESS_MIN_BYTES = int(os.getenv("DATABASE_COMPRESS_MIN_BYTES", "512"))
+DATABASE_SHARDS = int(os.getenv("DATABASE_SHARDS", "1"))
+DATABASE_WRITE_BEHIND = os.getenv("DATABASE_WRITE_BEHIND", "False").lower() == "true"
+DATABASE_WRITE_BATCH_SIZE = int(os.getenv("DATABASE_WRITE_BATCH_SIZE", "256"))
+DATABASE_WRITE_INTERVAL_MS = float(os.getenv("DATABASE_WRITE_INTERVAL_MS", "10"))
+# Retries of a failed group commit before its rows are written one by one
+DATABASE_WRITE_RETRIES = int(os.getenv("DATABASE_WRITE_RETRIES", "3"))
+
+# Export/import settings (rows per database call while streaming NDJSON)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Conversation cache settings (CONVERSATION_CACHE_SIZE=0 disables the cache)
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "256"))
+CONVERSATION_CACHE_MAX_MESSAGES = int(os.getenv("CONVERSATION_CACHE_MAX_MESSAGES", "200"))
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "900"))
+
+# Session registry settings (conversations the API remembers between requests)
+SESSION_REGISTRY_SIZE = int(os.getenv("SESSION_REGISTRY_SIZE", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
+# Retention settings (0 disables archiving or purging)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "2000"))
+
+# Speech settings (replies are synthesized in the background and served by URL)
+AUDIO_DIR = os.getenv("AUDIO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio"))
+SPEECH_JOBS_MAX = int(os.getenv("SPEECH_JOBS_MAX", "1000"))
+SPEECH_JOB_TTL_SECONDS = float(os.getenv("SPEECH_JOB_TTL_SECONDS", "3600"))
+# Longest an audio request waits for synthesis before answering 202
+SPEECH_WAIT_SECONDS = float(os.getenv("SPEECH_WAIT_SECONDS", "30"))
+# How often a worker checks AUDIO_DIR for speech another worker is synthesizing
+SPEECH_POLL_SECONDS = float(os.getenv("SPEECH_POLL_SECONDS", "0.5"))
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", "86400"))
+# Disk quota of the synthesized speech cache in AUDIO_DIR (0 disables eviction)
+AUDIO_CACHE_MAX_MB = float(os.getenv("AUDIO_CACHE_MAX_MB", "512"))
+# Temporary files older than this are left by abandoned syntheses and deleted
+AUDIO_PARTIAL_MAX_AGE_SECONDS = float(os.getenv("AUDIO_PARTIAL_MAX_AGE_SECONDS", "600"))
+# TTS workers: threads for network engines (gTTS), processes for local ones
+# (pyttsx3; 0 runs them on the threads instead)
+SPEECH_THREADS = int(os.getenv("SPEECH_THREADS", "8"))
+SPEECH_PROCESSES = int(os.getenv("SPEECH_PROCESSES", "2"))
+SPEECH_TIMEOUT_SECONDS = float(os.getenv("SPEECH_TIMEOUT_SECONDS", "30"))
+# Replies are spoken sentence by sentence; longer sentences are split further
+SPEECH_SEGMENT_MAX_CHARS = int(os.getenv("SPEECH_SEGMENT_MAX_CHARS", "300"))
@@ -0,0 +1,29 @@
+from database.pool import ConnectionPool
+from database.archive import ArchiveStore
+from database.sqlite import SQLiteDatabase, DriveThruDatabase
+from database.async_database import AsyncDatabase
+from database.cache import CachedDatabase
+from database.sharded import ShardedDatabase
+from database.migrations import migrate, get_schema_version
+from database.write_behind import WriteBehindQueue
+from database.backend import StorageBackend
+from database.memory import MemoryDatabase
+from database.registry import StorageRegistry, storage_registry
+
+# Export the database classes
+__all__ = [
+    'ConnectionPool',
+    'ArchiveStore',
+    'SQLiteDatabase',
+    'DriveThruDatabase',
+    'AsyncDatabase',
+    'CachedDatabase',
+    'ShardedDatabase',
+    'migrate',
+    'get_schema_version',
+    'WriteBehindQueue',
+    'StorageBackend',
+    'MemoryDatabase',
+    'StorageRegistry',
+    'storage_registry',
+]
@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Set, Tuple
+
+from config import logger
+
+
+class ArchiveStore:
+    """
+    Append-only, compressed storage for cold conversations.
+
+    Each archived conversation is written as its own gzip member at the end
+    of the current month's file, so a single conversation can be read back
+    from its (file, offset, length) without decompressing anything else.
+    The concatenated members also form a valid .jsonl.gz file for zcat.
+
+    Files are named <prefix>-<YYYYMM>.jsonl.gz. Stores that share a
+    directory must use different prefixes: each one only ever deletes
+    files with its own.
+    """
+
+    def __init__(self, directory: str, prefix: str = "archive"):
+        """
+        Initialize the archive store.
+
+        Args:
+            directory: Directory that holds the archive files
+            prefix: Start of the names of this store's files
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self._pattern = re.compile(re.escape(prefix) + r"-\d{6}\.jsonl\.gz")
+        self._lock = threading.Lock()
+
+    def _current_filename(self) -> str:
+        """Name of the file new records are appended to."""
+        return f"{self.prefix}-{datetime.now():%Y%m}.jsonl.gz"
+
+    def append(self, record: Dict[str, Any]) -> Tuple[str, int, int]:
+        """
+        Append a record and make it durable.
+
+        Args:
+            record: JSON-serializable conversation record
+
+        Returns:
+            The file name, byte offset and byte length of the stored record
+        """
+        data = gzip.compress((json.dumps(record) + "\n").encode())
+        filename = self._current_filename()
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, filename), "ab") as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        return filename, offset, len(data)
+
+    def read(self, filename: str, offset: int, length: int) -> Dict[str, Any]:
+        """
+        Read one record back.
+
+        Args:
+            filename: File name returned by append
+            offset: Byte offset returned by append
+            length: Byte length returned by append
+
+        Returns:
+            The stored record
+        """
+        with open(os.path.join(self.directory, filename), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        return json.loads(gzip.decompress(data))
+
+    def remove_unreferenced(self, referenced: Set[str]) -> List[str]:
+        """
+        Delete this store's archive files that no archived conversation points to.
+
+        The current month's file is kept because it may still be appended to,
+        and files of other stores in the same directory are never touched.
+
+        Args:
+            referenced: File names still referenced by the archive index
+
+        Returns:
+            The names of the deleted files
+        """
+        if not os.path.isdir(self.directory):
+            return []
+
+        current = self._current_filename()
+        removed = []
+        with self._lock:
+            for filename in os.listdir(self.directory):
+                if not self._pattern.fullmatch(filename) or filename == current:
+                    continue
+                if filename not in referenced:
+                    os.remove(os.path.join(self.directory, filename))
+                    removed.append(filename)
+
+        if removed:
+            logger.info(f"Removed {len(removed)} expired archive files")
+        return removed
+
+
+def main(argv: List[str]) -> int:
+    """
+    Run one retention pass over a database file from the command line.
+
+    Usage: python -m database.archive [db_path] [--vacuum]
+
+    --vacuum converts a database created before incremental vacuum was
+    enabled. This rewrites the whole file and blocks writers while it runs.
+    """
+    from database.sqlite import SQLiteDatabase
+
+    args = [arg for arg in argv[1:] if not arg.startswith("--")]
+    db_path = args[0] if args else "conversations.db"
+
+    database = SQLiteDatabase(db_path)
+    try:
+        result = database.run_retention(full_vacuum="--vacuum" in argv)
+        print(json.dumps(result, indent=2))
+    finally:
+        database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
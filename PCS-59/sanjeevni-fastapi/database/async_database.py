@@ -0,0 +1,300 @@
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Any, Callable, Optional, Set, Tuple
+
+from config import DATABASE_POOL_SIZE, EXPORT_BATCH_SIZE, logger
+from database.backend import StorageBackend
+
+
+class AsyncDatabase:
+    """
+    Non-blocking wrapper around any StorageBackend.
+
+    Every call is queued to a small set of dedicated database threads, so
+    sqlite I/O never runs on the event loop. The worker count defaults to the
+    connection pool size, which lets each worker keep its own connection.
+    Backends that never block (``blocking = False``) are called inline.
+    """
+
+    def __init__(self, database: StorageBackend, max_workers: Optional[int] = None):
+        """
+        Initialize the async database.
+
+        Args:
+            database: The synchronous database to delegate to
+            max_workers: Number of database threads (default: the pool size)
+        """
+        self.database = database
+        self._inline = not getattr(database, "blocking", True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or DATABASE_POOL_SIZE,
+            thread_name_prefix="database",
+        )
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a database call on a database thread, or inline if the backend never blocks.
+
+        Args:
+            func: The synchronous database method
+            *args: Positional arguments for the method
+            **kwargs: Keyword arguments for the method
+
+        Returns:
+            The method's return value
+        """
+        if self._inline:
+            # A thread hop costs far more than the call itself
+            return func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """
+        Create a new conversation.
+
+        Args:
+            conversation_id: Optional ID for the conversation
+
+        Returns:
+            The conversation ID
+        """
+        return await self._run(self.database.create_conversation, conversation_id)
+
+    async def conversation_exists(self, conversation_id: str) -> bool:
+        """
+        Check if a conversation exists in the database.
+
+        Args:
+            conversation_id: ID of the conversation to check
+
+        Returns:
+            True if the conversation exists, False otherwise
+        """
+        return await self._run(self.database.conversation_exists, conversation_id)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of one conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation summary, or None if it doesn't exist
+        """
+        return await self._run(self.database.get_conversation_info, conversation_id)
+
+    async def add_message(self, conversation_id: str, role: str, content: str,
+                          tool_calls: Optional[List[Dict[str, Any]]] = None,
+                          tool_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Add a message to a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender (user or assistant)
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+
+        Returns:
+            The stored message
+        """
+        return await self._run(
+            self.database.add_message, conversation_id, role, content,
+            tool_calls=tool_calls, tool_results=tool_results,
+        )
+
+    async def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """
+        Get a conversation by ID.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            List of messages in the conversation
+        """
+        return await self._run(self.database.get_conversation, conversation_id)
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages to return
+
+        Returns:
+            Up to ``limit`` messages, oldest first
+        """
+        return await self._run(self.database.get_recent_messages, conversation_id, limit)
+
+    async def get_messages_page(self, conversation_id: str, limit: int,
+                                before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a conversation's history, newest page first.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The messages of the page and the cursor for the next, older page
+        """
+        return await self._run(self.database.get_messages_page, conversation_id, limit, before)
+
+    async def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the running summary of a conversation's older messages.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The summary, or None if there is none
+        """
+        return await self._run(self.database.get_summary, conversation_id)
+
+    async def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """
+        Store the running summary of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            text: The summary
+            through: ID of the newest message the summary covers
+            tokens: Prompt size of the summary
+
+        Returns:
+            True if the summary was stored, False if the conversation doesn't exist
+        """
+        return await self._run(self.database.set_summary, conversation_id, text, through, tokens)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """
+        Delete a conversation and all its messages.
+
+        Args:
+            conversation_id: ID of the conversation to delete
+
+        Returns:
+            True if the conversation was deleted, False if it wasn't found
+        """
+        return await self._run(self.database.delete_conversation, conversation_id)
+
+    async def get_all_conversations(self, limit: Optional[int] = None,
+                                    offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations, most recently active first.
+
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return await self._run(self.database.get_all_conversations, limit, offset)
+
+    async def get_conversations_page(self, limit: int,
+                                     after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list, most recently active first.
+
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page
+
+        Returns:
+            The conversations of the page and the cursor for the next page
+        """
+        return await self._run(self.database.get_conversations_page, limit, after)
+
+    async def search_messages(self, query: str, limit: int,
+                              before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search message content by keywords, newest matches first.
+
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The matching messages of the page and the cursor for the next page
+        """
+        return await self._run(self.database.search_messages, query, limit, before)
+
+    async def export_conversations(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream every conversation as export records.
+
+        Records are pulled from the database in batches on the executor, so
+        the event loop never waits on SQLite.
+
+        Yields:
+            Export records
+        """
+        records = self.database.export_conversations()
+
+        def next_batch() -> List[Dict[str, Any]]:
+            return list(itertools.islice(records, EXPORT_BATCH_SIZE))
+
+        while True:
+            batch = await self._run(next_batch)
+            if not batch:
+                return
+            for record in batch:
+                yield record
+
+    async def import_records(self, records: Iterable[Dict[str, Any]],
+                             skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records in a single transaction.
+
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+        """
+        return await self._run(self.database.import_records, records, skipped)
+
+    async def run_retention(self) -> Dict[str, Any]:
+        """
+        Run one pass of archiving, purging and compaction.
+
+        Returns:
+            The archived and purged conversation IDs and the pages released
+        """
+        return await self._run(self.database.run_retention)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the database layer.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        return self.database.get_metrics()
+
+    async def flush(self) -> None:
+        """Wait until every queued message has been written."""
+        await self._run(self.database.flush)
+
+    async def close(self) -> None:
+        """Wait for queued calls to finish, then close the database."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        # Closing flushes queued writes and joins the writer thread
+        await loop.run_in_executor(None, self.database.close)
+        logger.info("Closed async database")
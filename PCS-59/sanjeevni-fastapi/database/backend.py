@@ -0,0 +1,117 @@
+import copy
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Protocol, Set, Tuple, runtime_checkable
+
+
+def copy_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a message held in memory for a caller.
+
+    Callers get their own copies, as they do from the SQLite backend, so
+    they can't change what a backend or cache holds.
+    """
+    message = dict(message)
+    for key in ("tool_calls", "tool_results"):
+        if key in message:
+            message[key] = copy.deepcopy(message[key])
+    return message
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """
+    Synchronous conversation storage interface.
+
+    SQLiteDatabase, ShardedDatabase, CachedDatabase and MemoryDatabase all
+    implement it, and AsyncDatabase wraps any implementation for the event
+    loop. A backend sets ``blocking = False`` when its calls never wait on
+    I/O, so AsyncDatabase can run them inline instead of on a thread.
+    """
+
+    blocking: bool
+
+    def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """Create a new conversation and return its ID."""
+        ...
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """Check if a conversation exists."""
+        ...
+
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get a conversation's creation time, message count and last activity, or None."""
+        ...
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    tool_calls: Optional[List[Dict[str, Any]]] = None,
+                    tool_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Add a message to a conversation and return the stored message."""
+        ...
+
+    def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get the full history of a conversation, oldest first."""
+        ...
+
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Get the most recent messages of a conversation, oldest first."""
+        ...
+
+    def get_messages_page(self, conversation_id: str, limit: int,
+                          before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of a conversation's history and the cursor for the next, older page."""
+        ...
+
+    def history_cursor(self, conversation_id: str, message: Dict[str, Any]) -> str:
+        """Get the get_messages_page cursor for the history older than a message."""
+        ...
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get the running summary of a conversation's older messages, or None."""
+        ...
+
+    def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """Store a conversation's running summary; return False if it wasn't found."""
+        ...
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete a conversation; return False if it wasn't found."""
+        ...
+
+    def get_all_conversations(self, limit: Optional[int] = None,
+                              offset: int = 0) -> List[Dict[str, Any]]:
+        """List conversations, most recently active first."""
+        ...
+
+    def get_conversations_page(self, limit: int,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of the conversation list and the cursor for the next page."""
+        ...
+
+    def search_messages(self, query: str, limit: int,
+                        before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Search message content by keywords, newest matches first."""
+        ...
+
+    def export_conversations(self) -> Iterator[Dict[str, Any]]:
+        """Stream every conversation as export records."""
+        ...
+
+    def import_records(self, records: Iterable[Dict[str, Any]],
+                       skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """Import a batch of export records."""
+        ...
+
+    def run_retention(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """Run one pass of archiving, purging and compaction."""
+        ...
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get runtime metrics grouped by component."""
+        ...
+
+    def flush(self) -> None:
+        """Block until every accepted write is stored."""
+        ...
+
+    def close(self) -> None:
+        """Release the backend's resources."""
+        ...
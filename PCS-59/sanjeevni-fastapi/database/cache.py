@@ -0,0 +1,556 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+from config import (
+    CONVERSATION_CACHE_SIZE,
+    CONVERSATION_CACHE_MAX_MESSAGES,
+    CONVERSATION_CACHE_TTL,
+    logger,
+)
+from database.backend import StorageBackend, copy_message
+
+
+# Marks a cache entry whose summary or info hasn't been read yet (None means there is none)
+_UNLOADED: Any = object()
+
+
+class _CacheEntry:
+    """Decoded messages of one conversation, oldest first, its summary and its listing info."""
+
+    __slots__ = ("messages", "complete", "summary", "info", "expires_at")
+
+    def __init__(self, messages: List[Dict[str, Any]], complete: bool, expires_at: float):
+        self.messages = messages
+        # True when messages is the whole conversation, False when older messages exist
+        self.complete = complete
+        self.summary: Optional[Dict[str, Any]] = _UNLOADED
+        # Creation time, message count and last activity, kept current by add_message
+        self.info: Optional[Dict[str, Any]] = _UNLOADED
+        self.expires_at = expires_at
+
+
+class CachedDatabase:
+    """
+    Write-through LRU cache of conversation histories in front of a StorageBackend.
+
+    Messages are copied in and out, so callers can't change what is cached.
+
+    An entry holds either the full history or its most recent tail, and
+    the conversation's running summary and listing info once they have
+    been read. New messages and summaries are written through to the
+    cached entry, so an active conversation is served from memory on
+    every read, including polls of its newest history page. Entries are evicted
+    by LRU order, by age and by message count.
+    """
+
+    @property
+    def blocking(self) -> bool:
+        """Whether calls can wait on I/O; the cache's own lock is only held briefly."""
+        return getattr(self.database, "blocking", True)
+
+    def __init__(self, database: StorageBackend, max_conversations: int = CONVERSATION_CACHE_SIZE,
+                 max_messages: int = CONVERSATION_CACHE_MAX_MESSAGES,
+                 ttl: float = CONVERSATION_CACHE_TTL):
+        """
+        Initialize the cache.
+
+        Args:
+            database: The database to cache
+            max_conversations: Maximum number of cached conversations
+            max_messages: Maximum number of messages kept per conversation
+            ttl: Seconds an entry stays valid after it was loaded
+        """
+        self.database = database
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        # Conversations being loaded; a write replaces the token so a load
+        # that raced with it is not stored
+        self._loading: Dict[str, object] = {}
+        # The same for summaries and conversation info being loaded
+        self._summary_loading: Dict[str, object] = {}
+        self._info_loading: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get_entry(self, conversation_id: str) -> Optional[_CacheEntry]:
+        """Look up a live entry and mark it as recently used."""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            del self._entries[conversation_id]
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def _begin_load(self, conversation_id: str) -> object:
+        """Register a database load and return its token."""
+        token = object()
+        with self._lock:
+            self._loading[conversation_id] = token
+        return token
+
+    def _store(self, conversation_id: str, token: object,
+               messages: List[Dict[str, Any]], complete: bool) -> None:
+        """Store a loaded history unless a write happened while it was loading."""
+        with self._lock:
+            if self._loading.get(conversation_id) is not token:
+                return
+            del self._loading[conversation_id]
+
+            if len(messages) > self.max_messages:
+                messages = messages[-self.max_messages:]
+                complete = False
+
+            previous = self._entries.get(conversation_id)
+            entry = _CacheEntry([copy_message(m) for m in messages], complete, time.monotonic() + self.ttl)
+            if previous is not None:
+                entry.summary = previous.summary
+                entry.info = previous.info
+            self._entries[conversation_id] = entry
+            self._entries.move_to_end(conversation_id)
+
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _invalidate(self, conversation_id: str) -> None:
+        """Drop a conversation from the cache and cancel its pending loads."""
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+            self._loading.pop(conversation_id, None)
+            self._summary_loading.pop(conversation_id, None)
+            self._info_loading.pop(conversation_id, None)
+
+    def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """
+        Create a new conversation.
+
+        Args:
+            conversation_id: Optional ID for the conversation
+
+        Returns:
+            The conversation ID
+        """
+        conversation_id = self.database.create_conversation(conversation_id)
+        token = self._begin_load(conversation_id)
+        self._store(conversation_id, token, [], complete=True)
+        return conversation_id
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """
+        Check if a conversation exists.
+
+        Args:
+            conversation_id: ID of the conversation to check
+
+        Returns:
+            True if the conversation exists, False otherwise
+        """
+        with self._lock:
+            if self._get_entry(conversation_id) is not None:
+                self.hits += 1
+                return True
+        return self.database.conversation_exists(conversation_id)
+
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of one conversation.
+
+        Read from the database once per cached conversation; add_message
+        keeps the count and last activity current afterwards.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation summary, or None if it doesn't exist
+        """
+        with self._lock:
+            entry = self._get_entry(conversation_id)
+            if entry is not None and entry.info is not _UNLOADED:
+                self.hits += 1
+                return dict(entry.info)
+            self.misses += 1
+            token = object()
+            self._info_loading[conversation_id] = token
+
+        info = self.database.get_conversation_info(conversation_id)
+
+        with self._lock:
+            # Only keep it if no message was added while it loaded
+            if self._info_loading.get(conversation_id) is token:
+                del self._info_loading[conversation_id]
+                entry = self._entries.get(conversation_id)
+                if entry is not None and info is not None:
+                    entry.info = dict(info)
+        return info
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    tool_calls: Optional[List[Dict[str, Any]]] = None,
+                    tool_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Add a message to a conversation and append it to the cached history.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender (user or assistant)
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+
+        Returns:
+            The stored message
+        """
+        message = self.database.add_message(
+            conversation_id, role, content, tool_calls=tool_calls, tool_results=tool_results
+        )
+
+        with self._lock:
+            # Any load that started before this write is now stale
+            self._loading.pop(conversation_id, None)
+            self._info_loading.pop(conversation_id, None)
+
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                entry.messages.append(copy_message(message))
+                if entry.info is not _UNLOADED:
+                    entry.info["message_count"] += 1
+                    entry.info["last_activity"] = max(entry.info["last_activity"], message["timestamp"])
+                if len(entry.messages) > self.max_messages:
+                    del entry.messages[:-self.max_messages]
+                    entry.complete = False
+
+        return message
+
+    def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the full history of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            List of messages in the conversation
+        """
+        with self._lock:
+            entry = self._get_entry(conversation_id)
+            if entry is not None and entry.complete:
+                self.hits += 1
+                return [copy_message(m) for m in entry.messages]
+            self.misses += 1
+
+        token = self._begin_load(conversation_id)
+        messages = self.database.get_conversation(conversation_id)
+        if messages or self.database.conversation_exists(conversation_id):
+            self._store(conversation_id, token, messages, complete=True)
+        return messages
+
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages to return
+
+        Returns:
+            Up to ``limit`` messages, oldest first
+        """
+        with self._lock:
+            entry = self._get_entry(conversation_id)
+            if entry is not None and (entry.complete or len(entry.messages) >= limit):
+                self.hits += 1
+                return [copy_message(m) for m in entry.messages[-limit:]] if limit else []
+            self.misses += 1
+
+        token = self._begin_load(conversation_id)
+        # One extra message tells us whether we have the whole conversation
+        messages = self.database.get_recent_messages(conversation_id, limit + 1)
+        if messages:
+            self._store(conversation_id, token, messages, complete=len(messages) <= limit)
+        return messages[-limit:] if limit else []
+
+    def get_messages_page(self, conversation_id: str, limit: int,
+                          before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a conversation's history, newest page first.
+
+        The newest page is served from the cached entry when it holds the
+        whole conversation or at least ``limit`` messages. Older pages are rarely re-read, so
+        they bypass the cache.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The messages of the page and the cursor for the next, older page
+
+        Raises:
+            ValueError: If the limit or cursor is invalid
+        """
+        if before is not None:
+            return self.database.get_messages_page(conversation_id, limit, before)
+        if limit < 1:
+            raise ValueError("Page limit must be at least 1")
+
+        with self._lock:
+            entry = self._get_entry(conversation_id)
+            if entry is not None and (entry.complete or len(entry.messages) >= limit):
+                self.hits += 1
+                page = [copy_message(m) for m in entry.messages[-limit:]]
+                has_more = len(entry.messages) > limit or not entry.complete
+            else:
+                self.misses += 1
+                page = None
+
+        if page is not None:
+            next_cursor = self.database.history_cursor(conversation_id, page[0]) if has_more else None
+            return page, next_cursor
+
+        token = self._begin_load(conversation_id)
+        messages, next_cursor = self.database.get_messages_page(conversation_id, limit)
+        if messages:
+            self._store(conversation_id, token, messages, complete=next_cursor is None)
+        return messages, next_cursor
+
+    def history_cursor(self, conversation_id: str, message: Dict[str, Any]) -> str:
+        """
+        Get the cursor for the history page older than a message.
+
+        Args:
+            conversation_id: ID of the conversation
+            message: A message returned by this database
+
+        Returns:
+            A cursor for get_messages_page
+        """
+        return self.database.history_cursor(conversation_id, message)
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the running summary of a conversation's older messages.
+
+        Read from the database once per cached conversation; set_summary
+        keeps it current afterwards.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The summary, or None if there is none
+        """
+        with self._lock:
+            entry = self._get_entry(conversation_id)
+            if entry is not None and entry.summary is not _UNLOADED:
+                self.hits += 1
+                return dict(entry.summary) if entry.summary else None
+            self.misses += 1
+            token = object()
+            self._summary_loading[conversation_id] = token
+
+        summary = self.database.get_summary(conversation_id)
+
+        with self._lock:
+            # Only keep it if no summary was written while it loaded
+            if self._summary_loading.get(conversation_id) is token:
+                del self._summary_loading[conversation_id]
+                entry = self._entries.get(conversation_id)
+                if entry is not None:
+                    entry.summary = dict(summary) if summary else None
+        return summary
+
+    def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """
+        Store the running summary of a conversation and update the cached entry.
+
+        Args:
+            conversation_id: ID of the conversation
+            text: The summary
+            through: ID of the newest message the summary covers
+            tokens: Prompt size of the summary
+
+        Returns:
+            True if the summary was stored, False if the conversation doesn't exist
+        """
+        stored = self.database.set_summary(conversation_id, text, through, tokens)
+
+        with self._lock:
+            self._summary_loading.pop(conversation_id, None)
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                entry.summary = {"text": text, "through": through, "tokens": tokens} if stored else _UNLOADED
+        return stored
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """
+        Delete a conversation and drop it from the cache.
+
+        Args:
+            conversation_id: ID of the conversation to delete
+
+        Returns:
+            True if the conversation was deleted, False if it wasn't found
+        """
+        self._invalidate(conversation_id)
+        deleted = self.database.delete_conversation(conversation_id)
+        self._invalidate(conversation_id)
+        return deleted
+
+    def get_all_conversations(self, limit: Optional[int] = None,
+                              offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations, most recently active first.
+
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return self.database.get_all_conversations(limit, offset)
+
+    def get_conversations_page(self, limit: int,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list, most recently active first.
+
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page
+
+        Returns:
+            The conversations of the page and the cursor for the next page
+        """
+        return self.database.get_conversations_page(limit, after)
+
+    def get_conversations(self) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations.
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return self.get_all_conversations()
+
+    def search_messages(self, query: str, limit: int,
+                        before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search message content by keywords, newest matches first.
+
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The matching messages of the page and the cursor for the next page
+        """
+        return self.database.search_messages(query, limit, before)
+
+    def export_conversations(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream every conversation as export records, bypassing the cache.
+
+        Yields:
+            Export records
+        """
+        return self.database.export_conversations()
+
+    def import_records(self, records: Iterable[Dict[str, Any]],
+                       skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records and drop the affected conversations from the cache.
+
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+        """
+        records = list(records)
+        try:
+            return self.database.import_records(records, skipped)
+        finally:
+            for record in records:
+                if isinstance(record, dict):
+                    self._invalidate(record.get("conversation_id") or record.get("id"))
+
+    def run_retention(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """
+        Run one retention pass and drop archived or purged conversations from the cache.
+
+        Args:
+            full_vacuum: Convert the database to incremental vacuum if needed
+
+        Returns:
+            The archived and purged conversation IDs and the pages released
+        """
+        result = self.database.run_retention(full_vacuum)
+        for conversation_id in result["archived"] + result["purged"]:
+            self._invalidate(conversation_id)
+        return result
+
+    def clear(self) -> None:
+        """Drop every cached conversation."""
+        with self._lock:
+            self._entries.clear()
+            self._loading.clear()
+            self._summary_loading.clear()
+            self._info_loading.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Hit, miss, eviction and expiration counts and the current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_conversations": self.max_conversations,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the database layer, including the cache.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        metrics = self.database.get_metrics()
+        metrics["conversation_cache"] = self.stats()
+        return metrics
+
+    def flush(self) -> None:
+        """Block until every queued message has been written."""
+        self.database.flush()
+
+    def close(self) -> None:
+        """Drop the cache and close the underlying database."""
+        self.clear()
+        self.database.close()
+        logger.info(f"Closed conversation cache {self.stats()}")
@@ -0,0 +1,124 @@
+import sqlite3
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+
+from config import DATABASE_COMPRESS_MIN_BYTES
+
+# Storage format v2 codecs. Every decoder also accepts the plain value, so
+# the same message conversion works for stored rows and freshly built ones.
+
+ROLE_CODES = {
+    "user": 1,
+    "assistant": 2,
+    "system": 3,
+    "tool": 4,
+}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_role(role: str) -> int:
+    """
+    Get the stored code of a message role.
+
+    Raises:
+        ValueError: If the role has no code
+    """
+    try:
+        return ROLE_CODES[role]
+    except KeyError:
+        raise ValueError(f"Unknown message role: {role}") from None
+
+
+def decode_role(value: Union[int, str]) -> str:
+    """Get the role name of a stored role code."""
+    return ROLE_NAMES[value] if isinstance(value, int) else value
+
+
+def encode_timestamp(timestamp: str) -> int:
+    """
+    Convert an ISO timestamp to microseconds since the Unix epoch.
+
+    Naive timestamps are stored as they read, so decoding gives back the
+    exact original string; aware ones are normalized to UTC first.
+    """
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def decode_timestamp(value: Union[int, str]) -> str:
+    """Convert a stored epoch timestamp back to an ISO timestamp."""
+    if isinstance(value, int):
+        return (_EPOCH + value * _MICROSECOND).isoformat()
+    return value
+
+
+def encode_id(message_id: str) -> Union[bytes, str]:
+    """Store a UUID as its 16 raw bytes; any other ID is kept as text."""
+    try:
+        parsed = uuid.UUID(message_id)
+    except ValueError:
+        return message_id
+    # Only take the compact form if it decodes to the same string
+    return parsed.bytes if str(parsed) == message_id else message_id
+
+
+def decode_id(value: Union[bytes, str]) -> str:
+    """Convert a stored message ID back to its string form."""
+    if isinstance(value, bytes):
+        # Same output as str(uuid.UUID(bytes=value)), several times faster
+        h = value.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+    return value
+
+
+def encode_payload(text: Optional[str],
+                   min_bytes: int = DATABASE_COMPRESS_MIN_BYTES) -> Union[bytes, str, None]:
+    """
+    Compress a text payload if it is large enough to benefit.
+
+    Compressed payloads are stored as BLOBs and plain ones as TEXT, so the
+    column type tells them apart.
+
+    Args:
+        text: Message content or serialized tool payload
+        min_bytes: Smallest payload to compress (0 disables compression)
+
+    Returns:
+        The value to store
+    """
+    if text is None or not min_bytes:
+        return text
+
+    data = text.encode()
+    if len(data) < min_bytes:
+        return text
+
+    compressed = zlib.compress(data)
+    return compressed if len(compressed) < len(data) else text
+
+
+def decode_payload(value: Union[bytes, str, None]) -> Optional[str]:
+    """Get the text of a stored payload."""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """
+    Register the SQL functions the migrations use.
+
+    inflate() gives the text of a stored payload. The schema itself doesn't
+    depend on it, so plain sqlite3 clients can read and write the database.
+
+    Args:
+        conn: Connection to register the functions on
+    """
+    conn.create_function("inflate", 1, decode_payload, deterministic=True)
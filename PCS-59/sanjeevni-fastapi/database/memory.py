@@ -0,0 +1,485 @@
+import copy
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+from config import RETENTION_DAYS, logger
+from database.backend import copy_message
+from database.encoding import encode_role
+from database.sqlite import SQLiteDatabase
+from tokens import count_tokens
+
+
+class _Conversation:
+    """One stored conversation."""
+
+    __slots__ = ("id", "created_at", "last_activity", "messages", "summary")
+
+    def __init__(self, conversation_id: str, created_at: str):
+        self.id = conversation_id
+        self.created_at = created_at
+        self.last_activity = created_at
+        # Append-only; list.append is atomic, so readers never see a partial write
+        self.messages: List[Dict[str, Any]] = []
+        self.summary: Optional[Dict[str, Any]] = None
+
+
+class MemoryDatabase:
+    """
+    Conversation storage held entirely in process memory.
+
+    Meant for load tests and development, where storage should cost nothing:
+    nothing is persisted and nothing survives a restart. No locks are
+    taken; every mutation is a single dict or list operation, which CPython
+    performs atomically, so concurrent callers cannot corrupt the store.
+    """
+
+    # Calls never wait on I/O, so AsyncDatabase runs them inline
+    blocking = False
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Initialize an empty store.
+
+        Args:
+            db_path: Ignored; accepted so all backends share one constructor signature
+        """
+        self._conversations: Dict[str, _Conversation] = {}
+
+    def _get_or_create(self, conversation_id: str, created_at: str) -> _Conversation:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            conversation = self._conversations.setdefault(
+                conversation_id, _Conversation(conversation_id, created_at)
+            )
+        return conversation
+
+    def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """
+        Create a new conversation.
+
+        Args:
+            conversation_id: Optional ID for the conversation
+
+        Returns:
+            The conversation ID
+        """
+        if conversation_id is None:
+            conversation_id = str(uuid.uuid4())
+        self._get_or_create(conversation_id, datetime.now().isoformat())
+        return conversation_id
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """
+        Check if a conversation exists.
+
+        Args:
+            conversation_id: ID of the conversation to check
+
+        Returns:
+            True if the conversation exists, False otherwise
+        """
+        return conversation_id in self._conversations
+
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of one conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation summary, or None if it doesn't exist
+        """
+        conversation = self._conversations.get(conversation_id)
+        return self._summary(conversation) if conversation else None
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    tool_calls: Optional[List[Dict[str, Any]]] = None,
+                    tool_results: Optional[List[Dict[str, Any]]] = None,
+                    message_id: Optional[str] = None,
+                    timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Add a message to a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender (user or assistant)
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+            message_id: ID to keep when importing an existing message
+            timestamp: Timestamp to keep when importing an existing message
+
+        Returns:
+            The stored message
+
+        Raises:
+            ValueError: If the role is not a known message role
+        """
+        # Same validation as the SQLite backend, so tests behave alike
+        encode_role(role)
+
+        message = {
+            "id": message_id or str(uuid.uuid4()),
+            "role": role,
+            "content": content,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "tokens": count_tokens(content),
+        }
+        if tool_calls:
+            message["tool_calls"] = copy.deepcopy(tool_calls)
+        if tool_results:
+            message["tool_results"] = copy.deepcopy(tool_results)
+
+        conversation = self._get_or_create(conversation_id, message["timestamp"])
+        conversation.messages.append(message)
+        conversation.last_activity = max(conversation.last_activity, message["timestamp"])
+        return copy_message(message)
+
+    def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the full history of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            List of messages in the conversation
+        """
+        conversation = self._conversations.get(conversation_id)
+        return [copy_message(message) for message in conversation.messages] if conversation else []
+
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages to return
+
+        Returns:
+            Up to ``limit`` messages, oldest first
+        """
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or limit <= 0:
+            return []
+        return [copy_message(message) for message in conversation.messages[-limit:]]
+
+    def get_messages_page(self, conversation_id: str, limit: int,
+                          before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a conversation's history, newest page first.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The messages of the page and the cursor for the next, older page
+        """
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return [], None
+
+        # Positions are stable because messages are only ever appended
+        end = len(conversation.messages)
+        if before is not None:
+            _, key = SQLiteDatabase._decode_cursor(before, key_type=SQLiteDatabase._message_key)
+            if isinstance(key, str):
+                # Cursors from history_cursor name the oldest message already seen
+                end = next((index for index in range(end - 1, -1, -1)
+                            if conversation.messages[index]["id"] == key), 0)
+            else:
+                end = key
+        start = max(0, end - limit)
+        page = [copy_message(message) for message in conversation.messages[start:end]]
+
+        next_cursor = None
+        if start > 0:
+            next_cursor = SQLiteDatabase._encode_cursor(page[0]["timestamp"], start)
+        return page, next_cursor
+
+    def history_cursor(self, conversation_id: str, message: Dict[str, Any]) -> str:
+        """
+        Get the cursor for the history page older than a message.
+
+        Args:
+            conversation_id: ID of the conversation
+            message: A message returned by this database
+
+        Returns:
+            A cursor for get_messages_page
+        """
+        return SQLiteDatabase._encode_cursor(message["timestamp"], message["id"])
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the running summary of a conversation's older messages.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The summary, or None if there is none
+        """
+        conversation = self._conversations.get(conversation_id)
+        return dict(conversation.summary) if conversation and conversation.summary else None
+
+    def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """
+        Store the running summary of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            text: The summary
+            through: ID of the newest message the summary covers
+            tokens: Prompt size of the summary
+
+        Returns:
+            True if the summary was stored, False if the conversation doesn't exist
+        """
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return False
+        # Replaced in one assignment, so readers see the old summary or the new one
+        conversation.summary = {"text": text, "through": through, "tokens": tokens}
+        return True
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """
+        Delete a conversation and all its messages.
+
+        Args:
+            conversation_id: ID of the conversation to delete
+
+        Returns:
+            True if the conversation was deleted, False if it wasn't found
+        """
+        return self._conversations.pop(conversation_id, None) is not None
+
+    def _by_activity(self) -> List[_Conversation]:
+        """All conversations, most recently active first."""
+        return sorted(
+            list(self._conversations.values()),
+            key=lambda c: (c.last_activity, c.id),
+            reverse=True,
+        )
+
+    @staticmethod
+    def _summary(conversation: _Conversation) -> Dict[str, Any]:
+        return {
+            "id": conversation.id,
+            "created_at": conversation.created_at,
+            "message_count": len(conversation.messages),
+            "last_activity": conversation.last_activity,
+        }
+
+    def get_all_conversations(self, limit: Optional[int] = None,
+                              offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations, most recently active first.
+
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        conversations = self._by_activity()[offset:]
+        if limit is not None:
+            conversations = conversations[:limit]
+        return [self._summary(c) for c in conversations]
+
+    def get_conversations_page(self, limit: int,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list, most recently active first.
+
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page
+
+        Returns:
+            The conversations of the page and the cursor for the next page
+        """
+        conversations = self._by_activity()
+        if after is not None:
+            key = SQLiteDatabase._decode_cursor(after, key_type=str)
+            conversations = [c for c in conversations if (c.last_activity, c.id) < key]
+
+        page = [self._summary(c) for c in conversations[:limit]]
+        next_cursor = None
+        if len(conversations) > limit:
+            next_cursor = SQLiteDatabase._encode_cursor(page[-1]["last_activity"], page[-1]["id"])
+        return page, next_cursor
+
+    def get_conversations(self) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations.
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return self.get_all_conversations()
+
+    def search_messages(self, query: str, limit: int,
+                        before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search message content by keywords, newest matches first.
+
+        A linear scan with the same query rules as the SQLite backend, minus
+        stemming: every word must appear, and a trailing * matches a prefix.
+
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The matching messages of the page and the cursor for the next page
+
+        Raises:
+            ValueError: If the query is empty or the cursor is invalid
+        """
+        SQLiteDatabase._fts_query(query)
+        terms = [(word.rstrip("*").lower(), word.endswith("*")) for word in query.split()]
+        terms = [(word, prefix) for word, prefix in terms if word]
+
+        def matches(content: str) -> bool:
+            words = content.lower().split()
+            return all(
+                any(w.startswith(term) if prefix else w.strip(".,;:!?\"'()") == term for w in words)
+                for term, prefix in terms
+            )
+
+        hits = [
+            (message["timestamp"], message["id"], conversation.id, message)
+            for conversation in list(self._conversations.values())
+            for message in list(conversation.messages)
+            if matches(message["content"] or "")
+        ]
+        hits.sort(key=lambda hit: (hit[0], hit[1]), reverse=True)
+        if before is not None:
+            key = SQLiteDatabase._decode_cursor(before, key_type=str)
+            hits = [hit for hit in hits if (hit[0], hit[1]) < key]
+
+        page = hits[:limit]
+        next_cursor = None
+        if len(hits) > limit:
+            next_cursor = SQLiteDatabase._encode_cursor(page[-1][0], page[-1][1])
+
+        return [
+            {
+                "conversation_id": conversation_id,
+                "message_id": message["id"],
+                "role": message["role"],
+                "timestamp": timestamp,
+                "snippet": message["content"],
+            }
+            for timestamp, _, conversation_id, message in page
+        ], next_cursor
+
+    def export_conversations(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream every conversation as export records.
+
+        Yields:
+            Export records
+        """
+        for conversation in list(self._conversations.values()):
+            yield {"type": "conversation", "id": conversation.id, "created_at": conversation.created_at}
+            for message in list(conversation.messages):
+                yield {"type": "message", "conversation_id": conversation.id, **copy_message(message)}
+
+    def import_records(self, records: Iterable[Dict[str, Any]],
+                       skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records.
+
+        Conversations that already exist are left untouched and their
+        messages are ignored. Unlike the SQLite backend, a malformed record
+        does not undo the records before it in the batch.
+
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+
+        Raises:
+            ValueError: If a record is malformed
+        """
+        if skipped is None:
+            skipped = set()
+        counts = {"conversations": 0, "messages": 0, "skipped": 0}
+
+        for record in records:
+            try:
+                if record["type"] == "conversation":
+                    if record["id"] in self._conversations:
+                        skipped.add(record["id"])
+                        counts["skipped"] += 1
+                        continue
+                    self._get_or_create(record["id"], record.get("created_at") or datetime.now().isoformat())
+                    counts["conversations"] += 1
+                elif record["type"] == "message":
+                    if record["conversation_id"] in skipped:
+                        continue
+                    self.add_message(
+                        record["conversation_id"], record["role"], record["content"],
+                        record.get("tool_calls"), record.get("tool_results"),
+                        message_id=record.get("id"), timestamp=record.get("timestamp"),
+                    )
+                    counts["messages"] += 1
+                else:
+                    raise ValueError(f"Unknown record type: {record['type']}")
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid import record: {e}") from e
+
+        return counts
+
+    def run_retention(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """
+        Drop conversations past the retention period. Nothing is archived.
+
+        Args:
+            full_vacuum: Ignored
+
+        Returns:
+            The archived and purged conversation IDs and the pages released
+        """
+        purged = []
+        if RETENTION_DAYS > 0:
+            cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+            for conversation in list(self._conversations.values()):
+                if conversation.last_activity < cutoff and self.delete_conversation(conversation.id):
+                    purged.append(conversation.id)
+        return {"archived": [], "purged": purged, "pages_released": 0}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the size of the store.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        conversations = list(self._conversations.values())
+        return {
+            "database": {
+                "backend": "memory",
+                "conversations": len(conversations),
+                "messages": sum(len(c.messages) for c in conversations),
+            }
+        }
+
+    def flush(self) -> None:
+        """Nothing is ever queued."""
+
+    def close(self) -> None:
+        """Drop every stored conversation."""
+        self._conversations.clear()
+        logger.info("Closed in-memory database")
@@ -0,0 +1,344 @@
+import sqlite3
+import sys
+from typing import Callable, Dict, List, Any, Optional
+
+from config import logger
+from database.encoding import register_functions
+from database.storage_format import (
+    FINALIZE_MAX_ROWS,
+    finalize as finalize_storage_v2,
+    rebuild_text_index,
+    uses_text_view,
+)
+from tokens import count_tokens
+
+# Schema version -> migration. The applied version is stored in PRAGMA user_version.
+MIGRATIONS: Dict[int, Dict[str, Any]] = {}
+
+
+def migration(version: int, description: str):
+    """
+    Register a schema migration.
+
+    Args:
+        version: Schema version the migration upgrades to
+        description: Short description of the change
+
+    Returns:
+        A decorator that registers the migration function
+    """
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if version in MIGRATIONS:
+            raise ValueError(f"Duplicate migration version: {version}")
+        MIGRATIONS[version] = {
+            "version": version,
+            "description": description,
+            "apply": func,
+        }
+        return func
+    return decorator
+
+
+@migration(1, "Create conversations and messages tables")
+def _create_tables(conn: sqlite3.Connection) -> None:
+    # IF NOT EXISTS so databases created before versioning are adopted as-is
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages (
+        id TEXT PRIMARY KEY,
+        conversation_id TEXT,
+        role TEXT,
+        content TEXT,
+        timestamp TIMESTAMP,
+        tool_calls TEXT,
+        tool_results TEXT,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+    )
+    ''')
+
+
+@migration(2, "Index messages by conversation and time")
+def _add_message_indexes(conn: sqlite3.Connection) -> None:
+    # Serves history reads, per-conversation counts, MAX(timestamp) and the
+    # cascade delete without touching the table itself
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp
+    ON messages (conversation_id, timestamp)
+    ''')
+
+
+@migration(3, "Backfill missing parents so foreign key cascades can be enforced")
+def _enable_foreign_keys(conn: sqlite3.Connection) -> None:
+    # Foreign keys were never enforced, so older files can hold messages
+    # whose conversation row is missing. Recreate the parent rows.
+    cursor = conn.execute('''
+    INSERT OR IGNORE INTO conversations (id, created_at)
+    SELECT conversation_id, MIN(timestamp)
+    FROM messages
+    WHERE conversation_id IS NOT NULL
+      AND conversation_id NOT IN (SELECT id FROM conversations)
+    GROUP BY conversation_id
+    ''')
+    if cursor.rowcount > 0:
+        logger.warning(f"Recreated {cursor.rowcount} missing conversation rows")
+
+    conn.execute("DELETE FROM messages WHERE conversation_id IS NULL")
+
+    violations = conn.execute("PRAGMA foreign_key_check(messages)").fetchall()
+    if violations:
+        raise sqlite3.IntegrityError(
+            f"{len(violations)} messages still violate the conversations foreign key"
+        )
+
+
+@migration(4, "Add incrementally maintained conversation_stats table")
+def _add_conversation_stats(conn: sqlite3.Connection) -> None:
+    # One row per conversation, kept current by add_message, so listing
+    # never has to aggregate the messages table
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversation_stats (
+        conversation_id TEXT PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_activity TIMESTAMP NOT NULL,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+    )
+    ''')
+
+    conn.execute('''
+    INSERT OR REPLACE INTO conversation_stats (conversation_id, created_at, message_count, last_activity)
+    SELECT c.id,
+           COALESCE(c.created_at, MIN(m.timestamp), CURRENT_TIMESTAMP),
+           COUNT(m.id),
+           COALESCE(MAX(m.timestamp), c.created_at, CURRENT_TIMESTAMP)
+    FROM conversations c
+    LEFT JOIN messages m ON c.id = m.conversation_id
+    GROUP BY c.id
+    ''')
+
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_conversation_stats_activity
+    ON conversation_stats (last_activity DESC, conversation_id DESC)
+    ''')
+
+
+@migration(5, "Add archived_conversations index for cold storage")
+def _add_archived_conversations(conn: sqlite3.Connection) -> None:
+    # Points at the compressed record of each conversation moved out of the live tables
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archived_conversations (
+        conversation_id TEXT PRIMARY KEY,
+        created_at TIMESTAMP,
+        message_count INTEGER NOT NULL,
+        last_activity TIMESTAMP,
+        archived_at TIMESTAMP NOT NULL,
+        archive_file TEXT NOT NULL,
+        archive_offset INTEGER NOT NULL,
+        archive_length INTEGER NOT NULL
+    )
+    ''')
+
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_archived_conversations_activity
+    ON archived_conversations (last_activity)
+    ''')
+
+
+@migration(6, "Add messages_fts full-text index over message content")
+def _add_message_search(conn: sqlite3.Connection) -> None:
+    # External-content table: the index stores only tokens and reads the
+    # text back from messages by rowid for snippets
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+        content,
+        content='messages',
+        content_rowid='rowid',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    ''')
+
+    # Triggers also fire for rows removed by the conversations cascade
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+    END
+    ''')
+
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+@migration(7, "Convert messages to storage format v2")
+def _convert_messages_v2(conn: sqlite3.Connection) -> None:
+    # Integer keys, 16-byte message IDs, role codes, epoch timestamps and
+    # compressed large payloads. Rows already copied by
+    # python -m database.storage_format are not copied again; a large table
+    # that it hasn't copied yet fails the migration instead of blocking
+    # writers for the whole copy.
+    finalize_storage_v2(conn, FINALIZE_MAX_ROWS)
+
+
+@migration(8, "Add message token counts and conversation summaries")
+def _add_context_columns(conn: sqlite3.Connection) -> None:
+    # Token counts are computed once, when a message is written, so prompts
+    # can be fitted to a budget without re-counting the history every turn
+    conn.execute("ALTER TABLE messages ADD COLUMN tokens INTEGER")
+    conn.create_function("count_tokens", 1, count_tokens, deterministic=True)
+    conn.execute("UPDATE messages SET tokens = count_tokens(inflate(content))")
+
+    # Running summary of the messages up to and including summary_through,
+    # which prompts carry instead of those messages
+    conn.execute("ALTER TABLE conversations ADD COLUMN summary TEXT")
+    conn.execute("ALTER TABLE conversations ADD COLUMN summary_through TEXT")
+    conn.execute("ALTER TABLE conversations ADD COLUMN summary_tokens INTEGER")
+
+
+@migration(9, "Index plain message text and make message IDs unique")
+def _index_plain_text(conn: sqlite3.Connection) -> None:
+    # The index used to read compressed content through the app-defined
+    # inflate(), so plain sqlite3 clients failed on every write to messages
+    if uses_text_view(conn):
+        rebuild_text_index(conn, "messages", "messages_fts")
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_public_id
+    ON messages (public_id)
+    ''')
+
+
+@migration(10, "Index archived conversations in listing order")
+def _index_archived_listing(conn: sqlite3.Connection) -> None:
+    # Archived conversations are merged into the conversation list, which
+    # is ordered by (last_activity, id) like the conversation_stats index
+    conn.execute("DROP INDEX IF EXISTS idx_archived_conversations_activity")
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_archived_conversations_activity
+    ON archived_conversations (last_activity DESC, conversation_id DESC)
+    ''')
+
+
+def latest_version() -> int:
+    """Get the newest schema version known to this code."""
+    return max(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Get the schema version of a database.
+
+    Args:
+        conn: Connection to the database
+
+    Returns:
+        The applied schema version (0 for an unversioned database)
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """
+    Upgrade a database to the target schema version.
+
+    Each migration runs in its own IMMEDIATE transaction together with the
+    version bump, so a failed migration leaves the previous version intact
+    and concurrent processes never apply the same migration twice.
+
+    Args:
+        conn: Connection to the database
+        target: Version to upgrade to (default: the latest version)
+
+    Returns:
+        The schema version after migrating
+
+    Raises:
+        ValueError: If the database is newer than the target version
+    """
+    if target is None:
+        target = latest_version()
+
+    version = get_schema_version(conn)
+    if version > latest_version():
+        raise ValueError(
+            f"Database schema version {version} is newer than this code supports ({latest_version()})"
+        )
+
+    while version < target:
+        next_version = version + 1
+        step = MIGRATIONS[next_version]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = get_schema_version(conn)
+            if version >= next_version:
+                conn.commit()
+                continue
+
+            step["apply"](conn)
+            conn.execute(f"PRAGMA user_version = {next_version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {next_version} failed: {step['description']}", exc_info=True)
+            raise
+
+        logger.info(f"Applied migration {next_version}: {step['description']}")
+        version = next_version
+
+    return version
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """
+    List the migrations that have not been applied yet.
+
+    Args:
+        conn: Connection to the database
+
+    Returns:
+        The pending migrations in the order they will be applied
+    """
+    version = get_schema_version(conn)
+    return [MIGRATIONS[v] for v in sorted(MIGRATIONS) if v > version]
+
+
+def main(argv: List[str]) -> int:
+    """
+    Upgrade a database file from the command line.
+
+    Usage: python -m database.migrations [db_path] [target_version]
+    """
+    db_path = argv[1] if len(argv) > 1 else "conversations.db"
+    target = int(argv[2]) if len(argv) > 2 else None
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys=ON")
+    register_functions(conn)
+    try:
+        for step in pending_migrations(conn):
+            if target is None or step["version"] <= target:
+                print(f"pending {step['version']}: {step['description']}")
+        version = migrate(conn, target)
+        print(f"{db_path} is at schema version {version}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,189 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from config import (
+    DATABASE_POOL_SIZE,
+    DATABASE_BUSY_TIMEOUT,
+    DATABASE_SYNCHRONOUS,
+    DATABASE_CACHE_SIZE_KB,
+    DATABASE_MMAP_SIZE,
+    DATABASE_STATEMENT_CACHE_SIZE,
+    logger,
+)
+from database.encoding import register_functions
+
+
+class ConnectionPool:
+    """
+    A bounded pool of long-lived SQLite connections.
+
+    A borrowed connection is bound to the borrowing thread until it is
+    returned. Nested borrows on the same thread reuse that connection, so a
+    helper called from inside another database method never opens a second one.
+    """
+
+    def __init__(self, db_path: str, size: int = DATABASE_POOL_SIZE,
+                 timeout: float = DATABASE_BUSY_TIMEOUT):
+        """
+        Initialize the connection pool.
+
+        Args:
+            db_path: Path to the SQLite database file
+            size: Maximum number of connections open at the same time
+            timeout: Seconds to wait for a database lock or a free connection
+        """
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection and apply the performance pragmas."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=DATABASE_STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+
+        # Must precede the WAL switch, which writes the header of a new file;
+        # existing files keep their mode until a full VACUUM
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL lets readers proceed while a writer holds the lock, and with
+        # synchronous=NORMAL only checkpoints have to fsync.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DATABASE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{DATABASE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DATABASE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA foreign_keys=ON")
+        register_functions(conn)
+
+        with self._lock:
+            self._opened += 1
+            opened = self._opened
+
+        logger.info(f"Opened pooled connection to {self.db_path} ({opened}/{self.size})")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, or open one if the pool is not full."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                f"Timed out waiting for a database connection to {self.db_path}"
+            )
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool."""
+        if conn.in_transaction:
+            # Never hand a half-finished transaction to the next borrower
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection for the duration of a ``with`` block.
+
+        Yields:
+            A SQLite connection bound to the current thread
+        """
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection and run the block in a single transaction.
+
+        The transaction is committed when the block exits normally and rolled
+        back if it raises. A nested call joins the outer transaction.
+
+        Yields:
+            A SQLite connection bound to the current thread
+        """
+        with self.connection() as conn:
+            if getattr(self._local, "in_transaction", False):
+                yield conn
+                return
+
+            self._local.in_transaction = True
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self._local.in_transaction = False
+
+    def close(self) -> None:
+        """
+        Close the pool.
+
+        Idle connections are closed immediately; connections still borrowed
+        are closed when they are returned.
+        """
+        self._closed = True
+
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+        logger.info(f"Closed connection pool for {self.db_path}")
@@ -0,0 +1,75 @@
+from typing import Dict, List, Callable
+
+from config import CONVERSATION_CACHE_SIZE, DATABASE_SHARDS, logger
+from database.backend import StorageBackend
+from database.cache import CachedDatabase
+from database.memory import MemoryDatabase
+from database.sharded import ShardedDatabase
+from database.sqlite import SQLiteDatabase
+
+
+class StorageRegistry:
+    """Registry of storage backends the chatbots can be configured to use."""
+
+    def __init__(self):
+        self.backends: Dict[str, Callable[[str], StorageBackend]] = {}
+
+    def register_backend(self, name: str, factory: Callable[[str], StorageBackend]):
+        """
+        Register a storage backend with the registry.
+
+        Args:
+            name: Unique name, as used by the STORAGE_BACKEND setting
+            factory: Function that takes a database path and returns the backend
+        """
+        self.backends[name] = factory
+
+    def get_backend_names(self) -> List[str]:
+        """
+        Get the names of all registered backends.
+
+        Returns:
+            List of backend names
+        """
+        return list(self.backends)
+
+    def create_backend(self, name: str, db_path: str = "conversations.db") -> StorageBackend:
+        """
+        Create a storage backend by name.
+
+        Args:
+            name: Name of a registered backend
+            db_path: Path to the database file, for backends that persist
+
+        Returns:
+            The backend
+
+        Raises:
+            ValueError: If no backend is registered under the name
+        """
+        if name not in self.backends:
+            raise ValueError(
+                f"Storage backend '{name}' not found; "
+                f"available: {', '.join(sorted(self.backends))}"
+            )
+
+        backend = self.backends[name](db_path)
+        logger.info(f"Using {name} storage backend")
+        return backend
+
+
+def create_sqlite_backend(db_path: str) -> StorageBackend:
+    """Create the SQLite backend, sharded and cached as configured."""
+    if DATABASE_SHARDS > 1:
+        database = ShardedDatabase(db_path, DATABASE_SHARDS)
+    else:
+        database = SQLiteDatabase(db_path)
+    if CONVERSATION_CACHE_SIZE > 0:
+        database = CachedDatabase(database)
+    return database
+
+
+# Create a global storage registry
+storage_registry = StorageRegistry()
+storage_registry.register_backend("sqlite", create_sqlite_backend)
+storage_registry.register_backend("memory", MemoryDatabase)
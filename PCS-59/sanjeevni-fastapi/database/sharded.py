@@ -0,0 +1,428 @@
+import base64
+import heapq
+import itertools
+import json
+import os
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+from config import DATABASE_SHARDS, logger
+from database.sqlite import SQLiteDatabase
+
+
+class ShardedDatabase:
+    """
+    Conversation storage spread over several SQLite files.
+
+    Each conversation lives in exactly one shard, chosen by a stable hash of
+    its ID, so writers to different shards never wait on the same database
+    lock. Listing queries fan out to every shard and merge the results.
+
+    The shard count must not change once data has been written; a different
+    count routes existing conversations to the wrong file.
+    """
+
+    blocking = True
+
+    def __init__(self, db_path: str = "conversations.db", shards: int = DATABASE_SHARDS, **kwargs):
+        """
+        Initialize the shards.
+
+        Args:
+            db_path: Base path; shard i is stored next to it as <name>.shard<i><ext>
+            shards: Number of shard files
+            **kwargs: Extra arguments for each shard's SQLiteDatabase
+        """
+        if shards < 1:
+            raise ValueError("Shard count must be at least 1")
+
+        self.db_path = db_path
+        root, ext = os.path.splitext(db_path)
+        self.shard_paths = [f"{root}.shard{i}{ext}" for i in range(shards)]
+
+        if os.path.exists(f"{root}.shard{shards}{ext}"):
+            logger.warning(
+                f"Found more shard files than the configured {shards}; "
+                "conversations in the extra shards are not reachable"
+            )
+
+        self.shards = [SQLiteDatabase(path, **kwargs) for path in self.shard_paths]
+        self._executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="shard")
+        logger.info(f"Opened {shards} database shards for {db_path}")
+
+    def shard_for(self, conversation_id: str) -> SQLiteDatabase:
+        """
+        Get the shard that stores a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The shard's database
+        """
+        # crc32 is stable across processes, unlike the built-in hash()
+        index = zlib.crc32(conversation_id.encode()) % len(self.shards)
+        return self.shards[index]
+
+    def _fan_out(self, func: Callable[[SQLiteDatabase], Any]) -> List[Any]:
+        """Run a function against every shard in parallel."""
+        if len(self.shards) == 1:
+            return [func(self.shards[0])]
+        return list(self._executor.map(func, self.shards))
+
+    @staticmethod
+    def _merge_by_activity(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Merge per-shard listings that are each sorted most recently active first."""
+        return list(heapq.merge(
+            *results, key=lambda c: (c["last_activity"], c["id"]), reverse=True
+        ))
+
+    def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """
+        Create a new conversation.
+
+        Args:
+            conversation_id: Optional ID for the conversation
+
+        Returns:
+            The conversation ID
+        """
+        if conversation_id is None:
+            conversation_id = str(uuid.uuid4())
+        return self.shard_for(conversation_id).create_conversation(conversation_id)
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """
+        Check if a conversation exists.
+
+        Args:
+            conversation_id: ID of the conversation to check
+
+        Returns:
+            True if the conversation exists, False otherwise
+        """
+        return self.shard_for(conversation_id).conversation_exists(conversation_id)
+
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of one conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation summary, or None if it doesn't exist
+        """
+        return self.shard_for(conversation_id).get_conversation_info(conversation_id)
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                    tool_calls: Optional[List[Dict[str, Any]]] = None,
+                    tool_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Add a message to a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender (user or assistant)
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+
+        Returns:
+            The stored message
+        """
+        return self.shard_for(conversation_id).add_message(
+            conversation_id, role, content, tool_calls=tool_calls, tool_results=tool_results
+        )
+
+    def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the full history of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            List of messages in the conversation
+        """
+        return self.shard_for(conversation_id).get_conversation(conversation_id)
+
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages to return
+
+        Returns:
+            Up to ``limit`` messages, oldest first
+        """
+        return self.shard_for(conversation_id).get_recent_messages(conversation_id, limit)
+
+    def get_messages_page(self, conversation_id: str, limit: int,
+                          before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a conversation's history, newest page first.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The messages of the page and the cursor for the next, older page
+        """
+        return self.shard_for(conversation_id).get_messages_page(conversation_id, limit, before)
+
+    def history_cursor(self, conversation_id: str, message: Dict[str, Any]) -> str:
+        """
+        Get the cursor for the history page older than a message.
+
+        Args:
+            conversation_id: ID of the conversation
+            message: A message returned by this database
+
+        Returns:
+            A cursor for get_messages_page
+        """
+        return self.shard_for(conversation_id).history_cursor(conversation_id, message)
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the running summary of a conversation's older messages.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The summary, or None if there is none
+        """
+        return self.shard_for(conversation_id).get_summary(conversation_id)
+
+    def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """
+        Store the running summary of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            text: The summary
+            through: ID of the newest message the summary covers
+            tokens: Prompt size of the summary
+
+        Returns:
+            True if the summary was stored, False if the conversation doesn't exist
+        """
+        return self.shard_for(conversation_id).set_summary(conversation_id, text, through, tokens)
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """
+        Delete a conversation and all its messages.
+
+        Args:
+            conversation_id: ID of the conversation to delete
+
+        Returns:
+            True if the conversation was deleted, False if it wasn't found
+        """
+        return self.shard_for(conversation_id).delete_conversation(conversation_id)
+
+    def get_all_conversations(self, limit: Optional[int] = None,
+                              offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations across shards, most recently active first.
+
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        # Any shard can contribute the whole requested window
+        per_shard = None if limit is None else limit + offset
+        results = self._fan_out(lambda shard: shard.get_all_conversations(per_shard))
+        merged = self._merge_by_activity(results)
+
+        if limit is None:
+            return merged[offset:]
+        return merged[offset:offset + limit]
+
+    def get_conversations_page(self, limit: int,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list across shards.
+
+        The cursor is the same keyset cursor the shards use, so every shard
+        can resume from it independently.
+
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page
+
+        Returns:
+            The conversations of the page and the cursor for the next page
+        """
+        pages = self._fan_out(lambda shard: shard.get_conversations_page(limit, after))
+        merged = self._merge_by_activity([conversations for conversations, _ in pages])
+
+        has_more = len(merged) > limit or any(cursor is not None for _, cursor in pages)
+        merged = merged[:limit]
+
+        next_cursor = None
+        if has_more and merged:
+            last = merged[-1]
+            next_cursor = SQLiteDatabase._encode_cursor(last["last_activity"], last["id"])
+
+        return merged, next_cursor
+
+    def get_conversations(self) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations.
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return self.get_all_conversations()
+
+    def search_messages(self, query: str, limit: int,
+                        before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search message content by keywords across shards, newest matches first.
+
+        The cursor holds the (timestamp, seq) position reached in every
+        shard, since seqs of different shards are unrelated.
+
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The matching messages of the page and the cursor for the next page
+
+        Raises:
+            ValueError: If the query is empty or the cursor is invalid
+        """
+        fts_query = SQLiteDatabase._fts_query(query)
+
+        # Per shard: None to start from the newest match, otherwise the
+        # [timestamp, seq] to continue below, or 0 once the shard is exhausted
+        positions: List[Any] = [None] * len(self.shards)
+        if before is not None:
+            try:
+                positions = [position if position in (None, 0) else (position[0], int(position[1]))
+                             for position in json.loads(base64.urlsafe_b64decode(before.encode()))]
+            except (ValueError, TypeError, IndexError, KeyError) as e:
+                raise ValueError(f"Invalid cursor: {before}") from e
+            if len(positions) != len(self.shards):
+                raise ValueError(f"Invalid cursor: {before}")
+
+        def search_shard(index: int) -> List[Tuple[Tuple[Any, int], int, Any]]:
+            if positions[index] == 0:
+                return []
+            rows = self.shards[index]._search_rows(fts_query, limit + 1, positions[index])
+            return [((row["timestamp"], row["seq"]), index, row) for row in rows]
+
+        # Every shard returns its rows ordered by (timestamp, seq), so the
+        # merge is on the same key
+        results = list(self._executor.map(search_shard, range(len(self.shards))))
+        page = list(heapq.merge(*results, key=lambda hit: hit[0], reverse=True))[:limit]
+
+        consumed = [0] * len(self.shards)
+        for key, index, _ in page:
+            positions[index] = key
+            consumed[index] += 1
+        for index, rows in enumerate(results):
+            # A shard whose rows were all used had no more than limit matches left
+            if consumed[index] == len(rows):
+                positions[index] = 0
+
+        next_cursor = None
+        if any(position != 0 for position in positions):
+            next_cursor = base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+        return [SQLiteDatabase._row_to_search_hit(row) for _, _, row in page], next_cursor
+
+    def export_conversations(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream every conversation of every shard as export records.
+
+        Yields:
+            Export records
+        """
+        return itertools.chain.from_iterable(shard.export_conversations() for shard in self.shards)
+
+    def import_records(self, records: Iterable[Dict[str, Any]],
+                       skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records, routing each to its conversation's shard.
+
+        Each shard imports its part in its own transaction.
+
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+        """
+        if skipped is None:
+            skipped = set()
+
+        by_shard: Dict[SQLiteDatabase, List[Dict[str, Any]]] = {}
+        for record in records:
+            try:
+                conversation_id = record["id"] if record["type"] == "conversation" else record["conversation_id"]
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Invalid import record: {e}") from e
+            by_shard.setdefault(self.shard_for(conversation_id), []).append(record)
+
+        totals = {"conversations": 0, "messages": 0, "skipped": 0}
+        for shard, shard_records in by_shard.items():
+            for key, value in shard.import_records(shard_records, skipped).items():
+                totals[key] += value
+        return totals
+
+    def run_retention(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """
+        Run one retention pass on every shard.
+
+        Args:
+            full_vacuum: Convert shards to incremental vacuum if needed
+
+        Returns:
+            The archived and purged conversation IDs and the pages released
+        """
+        results = self._fan_out(lambda shard: shard.run_retention(full_vacuum))
+        return {
+            "archived": [cid for result in results for cid in result["archived"]],
+            "purged": [cid for result in results for cid in result["purged"]],
+            "pages_released": sum(result["pages_released"] for result in results),
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of every shard.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        return {
+            "database": {
+                "shards": len(self.shards),
+                "shard_metrics": [shard.get_metrics()["database"] for shard in self.shards],
+            }
+        }
+
+    def flush(self) -> None:
+        """Block until every shard has written its queued messages."""
+        self._fan_out(lambda shard: shard.flush())
+
+    def close(self) -> None:
+        """Close every shard."""
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,1300 @@
+import base64
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+import uuid
+from config import (
+    DATABASE_POOL_SIZE,
+    DATABASE_WRITE_BEHIND,
+    EXPORT_BATCH_SIZE,
+    ARCHIVE_DIR,
+    ARCHIVE_AFTER_DAYS,
+    RETENTION_DAYS,
+    RETENTION_BATCH_SIZE,
+    VACUUM_PAGES,
+    logger,
+)
+from database.archive import ArchiveStore
+from database.encoding import (
+    decode_id,
+    decode_payload,
+    decode_role,
+    decode_timestamp,
+    encode_id,
+    encode_payload,
+    encode_role,
+    encode_timestamp,
+)
+from database.pool import ConnectionPool
+from database.storage_format import index_text
+from database.migrations import migrate
+from database.write_behind import WriteBehindQueue
+from tokens import count_tokens
+
+class SQLiteDatabase:
+    """
+    A simple database class for storing conversation history and other data.
+    """
+
+    # Calls wait on disk I/O and connection locks
+    blocking = True
+
+    def __init__(self, db_path: str = "conversations.db", pool_size: int = DATABASE_POOL_SIZE,
+                 write_behind: bool = DATABASE_WRITE_BEHIND, archive_dir: Optional[str] = None):
+        """
+        Initialize the database.
+
+        Args:
+            db_path: Path to the SQLite database file
+            pool_size: Maximum number of pooled connections
+            write_behind: Queue message inserts and group-commit them from a
+                background writer instead of committing each one
+            archive_dir: Directory for archived conversations
+                (default: ARCHIVE_DIR, or <db name>.archive next to the database).
+                A directory other than the default may be shared with other
+                databases, such as the shards of a ShardedDatabase, so this
+                database's files are named after its own file there and it
+                never deletes theirs
+        """
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self._initialize_db()
+
+        archive_dir = archive_dir or ARCHIVE_DIR
+        if archive_dir:
+            prefix = f"archive-{os.path.splitext(os.path.basename(db_path))[0]}"
+        else:
+            archive_dir, prefix = f"{os.path.splitext(db_path)[0]}.archive", "archive"
+        self.archive = ArchiveStore(archive_dir, prefix)
+
+        self.write_behind: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self.write_behind = WriteBehindQueue(self._write_messages)
+
+    def _initialize_db(self):
+        """Create the schema or upgrade it to the latest version."""
+        with self.pool.connection() as conn:
+            version = migrate(conn)
+        logger.info(f"Database {self.db_path} is at schema version {version}")
+
+    def close(self) -> None:
+        """Flush queued writes and close all pooled connections."""
+        if self.write_behind is not None:
+            self.write_behind.close()
+        self.pool.close()
+
+    def flush(self) -> None:
+        """Block until every queued message has been written."""
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def _wait_for_writes(self, conversation_id: str) -> None:
+        """
+        Make queued messages of a conversation visible before reading it.
+
+        Must be called before borrowing a connection, because the writer
+        needs one of the pooled connections to make progress.
+        """
+        if self.write_behind is not None:
+            self.write_behind.wait_for(conversation_id)
+
+    def create_conversation(self, conversation_id: Optional[str] = None) -> str:
+        """
+        Create a new conversation.
+
+        Args:
+            conversation_id: Optional ID for the conversation. If not provided, a UUID will be generated.
+
+        Returns:
+            The conversation ID
+        """
+        if conversation_id is None:
+            conversation_id = str(uuid.uuid4())
+
+        created_at = datetime.now().isoformat()
+
+        with self.pool.transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO conversations (id, created_at)
+                VALUES (?, ?)
+                """,
+                (conversation_id, created_at)
+            )
+
+            conn.execute(
+                """
+                INSERT INTO conversation_stats (conversation_id, created_at, message_count, last_activity)
+                VALUES (?, ?, 0, ?)
+                """,
+                (conversation_id, created_at, created_at)
+            )
+
+        logger.info(f"Created new conversation: {conversation_id}")
+        return conversation_id
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        """
+        Check if a conversation exists in the database.
+
+        Args:
+            conversation_id: ID of the conversation to check
+
+        Returns:
+            True if the conversation exists, False otherwise
+        """
+        self._wait_for_writes(conversation_id)
+
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "SELECT 1 FROM conversations WHERE id = ?",
+                (conversation_id,)
+            )
+            if cursor.fetchone() is not None:
+                return True
+
+        # Archived conversations are brought back on first access
+        return self._restore_if_archived(conversation_id)
+
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of one conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The conversation's ID, creation time, message count and last
+            activity, or None if it doesn't exist
+        """
+        self._wait_for_writes(conversation_id)
+
+        for attempt in range(2):
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    """
+                    SELECT conversation_id AS id, created_at, message_count, last_activity
+                    FROM conversation_stats
+                    WHERE conversation_id = ?
+                    """,
+                    (conversation_id,)
+                ).fetchone()
+            if row is not None:
+                return self._row_to_conversation(row)
+            # Archived conversations are brought back on first access
+            if attempt or not self._restore_if_archived(conversation_id):
+                return None
+
+    def add_message(self, conversation_id: str, role: str, content: str,
+                   tool_calls: Optional[List[Dict[str, Any]]] = None,
+                   tool_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Add a message to a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender (user or assistant)
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+
+        Returns:
+            The stored message, as get_conversation would return it
+        """
+        row = self._encode_message(conversation_id, role, content, tool_calls, tool_results)
+
+        if self.write_behind is not None:
+            self.write_behind.submit(conversation_id, row)
+            logger.info(f"Queued {role} message for conversation {conversation_id}")
+            return self._row_to_message(row)
+
+        with self.pool.transaction() as conn:
+            self._insert_message(conn, row)
+
+        logger.info(f"Added {role} message to conversation {conversation_id}")
+        return self._row_to_message(row)
+
+    def _encode_message(self, conversation_id: str, role: str, content: str,
+                        tool_calls: Optional[List[Dict[str, Any]]] = None,
+                        tool_results: Optional[List[Dict[str, Any]]] = None,
+                        message_id: Optional[str] = None,
+                        timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the row stored for a message, in storage format v2.
+
+        Args:
+            conversation_id: ID of the conversation
+            role: Role of the message sender
+            content: Message content
+            tool_calls: Optional list of tool calls
+            tool_results: Optional list of tool results
+            message_id: ID to keep when re-inserting an existing message
+            timestamp: Timestamp to keep when re-inserting an existing message
+
+        Returns:
+            The encoded row, ready for _insert_message
+
+        Raises:
+            ValueError: If the role is not a known message role
+        """
+        return {
+            "id": encode_id(message_id or str(uuid.uuid4())),
+            "conversation_id": conversation_id,
+            "role": encode_role(role),
+            "content": encode_payload(content),
+            "timestamp": encode_timestamp(timestamp or datetime.now().isoformat()),
+            # Serialize tool calls and results to JSON if they exist
+            "tool_calls": encode_payload(json.dumps(tool_calls)) if tool_calls else None,
+            "tool_results": encode_payload(json.dumps(tool_results)) if tool_results else None,
+            "tokens": count_tokens(content),
+        }
+
+    def _insert_message(self, conn: sqlite3.Connection, row: Dict[str, Any]) -> None:
+        """
+        Insert an encoded message row inside the caller's transaction.
+
+        Args:
+            conn: Connection with an open transaction
+            row: The encoded message built by add_message
+        """
+        conversation_id = row["conversation_id"]
+        timestamp = decode_timestamp(row["timestamp"])
+
+        # Create the conversation if it doesn't exist
+        cursor = conn.execute(
+            """
+            INSERT OR IGNORE INTO conversations (id, created_at)
+            VALUES (?, ?)
+            """,
+            (conversation_id, timestamp)
+        )
+        if cursor.rowcount and not self._restore_archived(conn, conversation_id):
+            logger.info(f"Created new conversation: {conversation_id}")
+
+        cursor = conn.execute(
+            """
+            INSERT INTO messages (public_id, conversation_id, role, content, timestamp, tool_calls, tool_results, tokens)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (row["id"], conversation_id, row["role"], row["content"], row["timestamp"],
+             row["tool_calls"], row["tool_results"], row["tokens"])
+        )
+        # The trigger only indexes content stored as plain text
+        index_text(conn, "messages_fts", [(cursor.lastrowid, row["content"], decode_payload(row["content"]))])
+
+        # Keep the listing summary current in the same transaction
+        conn.execute(
+            """
+            INSERT INTO conversation_stats (conversation_id, created_at, message_count, last_activity)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (conversation_id) DO UPDATE SET
+                message_count = message_count + 1,
+                last_activity = MAX(last_activity, excluded.last_activity)
+            """,
+            (conversation_id, timestamp, timestamp)
+        )
+
+    def _write_messages(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write a batch of queued message rows in a single transaction.
+
+        Failures propagate to the write-behind queue, which retries the
+        batch and then writes its rows individually.
+
+        Args:
+            rows: Encoded message rows built by add_message
+        """
+        with self.pool.transaction() as conn:
+            for row in rows:
+                self._insert_message(conn, row)
+        logger.info(f"Group-committed {len(rows)} messages")
+
+    def get_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """
+        Get a conversation by ID.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            List of messages in the conversation
+        """
+        if not self.conversation_exists(conversation_id):
+            logger.warning(f"Conversation not found: {conversation_id}")
+            return []
+
+        with self.pool.connection() as conn:
+            # Get all messages for the conversation
+            cursor = conn.execute(
+                """
+                SELECT seq, public_id AS id, role, content, timestamp, tool_calls, tool_results, tokens
+                FROM messages
+                WHERE conversation_id = ?
+                ORDER BY timestamp, seq
+                """,
+                (conversation_id,)
+            )
+            rows = cursor.fetchall()
+
+        messages = [self._row_to_message(row) for row in rows]
+
+        message_count = len(messages)
+        logger.info(f"Retrieved conversation {conversation_id} with {message_count} messages")
+
+        return messages
+
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a conversation.
+
+        Only the requested window is read, using the
+        (conversation_id, timestamp) index, so the cost does not grow with
+        the length of the conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages to return
+
+        Returns:
+            Up to ``limit`` messages, oldest first
+        """
+        messages, _ = self.get_messages_page(conversation_id, limit)
+        return messages
+
+    def get_messages_page(self, conversation_id: str, limit: int,
+                          before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a conversation's history, newest page first.
+
+        Args:
+            conversation_id: ID of the conversation
+            limit: Maximum number of messages in the page
+            before: Cursor returned by the previous page, or None for the newest page
+
+        Returns:
+            The messages of the page (oldest first) and the cursor for the
+            next, older page, which is None when there are no older messages
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        if limit < 1:
+            raise ValueError("Page limit must be at least 1")
+        if before is not None:
+            timestamp, key = self._decode_cursor(before, key_type=self._message_key)
+
+        self._wait_for_writes(conversation_id)
+
+        with self.pool.connection() as conn:
+            if before is None:
+                cursor = conn.execute(
+                    """
+                    SELECT seq, public_id AS id, role, content, timestamp, tool_calls, tool_results, tokens
+                    FROM messages
+                    WHERE conversation_id = ?
+                    ORDER BY timestamp DESC, seq DESC
+                    LIMIT ?
+                    """,
+                    (conversation_id, limit + 1)
+                )
+            elif isinstance(key, str):
+                # Cursors from history_cursor name the oldest message already seen
+                cursor = conn.execute(
+                    """
+                    SELECT seq, public_id AS id, role, content, timestamp, tool_calls, tool_results, tokens
+                    FROM messages
+                    WHERE conversation_id = ? AND (timestamp, seq) < (
+                        SELECT timestamp, seq FROM messages
+                        WHERE conversation_id = ? AND public_id = ?
+                    )
+                    ORDER BY timestamp DESC, seq DESC
+                    LIMIT ?
+                    """,
+                    (conversation_id, conversation_id, encode_id(key), limit + 1)
+                )
+            else:
+                cursor = conn.execute(
+                    """
+                    SELECT seq, public_id AS id, role, content, timestamp, tool_calls, tool_results, tokens
+                    FROM messages
+                    WHERE conversation_id = ? AND (timestamp, seq) < (?, ?)
+                    ORDER BY timestamp DESC, seq DESC
+                    LIMIT ?
+                    """,
+                    (conversation_id, timestamp, key, limit + 1)
+                )
+            rows = cursor.fetchall()
+
+        if not rows and before is None and self._restore_if_archived(conversation_id):
+            return self.get_messages_page(conversation_id, limit)
+
+        # One extra row tells us whether an older page exists
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+
+        next_cursor = None
+        if has_more:
+            next_cursor = self._encode_cursor(rows[0]["timestamp"], rows[0]["seq"])
+
+        return [self._row_to_message(row) for row in rows], next_cursor
+
+    def history_cursor(self, conversation_id: str, message: Dict[str, Any]) -> str:
+        """
+        Get the cursor for the history page older than a message.
+
+        Lets a cache that holds the newest messages hand out the same
+        cursor get_messages_page would have returned.
+
+        Args:
+            conversation_id: ID of the conversation
+            message: A message returned by this database
+
+        Returns:
+            A cursor for get_messages_page
+        """
+        return self._encode_cursor(message["timestamp"], message["id"])
+
+    @staticmethod
+    def _encode_cursor(timestamp: Any, key: Any) -> str:
+        """Encode a row's sort key as an opaque pagination cursor."""
+        raw = json.dumps([timestamp, key]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str, key_type: Callable[[Any], Any] = int) -> Tuple[Any, Any]:
+        """Decode a pagination cursor created by _encode_cursor."""
+        try:
+            timestamp, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return timestamp, key_type(key)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    @staticmethod
+    def _message_key(key: Any) -> Any:
+        """Check the key of a history cursor: a row's seq, or a message ID from history_cursor."""
+        if isinstance(key, bool) or not isinstance(key, (int, str)):
+            raise ValueError(f"Invalid message cursor key: {key!r}")
+        return key
+
+    def _row_to_message(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """
+        Convert a messages row into a message dictionary.
+
+        Args:
+            row: Row selected from the messages table, or a row built by add_message
+
+        Returns:
+            The decoded message
+        """
+        message = {
+            "id": decode_id(row["id"]),
+            "role": decode_role(row["role"]),
+            "content": decode_payload(row["content"]),
+            "timestamp": decode_timestamp(row["timestamp"])
+        }
+
+        # Parse tool calls and results if they exist
+        if row["tool_calls"]:
+            message["tool_calls"] = json.loads(decode_payload(row["tool_calls"]))
+
+        if row["tool_results"]:
+            message["tool_results"] = json.loads(decode_payload(row["tool_results"]))
+
+        # Prompt size of the content, when the row was read with it
+        if "tokens" in row.keys() and row["tokens"] is not None:
+            message["tokens"] = row["tokens"]
+
+        return message
+
+    def get_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the running summary of a conversation's older messages.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            {"text": ..., "through": ..., "tokens": ...} where ``through`` is
+            the ID of the newest message the summary covers, or None if the
+            conversation has no summary or doesn't exist
+        """
+        for attempt in range(2):
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT summary, summary_through, summary_tokens FROM conversations WHERE id = ?",
+                    (conversation_id,)
+                ).fetchone()
+            if row is not None:
+                return self._row_to_summary(row)
+            # Archived conversations are brought back on first access
+            if attempt or not self._restore_if_archived(conversation_id):
+                return None
+
+    @staticmethod
+    def _row_to_summary(row: sqlite3.Row) -> Optional[Dict[str, Any]]:
+        """Convert the summary columns of a conversations row into a summary dictionary."""
+        if row["summary"] is None:
+            return None
+        return {"text": row["summary"], "through": row["summary_through"], "tokens": row["summary_tokens"]}
+
+    def set_summary(self, conversation_id: str, text: str, through: str, tokens: int) -> bool:
+        """
+        Store the running summary of a conversation, replacing the previous one.
+
+        Args:
+            conversation_id: ID of the conversation
+            text: The summary
+            through: ID of the newest message the summary covers
+            tokens: Prompt size of the summary
+
+        Returns:
+            True if the summary was stored, False if the conversation doesn't exist
+        """
+        with self.pool.transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE conversations SET summary = ?, summary_through = ?, summary_tokens = ?
+                WHERE id = ?
+                """,
+                (text, through, tokens, conversation_id)
+            )
+        return cursor.rowcount > 0
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        """
+        Delete a conversation and all its messages.
+
+        Args:
+            conversation_id: ID of the conversation to delete
+
+        Returns:
+            True if the conversation was deleted, False if it wasn't found
+        """
+        # Queued inserts would otherwise recreate the conversation afterwards
+        self._wait_for_writes(conversation_id)
+
+        with self.pool.transaction() as conn:
+            # Messages and stats are removed by the ON DELETE CASCADE foreign keys
+            cursor = conn.execute(
+                """
+                DELETE FROM conversations WHERE id = ?
+                """,
+                (conversation_id,)
+            )
+            deleted = cursor.rowcount > 0
+
+            cursor = conn.execute(
+                "DELETE FROM archived_conversations WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+            deleted = deleted or cursor.rowcount > 0
+
+        if not deleted:
+            logger.warning(f"Attempted to delete non-existent conversation: {conversation_id}")
+            return False
+
+        logger.info(f"Deleted conversation: {conversation_id}")
+        return True
+
+    def get_all_conversations(self, limit: Optional[int] = None,
+                              offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations, most recently active first.
+
+        Args:
+            limit: Optional maximum number of conversations to return
+            offset: Number of conversations to skip
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        with self.pool.connection() as conn:
+            # Read from the summary tables so the cost doesn't grow with message volume;
+            # archived conversations are listed too and restored when opened
+            cursor = conn.execute(
+                """
+                SELECT conversation_id AS id, created_at, message_count, last_activity
+                FROM conversation_stats
+                UNION ALL
+                SELECT conversation_id AS id, created_at, message_count, last_activity
+                FROM archived_conversations
+                ORDER BY last_activity DESC, id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (-1 if limit is None else limit, offset)
+            )
+            rows = cursor.fetchall()
+
+        conversations = [self._row_to_conversation(row) for row in rows]
+
+        logger.info(f"Retrieved {len(conversations)} conversations")
+
+        return conversations
+
+    def get_conversations_page(self, limit: int,
+                               after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of the conversation list, most recently active first.
+
+        Args:
+            limit: Maximum number of conversations in the page
+            after: Cursor returned by the previous page, or None for the first page
+
+        Returns:
+            The conversations of the page and the cursor for the next page,
+            which is None when there are no more conversations
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        if limit < 1:
+            raise ValueError("Page limit must be at least 1")
+
+        with self.pool.connection() as conn:
+            # Archived conversations are listed too and restored when opened
+            if after is None:
+                cursor = conn.execute(
+                    """
+                    SELECT conversation_id AS id, created_at, message_count, last_activity
+                    FROM conversation_stats
+                    UNION ALL
+                    SELECT conversation_id AS id, created_at, message_count, last_activity
+                    FROM archived_conversations
+                    ORDER BY last_activity DESC, id DESC
+                    LIMIT ?
+                    """,
+                    (limit + 1,)
+                )
+            else:
+                last_activity, conversation_id = self._decode_cursor(after, key_type=str)
+                cursor = conn.execute(
+                    """
+                    SELECT conversation_id AS id, created_at, message_count, last_activity
+                    FROM conversation_stats
+                    WHERE (last_activity, conversation_id) < (?, ?)
+                    UNION ALL
+                    SELECT conversation_id AS id, created_at, message_count, last_activity
+                    FROM archived_conversations
+                    WHERE (last_activity, conversation_id) < (?, ?)
+                    ORDER BY last_activity DESC, id DESC
+                    LIMIT ?
+                    """,
+                    (last_activity, conversation_id, last_activity, conversation_id, limit + 1)
+                )
+            rows = cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more:
+            next_cursor = self._encode_cursor(rows[-1]["last_activity"], rows[-1]["id"])
+
+        return [self._row_to_conversation(row) for row in rows], next_cursor
+
+    def _row_to_conversation(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """
+        Convert a conversation_stats row into a conversation dictionary.
+
+        Args:
+            row: Row selected from the conversation_stats table
+
+        Returns:
+            The conversation summary
+        """
+        return {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "message_count": row["message_count"],
+            "last_activity": row["last_activity"]
+        }
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """
+        Turn free-text keywords into an FTS5 query that matches all of them.
+
+        Each word is quoted so punctuation and FTS5 operators in user input
+        are searched literally; a trailing * keeps its prefix-match meaning.
+
+        Raises:
+            ValueError: If the query has no searchable words
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '""')
+            if word:
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+
+        if not terms:
+            raise ValueError("Search query is empty")
+        return " ".join(terms)
+
+    def _search_rows(self, fts_query: str, limit: int,
+                     before: Optional[Tuple[Any, int]] = None) -> List[sqlite3.Row]:
+        """
+        Get matching messages, newest first, with a highlighted snippet.
+
+        Args:
+            fts_query: Query built by _fts_query
+            limit: Maximum number of rows
+            before: Only return messages older than this (timestamp, seq) pair
+
+        Returns:
+            The matching rows, ordered by timestamp and seq, descending
+        """
+        # Sorted by timestamp rather than rowid: imported and restored
+        # messages get new rowids but keep their original timestamps. The
+        # sort keeps only the top limit rows.
+        timestamp, seq = before if before is not None else (None, None)
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+                SELECT m.seq, m.conversation_id, m.public_id AS id, m.role, m.timestamp,
+                       snippet(messages_fts, 0, '<mark>', '</mark>', '...', 16) AS snippet
+                FROM messages_fts
+                JOIN messages m ON m.seq = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND (? IS NULL OR (m.timestamp, m.seq) < (?, ?))
+                ORDER BY m.timestamp DESC, m.seq DESC
+                LIMIT ?
+                """,
+                (fts_query, seq, timestamp, seq, limit)
+            ).fetchall()
+
+    @staticmethod
+    def _row_to_search_hit(row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a row from _search_rows into a search result."""
+        return {
+            "conversation_id": row["conversation_id"],
+            "message_id": decode_id(row["id"]),
+            "role": decode_role(row["role"]),
+            "timestamp": decode_timestamp(row["timestamp"]),
+            "snippet": row["snippet"]
+        }
+
+    def search_messages(self, query: str, limit: int,
+                        before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Search message content by keywords, newest matches first.
+
+        Archived conversations are not searched until they are restored.
+
+        Args:
+            query: Keywords that must all appear; end a word with * to match it as a prefix
+            limit: Maximum number of results in the page
+            before: Cursor returned by the previous page
+
+        Returns:
+            The matching messages of the page and the cursor for the next page
+
+        Raises:
+            ValueError: If the query is empty or the cursor is invalid
+        """
+        fts_query = self._fts_query(query)
+        position = self._decode_cursor(before) if before is not None else None
+
+        rows = self._search_rows(fts_query, limit + 1, position)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more:
+            next_cursor = self._encode_cursor(rows[-1]["timestamp"], rows[-1]["seq"])
+
+        return [self._row_to_search_hit(row) for row in rows], next_cursor
+
+    def export_conversations(self, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Stream every conversation, live and archived, as export records.
+
+        Each conversation yields a "conversation" record followed by one
+        "message" record per message, oldest first. Rows are read in keyset
+        batches and no connection is held between batches, so memory stays
+        constant and the iterator may be advanced from different threads.
+
+        Args:
+            batch_size: Rows read per database call
+
+        Yields:
+            Export records
+        """
+        self.flush()
+
+        after = ""
+        while True:
+            with self.pool.connection() as conn:
+                conversations = conn.execute(
+                    """
+                    SELECT id, created_at FROM conversations
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (after, batch_size)
+                ).fetchall()
+            if not conversations:
+                break
+            after = conversations[-1]["id"]
+
+            for conversation in conversations:
+                yield {"type": "conversation", "id": conversation["id"],
+                       "created_at": conversation["created_at"]}
+                yield from self._export_messages(conversation["id"], batch_size)
+
+        after = ""
+        while True:
+            with self.pool.connection() as conn:
+                archived = conn.execute(
+                    """
+                    SELECT conversation_id, created_at, archive_file, archive_offset, archive_length
+                    FROM archived_conversations
+                    WHERE conversation_id > ?
+                    ORDER BY conversation_id
+                    LIMIT ?
+                    """,
+                    (after, batch_size)
+                ).fetchall()
+            if not archived:
+                break
+            after = archived[-1]["conversation_id"]
+
+            for entry in archived:
+                conversation_id = entry["conversation_id"]
+                record = self.archive.read(
+                    entry["archive_file"], entry["archive_offset"], entry["archive_length"]
+                )
+                yield {"type": "conversation", "id": conversation_id,
+                       "created_at": entry["created_at"]}
+                for message in record["messages"]:
+                    yield {"type": "message", "conversation_id": conversation_id, **message}
+
+    def _export_messages(self, conversation_id: str, batch_size: int) -> Iterator[Dict[str, Any]]:
+        """Stream the messages of a live conversation as export records, oldest first."""
+        position = (-1, -1)
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT seq, public_id AS id, role, content, timestamp, tool_calls, tool_results, tokens
+                    FROM messages
+                    WHERE conversation_id = ? AND (timestamp, seq) > (?, ?)
+                    ORDER BY timestamp, seq
+                    LIMIT ?
+                    """,
+                    (conversation_id, *position, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            position = (rows[-1]["timestamp"], rows[-1]["seq"])
+
+            for row in rows:
+                yield {"type": "message", "conversation_id": conversation_id,
+                       **self._row_to_message(row)}
+
+    def import_records(self, records: Iterable[Dict[str, Any]],
+                       skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+        """
+        Import a batch of export records in a single transaction.
+
+        Conversations that already exist are left untouched and their
+        messages are ignored. Pass the same ``skipped`` set to every batch of
+        one import so messages that arrive in a later batch are ignored too.
+
+        Args:
+            records: Records produced by export_conversations
+            skipped: IDs of conversations being skipped; updated in place
+
+        Returns:
+            Counts of imported conversations and messages and skipped conversations
+
+        Raises:
+            ValueError: If a record is malformed; nothing from the batch is written
+        """
+        if skipped is None:
+            skipped = set()
+        counts = {"conversations": 0, "messages": 0, "skipped": 0}
+
+        with self.pool.transaction() as conn:
+            for record in records:
+                try:
+                    record_type = record["type"]
+                    if record_type == "conversation":
+                        conversation_id = record["id"]
+                        if self._conversation_stored(conn, conversation_id):
+                            skipped.add(conversation_id)
+                            counts["skipped"] += 1
+                            continue
+
+                        created_at = record.get("created_at") or datetime.now().isoformat()
+                        conn.execute(
+                            "INSERT INTO conversations (id, created_at) VALUES (?, ?)",
+                            (conversation_id, created_at)
+                        )
+                        conn.execute(
+                            """
+                            INSERT INTO conversation_stats (conversation_id, created_at, message_count, last_activity)
+                            VALUES (?, ?, 0, ?)
+                            """,
+                            (conversation_id, created_at, created_at)
+                        )
+                        counts["conversations"] += 1
+
+                    elif record_type == "message":
+                        if record["conversation_id"] in skipped:
+                            continue
+                        self._insert_message(conn, self._encode_message(
+                            record["conversation_id"], record["role"], record["content"],
+                            record.get("tool_calls"), record.get("tool_results"),
+                            message_id=record.get("id"), timestamp=record.get("timestamp"),
+                        ))
+                        counts["messages"] += 1
+
+                    else:
+                        raise ValueError(f"Unknown record type: {record_type}")
+                except (KeyError, TypeError) as e:
+                    raise ValueError(f"Invalid import record: {e}") from e
+
+        logger.info(f"Imported {counts['conversations']} conversations and {counts['messages']} messages, "
+                    f"skipped {counts['skipped']} existing conversations")
+        return counts
+
+    @staticmethod
+    def _conversation_stored(conn: sqlite3.Connection, conversation_id: str) -> bool:
+        """Check whether a conversation is live or archived, inside the caller's transaction."""
+        return conn.execute(
+            """
+            SELECT 1 FROM conversations WHERE id = ?
+            UNION ALL
+            SELECT 1 FROM archived_conversations WHERE conversation_id = ?
+            """,
+            (conversation_id, conversation_id)
+        ).fetchone() is not None
+
+    def _restore_archived(self, conn: sqlite3.Connection, conversation_id: str) -> bool:
+        """
+        Move an archived conversation back into the live tables.
+
+        Runs inside the caller's transaction.
+
+        Args:
+            conn: Connection with an open transaction
+            conversation_id: ID of the conversation
+
+        Returns:
+            True if the conversation was archived and has been restored
+        """
+        entry = conn.execute(
+            """
+            SELECT created_at, archive_file, archive_offset, archive_length
+            FROM archived_conversations
+            WHERE conversation_id = ?
+            """,
+            (conversation_id,)
+        ).fetchone()
+        if entry is None:
+            return False
+
+        record = self.archive.read(
+            entry["archive_file"], entry["archive_offset"], entry["archive_length"]
+        )
+        created_at = entry["created_at"]
+
+        conn.execute(
+            "INSERT OR IGNORE INTO conversations (id, created_at) VALUES (?, ?)",
+            (conversation_id, created_at)
+        )
+        conn.execute(
+            "UPDATE conversations SET created_at = ? WHERE id = ?",
+            (created_at, conversation_id)
+        )
+        conn.execute(
+            """
+            INSERT INTO conversation_stats (conversation_id, created_at, message_count, last_activity)
+            VALUES (?, ?, 0, ?)
+            ON CONFLICT (conversation_id) DO UPDATE SET created_at = excluded.created_at
+            """,
+            (conversation_id, created_at, created_at)
+        )
+
+        summary = record["conversation"].get("summary")
+        if summary is not None:
+            conn.execute(
+                """
+                UPDATE conversations SET summary = ?, summary_through = ?, summary_tokens = ?
+                WHERE id = ?
+                """,
+                (summary["text"], summary["through"], summary["tokens"], conversation_id)
+            )
+
+        for message in record["messages"]:
+            self._insert_message(conn, self._encode_message(
+                conversation_id, message["role"], message["content"],
+                message.get("tool_calls"), message.get("tool_results"),
+                message_id=message["id"], timestamp=message["timestamp"],
+            ))
+
+        conn.execute(
+            "DELETE FROM archived_conversations WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+
+        logger.info(f"Restored archived conversation {conversation_id} "
+                    f"with {len(record['messages'])} messages")
+        return True
+
+    def _restore_if_archived(self, conversation_id: str) -> bool:
+        """
+        Restore a conversation from the archive if it is archived.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            True if the conversation was restored
+        """
+        with self.pool.transaction() as conn:
+            return self._restore_archived(conn, conversation_id)
+
+    def archive_idle_conversations(self, idle_days: float = ARCHIVE_AFTER_DAYS,
+                                   limit: int = RETENTION_BATCH_SIZE) -> List[str]:
+        """
+        Move conversations without recent activity into the archive.
+
+        The record is made durable before the live rows are deleted. A
+        conversation that receives a message while it is being archived is
+        skipped and stays live.
+
+        Args:
+            idle_days: Archive conversations idle for longer than this
+            limit: Maximum number of conversations to archive in this call
+
+        Returns:
+            IDs of the archived conversations
+        """
+        cutoff = (datetime.now() - timedelta(days=idle_days)).isoformat()
+
+        with self.pool.connection() as conn:
+            candidates = conn.execute(
+                """
+                SELECT conversation_id, created_at, message_count, last_activity
+                FROM conversation_stats
+                WHERE last_activity < ?
+                ORDER BY last_activity
+                LIMIT ?
+                """,
+                (cutoff, limit)
+            ).fetchall()
+
+        archived = []
+        for candidate in candidates:
+            conversation_id = candidate["conversation_id"]
+            self._wait_for_writes(conversation_id)
+
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT public_id AS id, role, content, timestamp, tool_calls, tool_results
+                    FROM messages
+                    WHERE conversation_id = ?
+                    ORDER BY timestamp, seq
+                    """,
+                    (conversation_id,)
+                ).fetchall()
+                summary_row = conn.execute(
+                    "SELECT summary, summary_through, summary_tokens FROM conversations WHERE id = ?",
+                    (conversation_id,)
+                ).fetchone()
+
+            conversation = {
+                "id": conversation_id,
+                "created_at": candidate["created_at"],
+            }
+            summary = self._row_to_summary(summary_row) if summary_row is not None else None
+            if summary is not None:
+                conversation["summary"] = summary
+
+            filename, offset, length = self.archive.append({
+                "conversation": conversation,
+                "messages": [self._row_to_message(row) for row in rows],
+            })
+
+            with self.pool.transaction() as conn:
+                # Only delete if nothing was written since we read the messages
+                cursor = conn.execute(
+                    """
+                    DELETE FROM conversations
+                    WHERE id = ? AND EXISTS (
+                        SELECT 1 FROM conversation_stats
+                        WHERE conversation_id = ? AND message_count = ? AND last_activity = ?
+                    )
+                    """,
+                    (conversation_id, conversation_id,
+                     candidate["message_count"], candidate["last_activity"])
+                )
+                if not cursor.rowcount:
+                    continue
+
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO archived_conversations
+                        (conversation_id, created_at, message_count, last_activity,
+                         archived_at, archive_file, archive_offset, archive_length)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (conversation_id, candidate["created_at"], candidate["message_count"],
+                     candidate["last_activity"], datetime.now().isoformat(),
+                     filename, offset, length)
+                )
+
+            archived.append(conversation_id)
+
+        if archived:
+            logger.info(f"Archived {len(archived)} idle conversations")
+        return archived
+
+    def purge_conversations(self, retention_days: float = RETENTION_DAYS,
+                            limit: int = RETENTION_BATCH_SIZE) -> List[str]:
+        """
+        Permanently delete live and archived conversations past the retention period.
+
+        Args:
+            retention_days: Delete conversations idle for longer than this
+            limit: Maximum number of live and of archived conversations to delete
+
+        Returns:
+            IDs of the purged conversations
+        """
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+
+        with self.pool.transaction() as conn:
+            live = [row[0] for row in conn.execute(
+                """
+                SELECT conversation_id FROM conversation_stats
+                WHERE last_activity < ?
+                ORDER BY last_activity
+                LIMIT ?
+                """,
+                (cutoff, limit)
+            )]
+            conn.executemany(
+                "DELETE FROM conversations WHERE id = ?",
+                [(conversation_id,) for conversation_id in live]
+            )
+
+            archived = [row[0] for row in conn.execute(
+                """
+                SELECT conversation_id FROM archived_conversations
+                WHERE last_activity < ?
+                ORDER BY last_activity
+                LIMIT ?
+                """,
+                (cutoff, limit)
+            )]
+            conn.executemany(
+                "DELETE FROM archived_conversations WHERE conversation_id = ?",
+                [(conversation_id,) for conversation_id in archived]
+            )
+
+            referenced = {row[0] for row in conn.execute(
+                "SELECT DISTINCT archive_file FROM archived_conversations"
+            )}
+
+        self.archive.remove_unreferenced(referenced)
+
+        purged = live + archived
+        if purged:
+            logger.info(f"Purged {len(purged)} conversations past the retention period")
+        return purged
+
+    def compact(self, pages: int = VACUUM_PAGES, full: bool = False) -> int:
+        """
+        Return free pages to the file system and truncate the WAL.
+
+        Args:
+            pages: Maximum number of free pages to release in this call
+            full: Convert a database created without incremental vacuum.
+                This rewrites the whole file and blocks writers while it runs.
+
+        Returns:
+            The number of pages released
+        """
+        with self.pool.connection() as conn:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if mode != 2:
+                if not full:
+                    logger.info(f"Incremental vacuum is not enabled for {self.db_path}; "
+                                "run python -m database.archive --vacuum once to convert it")
+                    return 0
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                logger.info(f"Converted {self.db_path} to incremental vacuum")
+
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            released = min(free_pages, pages)
+            if released:
+                # execute() stops after the first freed page; executescript
+                # steps the pragma to completion
+                conn.executescript(f"PRAGMA incremental_vacuum({released})")
+
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+        if released:
+            logger.info(f"Released {released} free pages from {self.db_path}")
+        return released
+
+    def run_retention(self, full_vacuum: bool = False) -> Dict[str, Any]:
+        """
+        Run one pass of archiving, purging and compaction.
+
+        Args:
+            full_vacuum: Convert the file to incremental vacuum if needed
+
+        Returns:
+            The archived and purged conversation IDs and the pages released
+        """
+        archived = []
+        if ARCHIVE_AFTER_DAYS > 0:
+            archived = self.archive_idle_conversations(ARCHIVE_AFTER_DAYS)
+
+        purged = []
+        if RETENTION_DAYS > 0:
+            purged = self.purge_conversations(RETENTION_DAYS)
+
+        released = self.compact(full=full_vacuum)
+
+        return {"archived": archived, "purged": purged, "pages_released": released}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get runtime metrics of the database layer.
+
+        Returns:
+            A dictionary of metric groups
+        """
+        metrics = {
+            "pool_size": self.pool.size,
+            "write_behind": self.write_behind is not None,
+        }
+        if self.write_behind is not None:
+            stats = self.write_behind.stats()
+            metrics["write_behind_queued"] = stats["queued"]
+            metrics["write_behind_retried"] = stats["retried"]
+            metrics["write_behind_dropped"] = stats["dropped"]
+        return {"database": metrics}
+
+    def get_conversations(self) -> List[Dict[str, Any]]:
+        """
+        Get a list of all conversations.
+
+        Returns:
+            List of conversations with their IDs and creation timestamps
+        """
+        return self.get_all_conversations()
+
+# For backward compatibility
+DriveThruDatabase = SQLiteDatabase
@@ -0,0 +1,433 @@
+import sqlite3
+import sys
+import time
+from typing import Iterable, List, Optional, Tuple, Union
+
+from config import logger
+from database.encoding import (
+    decode_payload,
+    encode_id,
+    encode_payload,
+    encode_role,
+    encode_timestamp,
+    register_functions,
+)
+
+# Online conversion of the messages table to storage format v2.
+#
+# The v2 rows are built in a shadow table, messages_v2, which keeps the v1
+# rowid as its integer key. Triggers on the live table log every rowid that
+# changes while the copy runs, so the copy can proceed in short
+# transactions next to a running server. Schema migration 7 then copies
+# whatever is left and swaps the tables in one transaction, but only if
+# little is left: a large table has to be copied with this tool first.
+#
+# The v2 full-text index keeps its own plain-text copy of each message,
+# so the schema works from any SQLite client without app-defined
+# functions. Triggers index plain TEXT content; the writer of a row whose
+# content is compressed indexes its text with index_text().
+
+# Most rows migration 7 copies while it blocks writers; more fail the
+# migration until the online conversion has run
+FINALIZE_MAX_ROWS = 10000
+
+
+def create_text_index(conn: sqlite3.Connection, table: str, fts: str) -> None:
+    """
+    Create a v2 full-text index and the triggers that keep it in sync.
+
+    Args:
+        conn: Connection with an open transaction
+        table: The v2 messages table
+        fts: Name of the index
+    """
+    conn.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5 (
+        content,
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    ''')
+    # Triggers also fire for rows removed by the conversations cascade
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS messages_text_insert AFTER INSERT ON {table}
+    WHEN typeof(new.content) = 'text' BEGIN
+        INSERT INTO {fts} (rowid, content) VALUES (new.seq, new.content);
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS messages_text_delete AFTER DELETE ON {table} BEGIN
+        DELETE FROM {fts} WHERE rowid = old.seq;
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS messages_text_update AFTER UPDATE OF content ON {table} BEGIN
+        DELETE FROM {fts} WHERE rowid = old.seq;
+        INSERT INTO {fts} (rowid, content) SELECT new.seq, new.content WHERE typeof(new.content) = 'text';
+    END
+    ''')
+
+
+def index_text(conn: sqlite3.Connection, fts: str,
+               rows: Iterable[Tuple[int, Union[bytes, str, None], Optional[str]]]) -> None:
+    """
+    Index the text of rows whose content is stored compressed.
+
+    Rows stored as plain text are indexed by the triggers and skipped.
+
+    Args:
+        conn: Connection with an open transaction
+        fts: Name of the index
+        rows: (seq, stored content, plain text) of the inserted rows
+    """
+    conn.executemany(
+        f"INSERT INTO {fts} (rowid, content) VALUES (?, ?)",
+        [(seq, text) for seq, stored, text in rows if isinstance(stored, bytes)]
+    )
+
+
+def rebuild_text_index(conn: sqlite3.Connection, table: str, fts: str) -> None:
+    """
+    Replace a full-text index that reads its text through inflate().
+
+    Indexes created before the index kept its own text were external-content
+    tables over the messages_text view, which no client without the app's
+    functions can write to. They are dropped and rebuilt from the table.
+
+    Args:
+        conn: Connection with an open transaction
+        table: The v2 messages table
+        fts: Name of the index
+    """
+    for event in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS messages_text_{event}")
+    conn.execute(f"DROP TABLE IF EXISTS {fts}")
+    conn.execute("DROP VIEW IF EXISTS messages_text")
+    create_text_index(conn, table, fts)
+
+    conn.execute(f"INSERT INTO {fts} (rowid, content) SELECT seq, content FROM {table} WHERE typeof(content) = 'text'")
+    cursor = conn.execute(f"SELECT seq, content FROM {table} WHERE typeof(content) = 'blob'")
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        index_text(conn, fts, ((seq, content, decode_payload(content)) for seq, content in rows))
+
+
+def uses_text_view(conn: sqlite3.Connection) -> bool:
+    """Whether the database has an index created over the messages_text view."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'messages_text'"
+    ).fetchone() is not None
+
+
+def prepare(conn: sqlite3.Connection) -> None:
+    """
+    Create the shadow table, its indexes and the change log.
+
+    Safe to call again on a database that is already being converted.
+
+    Args:
+        conn: Connection with an open transaction
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages_v2 (
+        seq INTEGER PRIMARY KEY,
+        public_id BLOB NOT NULL,
+        conversation_id TEXT NOT NULL,
+        role INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        content TEXT,
+        tool_calls TEXT,
+        tool_results TEXT,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation_time
+    ON messages_v2 (conversation_id, timestamp)
+    ''')
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_public_id
+    ON messages_v2 (public_id)
+    ''')
+    if uses_text_view(conn):
+        # Left by an earlier version of this tool
+        rebuild_text_index(conn, "messages_v2", "messages_fts_v2")
+    else:
+        create_text_index(conn, "messages_v2", "messages_fts_v2")
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages_v2_changes (
+        seq INTEGER PRIMARY KEY
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages_v2_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        copied_upto INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO messages_v2_progress (id, copied_upto) VALUES (0, 0)")
+
+    for event, ref in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_v2_log_{event.lower()} AFTER {event} ON messages BEGIN
+            INSERT OR IGNORE INTO messages_v2_changes (seq) VALUES ({ref}.rowid);
+        END
+        ''')
+
+
+def _copy_rows(conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> None:
+    """Write v1 rows into the shadow table, replacing earlier copies."""
+    # An explicit delete, because REPLACE would not fire the index triggers
+    conn.executemany(
+        "DELETE FROM messages_v2 WHERE seq = ?",
+        [(row[0],) for row in rows]
+    )
+    encoded = [
+        (seq, encode_id(message_id), conversation_id, encode_role(role),
+         encode_timestamp(timestamp), encode_payload(content),
+         encode_payload(tool_calls), encode_payload(tool_results))
+        for seq, message_id, conversation_id, role, content, timestamp, tool_calls, tool_results
+        in rows
+    ]
+    conn.executemany(
+        """
+        INSERT INTO messages_v2
+            (seq, public_id, conversation_id, role, timestamp, content, tool_calls, tool_results)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        encoded
+    )
+    index_text(conn, "messages_fts_v2",
+               ((row[0], encoded_row[5], row[4]) for row, encoded_row in zip(rows, encoded)))
+
+
+def _select_v1(conn: sqlite3.Connection, where: str, params: tuple) -> List[sqlite3.Row]:
+    """Read v1 message rows with their rowid."""
+    return conn.execute(
+        f"""
+        SELECT rowid, id, conversation_id, role, content, timestamp, tool_calls, tool_results
+        FROM messages
+        {where}
+        """,
+        params
+    ).fetchall()
+
+
+def copy_batch(conn: sqlite3.Connection, batch_size: int) -> int:
+    """
+    Copy the next batch of existing rows.
+
+    Args:
+        conn: Connection with an open transaction
+        batch_size: Maximum number of rows to copy
+
+    Returns:
+        The number of rows copied; 0 once every row has been copied
+    """
+    copied_upto = conn.execute(
+        "SELECT copied_upto FROM messages_v2_progress WHERE id = 0"
+    ).fetchone()[0]
+
+    rows = _select_v1(conn, "WHERE rowid > ? ORDER BY rowid LIMIT ?", (copied_upto, batch_size))
+    if rows:
+        _copy_rows(conn, rows)
+        conn.execute(
+            "UPDATE messages_v2_progress SET copied_upto = ? WHERE id = 0",
+            (rows[-1][0],)
+        )
+    return len(rows)
+
+
+def sync_changes(conn: sqlite3.Connection, batch_size: int) -> int:
+    """
+    Apply a batch of logged changes to rows that were already copied.
+
+    Args:
+        conn: Connection with an open transaction
+        batch_size: Maximum number of logged rows to apply
+
+    Returns:
+        The number of logged rows applied; 0 once the log is empty
+    """
+    changed = [row[0] for row in conn.execute(
+        "SELECT seq FROM messages_v2_changes ORDER BY seq LIMIT ?", (batch_size,)
+    )]
+    if not changed:
+        return 0
+
+    placeholders = ", ".join("?" * len(changed))
+    rows = _select_v1(conn, f"WHERE rowid IN ({placeholders})", tuple(changed))
+
+    conn.executemany("DELETE FROM messages_v2 WHERE seq = ?", [(seq,) for seq in changed])
+    _copy_rows(conn, rows)
+    conn.executemany("DELETE FROM messages_v2_changes WHERE seq = ?", [(seq,) for seq in changed])
+    return len(changed)
+
+
+def remaining_rows(conn: sqlite3.Connection, limit: int) -> int:
+    """
+    Count the rows finalize would still have to copy, up to a limit.
+
+    Args:
+        conn: Connection to the database
+        limit: Stop counting past this many rows
+
+    Returns:
+        The uncopied and changed rows, or limit + 1 if there are more
+    """
+    copied_upto = 0
+    changed = 0
+    has_progress = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_v2_progress'"
+    ).fetchone()
+    if has_progress:
+        copied_upto = conn.execute(
+            "SELECT copied_upto FROM messages_v2_progress WHERE id = 0"
+        ).fetchone()[0]
+        changed = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM messages_v2_changes LIMIT ?)", (limit + 1,)
+        ).fetchone()[0]
+
+    uncopied = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM messages WHERE rowid > ? LIMIT ?)", (copied_upto, limit + 1)
+    ).fetchone()[0]
+    return min(uncopied + changed, limit + 1)
+
+
+def finalize(conn: sqlite3.Connection, max_rows: Optional[int] = None) -> None:
+    """
+    Copy the remaining rows and replace the v1 table with the shadow table.
+
+    Args:
+        conn: Connection with an open transaction
+        max_rows: Refuse to run if more rows than this are left to copy
+            (default: no limit)
+
+    Raises:
+        RuntimeError: If more than max_rows rows are left to copy
+    """
+    if max_rows is not None:
+        remaining = remaining_rows(conn, max_rows)
+        if remaining > max_rows:
+            raise RuntimeError(
+                f"More than {max_rows} messages still need converting to storage format v2, "
+                "too many to copy while writers are blocked. Run python -m database.storage_format "
+                "<db_path> first (it copies in short transactions, so a running server can stay "
+                "up), then start the server again."
+            )
+
+    prepare(conn)
+
+    copied = 0
+    while True:
+        count = copy_batch(conn, 10000)
+        if not count:
+            break
+        copied += count
+    while sync_changes(conn, 10000):
+        pass
+    if copied:
+        logger.info(f"Converted {copied} remaining messages to storage format v2")
+
+    for event in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS messages_v2_log_{event}")
+        conn.execute(f"DROP TRIGGER IF EXISTS messages_fts_{event}")
+        conn.execute(f"DROP TRIGGER IF EXISTS messages_text_{event}")
+    conn.execute("DROP TABLE IF EXISTS messages_fts")
+    conn.execute("DROP TABLE messages")
+    conn.execute("DROP TABLE messages_v2_changes")
+    conn.execute("DROP TABLE messages_v2_progress")
+
+    conn.execute("ALTER TABLE messages_v2 RENAME TO messages")
+    conn.execute("ALTER TABLE messages_fts_v2 RENAME TO messages_fts")
+    create_text_index(conn, "messages", "messages_fts")
+
+
+def convert_online(conn: sqlite3.Connection, batch_size: int = 1000, pause: float = 0.01) -> int:
+    """
+    Copy every message into the shadow table in short transactions.
+
+    Writers are only blocked for one batch at a time. The change log stays
+    active afterwards, so writes that arrive later are picked up when
+    migration 7 swaps the tables.
+
+    Args:
+        conn: Connection to the database
+        batch_size: Rows per transaction
+        pause: Seconds to sleep between transactions
+
+    Returns:
+        The number of rows copied
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        prepare(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    copied = 0
+    for step in (copy_batch, sync_changes):
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = step(conn, batch_size)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            copied += count
+            # Stop once caught up; a busy server keeps adding rows, and
+            # the last few are copied when the tables are swapped
+            if count < batch_size:
+                break
+            time.sleep(pause)
+
+    return copied
+
+
+def main(argv: List[str]) -> int:
+    """
+    Convert a database to storage format v2 while the server keeps running.
+
+    Usage: python -m database.storage_format [db_path] [batch_size] [--finalize]
+
+    Without --finalize the tables are swapped by the next server start,
+    which only has to copy the rows written since this tool finished.
+    """
+    from database.migrations import get_schema_version, migrate
+
+    args = [arg for arg in argv[1:] if not arg.startswith("--")]
+    db_path = args[0] if args else "conversations.db"
+    batch_size = int(args[1]) if len(args) > 1 else 1000
+
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    conn.execute("PRAGMA foreign_keys=ON")
+    register_functions(conn)
+    try:
+        version = get_schema_version(conn)
+        if version >= 7:
+            print(f"{db_path} already uses storage format v2")
+            return 0
+        if version < 6:
+            migrate(conn, 6)
+
+        started = time.perf_counter()
+        copied = convert_online(conn, batch_size)
+        print(f"Copied {copied} messages in {time.perf_counter() - started:.1f}s")
+
+        if "--finalize" in argv:
+            migrate(conn, 7)
+            print(f"{db_path} now uses storage format v2")
+        else:
+            print("Restart the server to swap in the converted table")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,131 @@
+import json
+import sys
+from itertools import islice
+from typing import Dict, IO, Iterable, Iterator, List, Any, Union
+
+from config import IMPORT_BATCH_SIZE, logger
+
+
+def to_ndjson(record: Dict[str, Any]) -> str:
+    """Serialize an export record as one NDJSON line."""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def from_ndjson(line: Union[str, bytes], line_number: int = 0) -> Dict[str, Any]:
+    """
+    Parse one NDJSON line into an export record.
+
+    Raises:
+        ValueError: If the line is not a JSON object
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"Line {line_number}: invalid JSON: {e}") from e
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {line_number}: expected a JSON object")
+    return record
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Parse NDJSON lines lazily, skipping blank ones."""
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield from_ndjson(line, line_number)
+
+
+def batched(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group records into lists of at most ``size``."""
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_to(database, output: IO[str]) -> int:
+    """
+    Write every conversation of a database to a stream as NDJSON.
+
+    Args:
+        database: Storage backend to export
+        output: Text stream to write to
+
+    Returns:
+        The number of records written
+    """
+    count = 0
+    for record in database.export_conversations():
+        output.write(to_ndjson(record))
+        count += 1
+    return count
+
+
+def import_from(database, lines: Iterable[str], batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Import NDJSON export records into a database, one transaction per batch.
+
+    Args:
+        database: Storage backend to import into
+        lines: NDJSON lines
+        batch_size: Records per transaction
+
+    Returns:
+        Counts of imported conversations and messages and skipped conversations
+    """
+    totals = {"conversations": 0, "messages": 0, "skipped": 0}
+    skipped = set()
+    for batch in batched(read_ndjson(lines), batch_size):
+        for key, value in database.import_records(batch, skipped).items():
+            totals[key] += value
+    return totals
+
+
+def main(argv: List[str]) -> int:
+    """
+    Export or import conversations as NDJSON from the command line.
+
+    Usage:
+        python -m database.transfer export [db_path] [output.ndjson|-]
+        python -m database.transfer import [db_path] [input.ndjson|-]
+
+    The database is opened with the configured STORAGE_BACKEND, so on a
+    sharded deployment db_path is the base path the server uses.
+    """
+    from config import STORAGE_BACKEND
+    from database.registry import storage_registry
+
+    if len(argv) < 2 or argv[1] not in ("export", "import"):
+        print(main.__doc__.strip())
+        return 2
+
+    command = argv[1]
+    db_path = argv[2] if len(argv) > 2 else "conversations.db"
+    path = argv[3] if len(argv) > 3 else "-"
+
+    database = storage_registry.create_backend(STORAGE_BACKEND, db_path)
+    try:
+        if command == "export":
+            stream = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+            try:
+                count = export_to(database, stream)
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+            logger.info(f"Exported {count} records from {db_path}")
+        else:
+            stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+            try:
+                totals = import_from(database, stream)
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+            print(json.dumps(totals))
+    finally:
+        database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
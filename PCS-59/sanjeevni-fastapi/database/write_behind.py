@@ -0,0 +1,247 @@
+import atexit
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from config import (
+    DATABASE_WRITE_BATCH_SIZE,
+    DATABASE_WRITE_INTERVAL_MS,
+    DATABASE_WRITE_RETRIES,
+    logger,
+)
+
+
+class WriteBehindQueue:
+    """
+    Background writer that group-commits queued rows.
+
+    Rows from any number of conversations are collected for a short interval
+    (or until the batch is full) and handed to ``write_batch`` together, so
+    one transaction and one fsync cover many messages. Readers call
+    ``wait_for`` to see their own conversation's queued rows.
+
+    A batch that fails is retried with backoff, then written row by row so
+    one bad row cannot take the others with it. Rows that still fail are
+    dropped, counted, and reported: the next ``wait_for`` of their
+    conversation and the next ``flush`` raise, since the caller of
+    ``submit`` was already told the write succeeded.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], None],
+                 batch_size: int = DATABASE_WRITE_BATCH_SIZE,
+                 interval_ms: float = DATABASE_WRITE_INTERVAL_MS,
+                 retries: int = DATABASE_WRITE_RETRIES):
+        """
+        Initialize the queue and start the writer thread.
+
+        Args:
+            write_batch: Function that writes a list of rows in one
+                transaction, raising if it can't
+            batch_size: Maximum number of rows per transaction
+            interval_ms: How long to wait for more rows before committing
+            retries: How often a failed batch is retried before it is
+                written row by row
+        """
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.retries = retries
+
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._pending_by_conversation: Dict[str, int] = {}
+        self._submitted = 0
+        self._written = 0
+        self._flush_requested = False
+        self._closed = False
+        # Last write error per conversation, and of any conversation for flush()
+        self._errors: Dict[str, Exception] = {}
+        self._flush_error: Optional[Exception] = None
+        self._retried = 0
+        self._dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, conversation_id: str, row: Dict[str, Any]) -> None:
+        """
+        Queue a row for writing.
+
+        Args:
+            conversation_id: Conversation the row belongs to
+            row: The row to pass to write_batch
+
+        Raises:
+            RuntimeError: If the queue has been closed
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+
+            self._pending.append((conversation_id, row))
+            self._pending_by_conversation[conversation_id] = (
+                self._pending_by_conversation.get(conversation_id, 0) + 1
+            )
+            self._submitted += 1
+
+            self._cond.notify_all()
+
+    def pending(self, conversation_id: str) -> int:
+        """Get the number of queued rows for a conversation."""
+        with self._cond:
+            return self._pending_by_conversation.get(conversation_id, 0)
+
+    def queued(self) -> int:
+        """Get the total number of rows waiting to be written."""
+        with self._cond:
+            return self._submitted - self._written
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get queue counters.
+
+        Returns:
+            Rows waiting to be written, batches retried and rows dropped
+        """
+        with self._cond:
+            return {
+                "queued": self._submitted - self._written,
+                "retried": self._retried,
+                "dropped": self._dropped,
+            }
+
+    def wait_for(self, conversation_id: str) -> None:
+        """
+        Block until every queued row of a conversation has been written.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Raises:
+            RuntimeError: If rows of the conversation were dropped since the
+                last call; the error is reported once
+        """
+        with self._cond:
+            if self._pending_by_conversation.get(conversation_id):
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait_for(
+                    lambda: not self._pending_by_conversation.get(conversation_id)
+                )
+
+            error = self._errors.pop(conversation_id, None)
+        if error is not None:
+            raise RuntimeError(
+                f"Queued messages of conversation {conversation_id} could not be written: {error}"
+            ) from error
+
+    def flush(self) -> None:
+        """
+        Block until every row submitted so far has been written.
+
+        Raises:
+            RuntimeError: If any rows were dropped since the last flush
+        """
+        with self._cond:
+            target = self._submitted
+            if self._written < target:
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self._written >= target)
+
+            error, self._flush_error = self._flush_error, None
+        if error is not None:
+            raise RuntimeError(f"Queued messages could not be written: {error}") from error
+
+    def close(self) -> None:
+        """Write all queued rows and stop the writer thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self._dropped:
+            logger.error(f"Write-behind queue closed; {self._dropped} rows could not be written")
+        else:
+            logger.info("Write-behind queue flushed and closed")
+
+    def _next_batch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Wait for rows and take the next batch, or return [] once closed and drained."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed)
+            if not self._pending:
+                return []
+
+            # Give other conversations a moment to join this transaction
+            deadline = time.monotonic() + self.interval
+            while not (self._flush_requested or self._closed
+                       or len(self._pending) >= self.batch_size):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._flush_requested = self._flush_requested and bool(self._pending)
+            return batch
+
+    def _run(self) -> None:
+        """Writer thread loop."""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            failed = self._write(batch)
+
+            with self._cond:
+                for conversation_id, error in failed:
+                    self._errors[conversation_id] = error
+                    self._flush_error = error
+                self._dropped += len(failed)
+                for conversation_id, _ in batch:
+                    remaining = self._pending_by_conversation[conversation_id] - 1
+                    if remaining:
+                        self._pending_by_conversation[conversation_id] = remaining
+                    else:
+                        del self._pending_by_conversation[conversation_id]
+                self._written += len(batch)
+                self._cond.notify_all()
+
+    def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Exception]]:
+        """
+        Write a batch, retrying it and then falling back to one row at a time.
+
+        Returns:
+            The conversation and error of every row that could not be written
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                self.write_batch([row for _, row in batch])
+                return []
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                with self._cond:
+                    self._retried += 1
+                logger.warning(f"Write-behind batch of {len(batch)} rows failed, retrying: {error}")
+                time.sleep(0.05 * 2 ** attempt)
+
+        if len(batch) == 1:
+            logger.error(f"Dropped queued row for conversation {batch[0][0]}: {error}", exc_info=error)
+            return [(batch[0][0], error)]
+
+        logger.error(f"Write-behind batch of {len(batch)} rows failed, writing rows individually: {error}")
+        failed = []
+        for conversation_id, row in batch:
+            try:
+                self.write_batch([row])
+            except Exception as e:
+                logger.error(f"Dropped queued row for conversation {conversation_id}: {e}", exc_info=e)
+                failed.append((conversation_id, e))
+        return failed
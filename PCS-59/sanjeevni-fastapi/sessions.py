@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config import SESSION_REGISTRY_SIZE, SESSION_TTL_SECONDS
+
+
+class _Session:
+    """Metadata of one active conversation."""
+
+    __slots__ = ("created_at", "last_activity", "expires_at")
+
+    def __init__(self, created_at: str, last_activity: str, expires_at: float):
+        self.created_at = created_at
+        self.last_activity = last_activity
+        self.expires_at = expires_at
+
+
+class SessionRegistry:
+    """
+    Bounded, expiring registry of recently used conversations.
+
+    Lets the API answer "does this conversation exist, and when was it
+    created" without a database round trip for conversations in active use.
+    Entries hold only the timestamps the database reported, are dropped in
+    LRU order once the registry is full, and expire after a period without
+    use, so memory stays flat however many conversations a worker serves.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_REGISTRY_SIZE,
+                 ttl: float = SESSION_TTL_SECONDS):
+        """
+        Initialize the registry.
+
+        Args:
+            max_sessions: Maximum number of sessions kept
+            ttl: Seconds a session stays registered after its last use
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a session and extend its lifetime.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            The session's created_at and last_activity, or None if it isn't registered
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None and session.expires_at <= now:
+                del self._sessions[conversation_id]
+                self.expirations += 1
+                session = None
+
+            if session is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(conversation_id)
+            return {"created_at": session.created_at, "last_activity": session.last_activity}
+
+    def put(self, conversation_id: str, info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Register or refresh a session from a conversation summary.
+
+        Args:
+            conversation_id: ID of the conversation
+            info: Summary from the database, with created_at and last_activity
+
+        Returns:
+            The session's created_at and last_activity
+        """
+        if self.max_sessions <= 0:
+            return {"created_at": info["created_at"], "last_activity": info["last_activity"]}
+
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[conversation_id] = _Session(
+                info["created_at"], info["last_activity"], now + self.ttl
+            )
+            self._sessions.move_to_end(conversation_id)
+            self._evict(now)
+
+        return {"created_at": info["created_at"], "last_activity": info["last_activity"]}
+
+    def _evict(self, now: float) -> None:
+        """Drop expired sessions from the old end, then trim to the size limit."""
+        # Sessions are ordered by last use, so expired ones collect at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def remove(self, conversation_id: str) -> None:
+        """
+        Unregister a session.
+
+        Args:
+            conversation_id: ID of the conversation
+        """
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def clear(self) -> None:
+        """Unregister every session."""
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry counters.
+
+        Returns:
+            Size, limits, hits, misses, evictions and expirations
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,23 @@
+from speech.cache import AudioCache
+from speech.synthesis import synthesize, find_speech, synthesize_gtts, synthesize_pyttsx3, init_pyttsx3_engine
+from speech.segments import split_sentences, join_audio
+from speech.lipsync import compute_cues, decode_audio, write_cues
+from speech.executor import SpeechExecutor
+from speech.jobs import SpeechJobs
+
+# Export the speech classes and functions
+__all__ = [
+    'AudioCache',
+    'synthesize',
+    'find_speech',
+    'synthesize_gtts',
+    'synthesize_pyttsx3',
+    'init_pyttsx3_engine',
+    'split_sentences',
+    'join_audio',
+    'compute_cues',
+    'decode_audio',
+    'write_cues',
+    'SpeechExecutor',
+    'SpeechJobs',
+]
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+
+from config import AUDIO_CACHE_MAX_MB, AUDIO_DIR, AUDIO_PARTIAL_MAX_AGE_SECONDS, logger
+
+# Cached files are named by their key; anything else in the directory is left alone
+_CACHE_FILE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+_PARTIAL_FILE = re.compile(r"^[0-9a-f]{64}\.[0-9a-f]+\.partial\.[a-z0-9]+$")
+
+
+class AudioCache:
+    """
+    Content-addressed store of synthesized speech with a disk quota.
+
+    Files are named by a hash of the engine, language and full text, so a
+    phrase that was spoken before is served from disk instead of being
+    synthesized again. An in-memory index tracks file sizes in LRU order,
+    and the least recently used files are deleted once the quota is exceeded.
+    Files written by other worker processes sharing the directory are
+    picked up when they are looked up.
+
+    The cache is used from the event loop only; synthesis itself runs
+    elsewhere and is awaited.
+    """
+
+    def __init__(self, directory: str = AUDIO_DIR, max_bytes: int = int(AUDIO_CACHE_MAX_MB * 2 ** 20),
+                 partial_max_age: float = AUDIO_PARTIAL_MAX_AGE_SECONDS):
+        """
+        Initialize the cache, indexing the files already on disk.
+
+        Args:
+            directory: Directory the audio files are stored in
+            max_bytes: Disk quota for cached files (0 disables eviction)
+            partial_max_age: Seconds after which a temporary file is
+                considered abandoned and deleted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.partial_max_age = partial_max_age
+        os.makedirs(directory, exist_ok=True)
+
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        # Phrases being synthesized, so concurrent requests for one phrase synthesize it once
+        self._pending: Dict[str, "asyncio.Future[str]"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.partials_removed = 0
+        self._next_sweep = 0.0
+
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Index existing cache files, least recently modified first."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and _CACHE_FILE.match(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._index[name] = size
+            self._bytes += size
+
+        self._evict()
+        logger.info(f"Indexed {len(self._index)} cached audio files ({self._bytes} bytes) in {self.directory}")
+
+    @staticmethod
+    def key(engine: str, lang: str, text: str) -> str:
+        """
+        Get the cache key of a phrase.
+
+        Args:
+            engine: Name of the TTS engine
+            lang: The language code
+            text: The full text
+
+        Returns:
+            Hex SHA-256 digest of the engine, language and text
+        """
+        return hashlib.sha256(f"{engine}\0{lang}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, name: str) -> Optional[str]:
+        """Get the path of a cached file and mark it recently used."""
+        path = os.path.join(self.directory, name)
+        if name not in self._index:
+            # Written by another worker process sharing the directory
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return None
+            self._index[name] = size
+            self._bytes += size
+            self._evict(keep=name)
+            return path
+        if not os.path.exists(path):
+            # Removed behind our back
+            self._bytes -= self._index.pop(name)
+            return None
+        self._index.move_to_end(name)
+        return path
+
+    def find(self, engine: str, lang: str, text: str, extension: str) -> Optional[str]:
+        """
+        Get cached speech without synthesizing it on a miss.
+
+        Args:
+            engine: Name of the TTS engine
+            lang: The language code
+            text: The full text
+            extension: File extension the engine writes
+
+        Returns:
+            Path of the cached file, or None if it isn't cached
+        """
+        return self._lookup(f"{self.key(engine, lang, text)}.{extension}")
+
+    async def get_or_create(self, engine: str, lang: str, text: str, extension: str,
+                            create: Callable[[str], Awaitable[None]]) -> Tuple[str, bool]:
+        """
+        Get cached speech, synthesizing and storing it on a miss.
+
+        Args:
+            engine: Name of the TTS engine
+            lang: The language code
+            text: The full text
+            extension: File extension the engine writes
+            create: Coroutine function that writes the speech to the path it is given
+
+        Returns:
+            Path of the cached file and whether it was a cache hit
+
+        Raises:
+            Exception: Whatever create raises; nothing is cached then
+        """
+        key = self.key(engine, lang, text)
+        name = f"{key}.{extension}"
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Someone else is synthesizing this phrase; share their result
+            self.hits += 1
+            return await asyncio.shield(pending), True
+
+        path = self._lookup(name)
+        if path is not None:
+            self.hits += 1
+            return path, True
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        # Failures are reported to the caller; mark them retrieved so asyncio doesn't warn
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[key] = future
+        try:
+            path = os.path.join(self.directory, name)
+            # Written under a temporary name so readers never see a partial
+            # file; the extension is kept since some engines pick the format by it.
+            # Every attempt gets its own name, since a synthesis that timed out
+            # keeps running and may still write its file after we gave up on it
+            partial = os.path.join(self.directory, f"{key}.{uuid.uuid4().hex}.partial.{extension}")
+            try:
+                await create(partial)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+
+            size = os.path.getsize(path)
+            self._index[name] = size
+            self._bytes += size
+            self._evict(keep=name)
+            future.set_result(path)
+            return path, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._pending[key]
+
+    def _sweep_partials(self) -> None:
+        """Delete temporary files left by syntheses that were abandoned or interrupted."""
+        cutoff = time.time() - self.partial_max_age
+        for entry in os.scandir(self.directory):
+            if not _PARTIAL_FILE.match(entry.name):
+                continue
+            try:
+                if entry.stat().st_mtime <= cutoff:
+                    os.remove(entry.path)
+                    self.partials_removed += 1
+            except OSError:
+                pass
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Delete abandoned temporary files, then least recently used files until the cache fits its quota."""
+        # Another worker may still be writing a recent temporary file, so
+        # only old ones are deleted, at most once per partial_max_age
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.partial_max_age
+            self._sweep_partials()
+
+        if self.max_bytes <= 0:
+            return
+        while self._bytes > self.max_bytes and self._index:
+            name, size = next(iter(self._index.items()))
+            if name == keep:
+                break
+            del self._index[name]
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+
+        Returns:
+            File count, size, quota, hits, misses, hit rate, evictions,
+            abandoned temporary files removed and phrases being synthesized
+        """
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "partials_removed": self.partials_removed,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Any, Optional, Set
+
+from config import SPEECH_PROCESSES, SPEECH_THREADS, SPEECH_TIMEOUT_SECONDS, logger
+from speech.synthesis import init_pyttsx3_engine
+
+
+class _Pool:
+    """One worker pool and the jobs submitted to it."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = None
+        self.jobs: Set[Future] = set()
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def stats(self) -> Dict[str, Any]:
+        running = sum(1 for job in self.jobs if job.running())
+        return {
+            "workers": self.workers,
+            "queued": len(self.jobs) - running,
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+        }
+
+
+class SpeechExecutor:
+    """
+    Worker pools that run the blocking TTS engines off the event loop.
+
+    Network-bound engines run on a thread pool. Engines that synthesize
+    locally run on a process pool whose workers initialize their engine
+    once and reuse it for every job, so they neither hold the GIL nor pay
+    the engine's startup cost per reply. Every job has a timeout.
+    """
+
+    def __init__(self, threads: int = SPEECH_THREADS, processes: int = SPEECH_PROCESSES,
+                 timeout: float = SPEECH_TIMEOUT_SECONDS):
+        """
+        Initialize the pools. Worker processes are started on first use.
+
+        Args:
+            threads: Number of worker threads
+            processes: Number of worker processes (0 runs process jobs on the threads)
+            timeout: Seconds a job may take, including time spent queued
+        """
+        self.timeout = timeout
+        self._threads = _Pool(threads)
+        self._threads.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="tts")
+        self._processes = _Pool(processes)
+
+    def _process_executor(self) -> ProcessPoolExecutor:
+        """Get the process pool, starting it if needed."""
+        if self._processes.executor is None:
+            # Spawned, not forked, since the server process has threads running
+            self._processes.executor = ProcessPoolExecutor(
+                max_workers=self._processes.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_pyttsx3_engine,
+            )
+            logger.info(f"Started {self._processes.workers} TTS worker processes")
+        return self._processes.executor
+
+    async def _run(self, pool: _Pool, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run a job on a pool and wait for it.
+
+        Raises:
+            asyncio.TimeoutError: If the job didn't finish in time. A job that
+                hasn't started is dropped; one that has runs to completion.
+        """
+        job = pool.executor.submit(func, *args)
+        pool.jobs.add(job)
+        job.add_done_callback(pool.jobs.discard)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            pool.timeouts += 1
+            logger.warning(f"TTS job {getattr(func, '__name__', func)} timed out")
+            raise
+        except Exception:
+            pool.failed += 1
+            raise
+        pool.completed += 1
+        return result
+
+    async def run_in_thread(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run a blocking job on the thread pool.
+
+        Args:
+            func: The blocking function
+            *args: Arguments for the function
+            timeout: Seconds the job may take (default: the executor's timeout)
+
+        Returns:
+            The function's return value
+
+        Raises:
+            asyncio.TimeoutError: If the job didn't finish in time
+        """
+        return await self._run(self._threads, func, *args, timeout=timeout)
+
+    async def run_in_process(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run a job on the process pool.
+
+        The function and its arguments must be picklable; the function runs
+        in a worker whose engine init_pyttsx3_engine already set up.
+
+        Args:
+            func: A module-level function
+            *args: Arguments for the function
+            timeout: Seconds the job may take (default: the executor's timeout)
+
+        Returns:
+            The function's return value
+
+        Raises:
+            asyncio.TimeoutError: If the job didn't finish in time
+        """
+        if self._processes.workers <= 0:
+            return await self.run_in_thread(func, *args, timeout=timeout)
+
+        pool = self._processes
+        self._process_executor()
+        try:
+            return await self._run(pool, func, *args, timeout=timeout)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next job
+            if pool.executor is not None:
+                logger.error("TTS worker process died; restarting the pool")
+                pool.executor.shutdown(wait=False, cancel_futures=True)
+                pool.executor = None
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and job counters of both pools.
+
+        Returns:
+            Workers, queued and running jobs, and completed, failed and
+            timed-out totals per pool
+        """
+        return {"threads": self._threads.stats(), "processes": self._processes.stats()}
+
+    def shutdown(self) -> None:
+        """Stop both pools, dropping queued jobs."""
+        for pool in (self._threads, self._processes):
+            if pool.executor is not None:
+                pool.executor.shutdown(wait=False, cancel_futures=True)
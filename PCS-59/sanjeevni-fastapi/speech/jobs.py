@@ -0,0 +1,488 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, List, Optional, Set, Tuple
+
+from config import (
+    API_PREFIX,
+    SPEECH_JOBS_MAX,
+    SPEECH_JOB_TTL_SECONDS,
+    SPEECH_POLL_SECONDS,
+    logger,
+)
+from speech.cache import AudioCache
+from speech.executor import SpeechExecutor
+from speech.lipsync import write_cues
+from speech.segments import join_audio, split_sentences
+from speech.synthesis import find_speech, synthesize
+
+# Job IDs that are safe to use as manifest file names
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def _retrieve(task: asyncio.Future) -> None:
+    """Mark a task's failure retrieved; it is reported elsewhere, so asyncio shouldn't warn."""
+    if not task.cancelled():
+        task.exception()
+
+
+class _SpeechJob:
+    """Synthesis of one reply: one task per segment, and one for the whole reply."""
+
+    __slots__ = ("segments", "task", "expires_at")
+
+    def __init__(self, segments: "List[asyncio.Task[str]]", task: "asyncio.Task[str]", expires_at: float):
+        self.segments = segments
+        self.task = task
+        self.expires_at = expires_at
+
+
+class SpeechJobs:
+    """
+    Background speech synthesis keyed by message ID.
+
+    Replies are returned as soon as their text is stored; their audio is
+    synthesized by a job and fetched later by URL. Finished jobs are kept
+    for a while so the audio can be fetched, then forgotten, oldest first
+    once the limit is reached.
+
+    A reply is split into sentences that are synthesized concurrently and
+    served as numbered segments, so playback can start with the first
+    sentence. The audio of the whole reply is the segments joined.
+
+    Lipsync cues are computed from each audio file as soon as it is
+    synthesized and cached next to it, so they are ready with the audio.
+
+    Each job also leaves a manifest of its sentences in the cache
+    directory. Audio files are named after their content, so a worker
+    process that didn't run the job can find its audio on disk and wait
+    for it there.
+    """
+
+    def __init__(self, cache: Optional[AudioCache] = None, executor: Optional[SpeechExecutor] = None,
+                 max_jobs: int = SPEECH_JOBS_MAX, ttl: float = SPEECH_JOB_TTL_SECONDS):
+        """
+        Initialize the job registry.
+
+        Args:
+            cache: Cache audio files are looked up in and written to
+                (default: a cache in AUDIO_DIR)
+            executor: Worker pools the TTS engines run on (default: a new one)
+            max_jobs: Maximum number of jobs remembered
+            ttl: Seconds a job is remembered after it was submitted
+        """
+        self.cache = cache if cache is not None else AudioCache()
+        self.executor = executor if executor is not None else SpeechExecutor()
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+
+        self._jobs: "OrderedDict[str, _SpeechJob]" = OrderedDict()
+        self._prefetches: "Set[asyncio.Task[str]]" = set()
+        self._manifests = os.path.join(self.cache.directory, "jobs")
+        os.makedirs(self._manifests, exist_ok=True)
+        self._next_sweep = 0.0
+
+        self.submitted = 0
+        self.prefetched = 0
+        self.completed = 0
+        self.failed = 0
+
+    @staticmethod
+    def url_for(job_id: str, index: Optional[int] = None) -> str:
+        """
+        Get the URL the audio of a job, or of one of its segments, is served from.
+
+        Args:
+            job_id: ID of the job
+            index: Number of the segment (default: the whole reply)
+
+        Returns:
+            The audio URL path
+        """
+        if index is None:
+            return f"{API_PREFIX}/audio/{job_id}"
+        return f"{API_PREFIX}/audio/{job_id}/segments/{index}"
+
+    def submit(self, job_id: str, text: str, lang: str = "en") -> str:
+        """
+        Start synthesizing speech in the background.
+
+        Must be called from the event loop.
+
+        Args:
+            job_id: ID of the job, normally the ID of the message being spoken
+            text: The text to convert to speech
+            lang: The language code
+
+        Returns:
+            The URL the audio will be served from
+        """
+        loop = asyncio.get_running_loop()
+        sentences = split_sentences(text)
+        segments = [loop.create_task(self._speak(sentence, lang)) for sentence in sentences]
+        task = loop.create_task(self._run(job_id, segments, lang))
+        for t in (*segments, task):
+            t.add_done_callback(_retrieve)
+
+        self._jobs[job_id] = _SpeechJob(segments, task, time.monotonic() + self.ttl)
+        self._jobs.move_to_end(job_id)
+        self.submitted += 1
+        self._write_manifest(job_id, sentences, lang)
+        self._evict()
+        return self.url_for(job_id)
+
+    def _manifest_path(self, job_id: str) -> Optional[str]:
+        """Get the path of a job's manifest, or None if the ID can't be a file name."""
+        if not _JOB_ID.match(job_id):
+            return None
+        return os.path.join(self._manifests, f"{job_id}.json")
+
+    def _write_manifest(self, job_id: str, sentences: List[str], lang: str) -> None:
+        """Record the sentences of a job so other worker processes can find its audio."""
+        path = self._manifest_path(job_id)
+        if path is None or not sentences:
+            return
+        partial = f"{path}.{os.getpid()}.partial"
+        try:
+            with open(partial, "w") as f:
+                json.dump({"lang": lang, "segments": sentences}, f)
+            os.replace(partial, path)
+        except OSError as e:
+            # Only other workers need it; this one serves the job from memory
+            logger.warning(f"Could not write the speech manifest of {job_id}: {e!r}")
+
+    def _read_manifest(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Read the manifest of a job submitted by any worker, or None if it is unknown or expired."""
+        path = self._manifest_path(job_id)
+        if path is None:
+            return None
+        try:
+            if os.path.getmtime(path) + self.ttl <= time.time():
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sweep_manifests(self) -> None:
+        """Delete the manifests of expired jobs."""
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self._manifests):
+            try:
+                if entry.stat().st_mtime <= cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _find(self, manifest: Dict[str, Any], index: Optional[int]) -> Optional[str]:
+        """Find the audio of a job, or of one of its segments, on disk."""
+        lang, sentences = manifest["lang"], manifest["segments"]
+        if index is not None:
+            return find_speech(sentences[index], lang, self.cache)
+
+        paths = [find_speech(sentence, lang, self.cache) for sentence in sentences]
+        if not paths or None in paths:
+            return None
+        if len(paths) == 1:
+            return paths[0]
+        return self.cache.find("joined", lang, *self._joined_key(paths))
+
+    async def _wait_on_disk(self, manifest: Dict[str, Any], timeout: float, index: Optional[int]) -> str:
+        """
+        Wait for another worker to store the audio of a job.
+
+        Returns:
+            Path of the audio file
+
+        Raises:
+            asyncio.TimeoutError: If the audio isn't stored within the timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            path = self._find(manifest, index)
+            if path is not None:
+                return path
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(min(SPEECH_POLL_SECONDS, remaining))
+
+    def prefetch(self, sentences: List[str], lang: str = "en") -> None:
+        """
+        Start synthesizing sentences of a reply that is still being generated.
+
+        The audio lands in the cache, where the reply's job picks it up once
+        the reply is submitted, so speech can start as soon as generation ends.
+        Must be called from the event loop.
+
+        Args:
+            sentences: Complete sentences, as split_sentences returns them
+            lang: The language code
+        """
+        loop = asyncio.get_running_loop()
+        for sentence in sentences:
+            task = loop.create_task(self._speak(sentence, lang))
+            task.add_done_callback(_retrieve)
+            task.add_done_callback(self._prefetches.discard)
+            self._prefetches.add(task)
+            self.prefetched += 1
+
+    async def _cues(self, audio_path: str) -> str:
+        """
+        Get the cached lipsync cues of an audio file, computing them on a miss.
+
+        Returns:
+            Path of the JSON file with the cues
+        """
+        # Named after the audio file, which is named after its content
+        path, _ = await self.cache.get_or_create(
+            "lipsync", "", os.path.basename(audio_path), "json",
+            lambda filepath: self.executor.run_in_thread(write_cues, audio_path, filepath)
+        )
+        return path
+
+    async def _with_cues(self, audio_path: str) -> str:
+        """Compute the lipsync cues of a new audio file; failing that only costs the cues."""
+        try:
+            await self._cues(audio_path)
+        except Exception as e:
+            logger.warning(f"Could not compute lipsync cues for {audio_path}: {e!r}")
+        return audio_path
+
+    async def _speak(self, sentence: str, lang: str) -> str:
+        """
+        Synthesize one segment and compute its lipsync cues.
+
+        Returns:
+            Path of the audio file
+        """
+        return await self._with_cues(await synthesize(sentence, lang, self.cache, self.executor))
+
+    async def _run(self, job_id: str, segments: "List[asyncio.Task[str]]", lang: str) -> str:
+        """
+        Wait for the segments of one job and join them.
+
+        Returns:
+            Path of the audio file
+        """
+        started = time.monotonic()
+        try:
+            if not segments:
+                raise ValueError("No text to speak")
+            paths = await asyncio.gather(*segments)
+            if len(paths) == 1:
+                path = paths[0]
+            else:
+                path, _ = await self.cache.get_or_create(
+                    "joined", lang, *self._joined_key(paths),
+                    lambda filepath: self.executor.run_in_thread(join_audio, paths, filepath)
+                )
+                await self._with_cues(path)
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        logger.info(f"Synthesized speech for {job_id} ({len(segments)} segments) "
+                    f"in {time.monotonic() - started:.2f}s")
+        return path
+
+    @staticmethod
+    def _joined_key(paths: List[str]) -> Tuple[str, str]:
+        """
+        Get the cache text and extension of the audio joined from segments.
+
+        Named after the segments, which are named after their content.
+        """
+        return "\n".join(os.path.basename(p) for p in paths), os.path.splitext(paths[0])[1].lstrip(".")
+
+    def _evict(self) -> None:
+        """Forget expired jobs, then the oldest ones beyond the limit."""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.ttl
+            self._sweep_manifests()
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if job.expires_at > now and len(self._jobs) <= self.max_jobs:
+                break
+            # A job still running is forgotten but left to finish its file
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> Optional[str]:
+        """
+        Get the state of a job.
+
+        Args:
+            job_id: ID of the job
+
+        Returns:
+            "pending", "ready" or "failed", or None if the job is unknown;
+            a job of another worker is "pending" until its audio is stored
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            manifest = self._read_manifest(job_id)
+            if manifest is None:
+                return None
+            return "ready" if self._find(manifest, None) is not None else "pending"
+        if not job.task.done():
+            return "pending"
+        if job.task.cancelled() or job.task.exception() is not None:
+            return "failed"
+        return "ready"
+
+    def segment_urls(self, job_id: str) -> List[str]:
+        """
+        Get the URLs the segments of a job are served from.
+
+        Args:
+            job_id: ID of the job
+
+        Returns:
+            The segment URL paths in order (empty if the job is unknown)
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            count = len(job.segments)
+        else:
+            manifest = self._read_manifest(job_id)
+            count = len(manifest["segments"]) if manifest is not None else 0
+        return [self.url_for(job_id, index) for index in range(count)]
+
+    @staticmethod
+    async def _await(task: "asyncio.Task[str]", timeout: float) -> str:
+        """Wait for a synthesis task without cancelling it if the wait is given up."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise RuntimeError("Speech synthesis was cancelled") from None
+            raise
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Speech synthesis failed: {e}") from e
+
+    async def wait(self, job_id: str, timeout: float, index: Optional[int] = None) -> str:
+        """
+        Wait for the audio of a job, or of one of its segments.
+
+        Args:
+            job_id: ID of the job
+            timeout: Maximum number of seconds to wait
+            index: Number of the segment (default: the whole reply)
+
+        Returns:
+            Path of the audio file
+
+        Raises:
+            KeyError: If the job or segment is unknown or has been forgotten
+            asyncio.TimeoutError: If the audio isn't ready within the timeout
+            RuntimeError: If synthesis failed
+        """
+        self._evict()
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Submitted by another worker process, or before a restart
+            manifest = self._read_manifest(job_id)
+            if manifest is None:
+                raise KeyError(job_id)
+            if index is not None and not 0 <= index < len(manifest["segments"]):
+                raise KeyError(f"{job_id}/{index}")
+            return await self._wait_on_disk(manifest, timeout, index)
+        if index is None:
+            return await self._await(job.task, timeout)
+        if not 0 <= index < len(job.segments):
+            raise KeyError(f"{job_id}/{index}")
+        return await self._await(job.segments[index], timeout)
+
+    async def lipsync(self, job_id: str, timeout: float, index: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Wait for the lipsync cues of a job, or of one of its segments.
+
+        Args:
+            job_id: ID of the job
+            timeout: Maximum number of seconds to wait for the audio
+            index: Number of the segment (default: the whole reply)
+
+        Returns:
+            The cues, as compute_cues returns them
+
+        Raises:
+            KeyError: If the job or segment is unknown, or its audio is gone
+            asyncio.TimeoutError: If the audio isn't ready within the timeout
+            RuntimeError: If synthesis or the analysis failed
+        """
+        audio_path = await self.wait(job_id, timeout, index)
+        if not os.path.exists(audio_path):
+            raise KeyError(job_id)
+        try:
+            with open(await self._cues(audio_path)) as f:
+                return json.load(f)
+        except Exception as e:
+            raise RuntimeError(f"Lipsync analysis failed: {e}") from e
+
+    async def iter_segments(self, job_id: str, timeout: float) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Wait for the segments of a job in order.
+
+        Args:
+            job_id: ID of the job
+            timeout: Maximum number of seconds to wait for each segment
+
+        Yields:
+            The number and URL of each segment once its audio is ready
+
+        Raises:
+            KeyError: If the job is unknown or has been forgotten
+            asyncio.TimeoutError: If a segment isn't ready within the timeout
+            RuntimeError: If synthesis of a segment failed
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            manifest = self._read_manifest(job_id)
+            if manifest is None:
+                raise KeyError(job_id)
+            for index in range(len(manifest["segments"])):
+                await self._wait_on_disk(manifest, timeout, index)
+                yield index, self.url_for(job_id, index)
+            return
+        for index, task in enumerate(job.segments):
+            await self._await(task, timeout)
+            yield index, self.url_for(job_id, index)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get job counters.
+
+        Returns:
+            Remembered and pending jobs, the submitted, prefetched, completed
+            and failed totals, and the audio cache and worker pool counters
+        """
+        return {
+            "jobs": len(self._jobs),
+            "pending": sum(1 for job in self._jobs.values() if not job.task.done()),
+            "submitted": self.submitted,
+            "prefetched": self.prefetched,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cache": self.cache.stats(),
+            "executor": self.executor.stats(),
+        }
+
+    async def close(self) -> None:
+        """Cancel every job still running."""
+        tasks = [*self._prefetches]
+        for job in self._jobs.values():
+            tasks.extend((*job.segments, job.task))
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._jobs.clear()
+        self._prefetches.clear()
+        self.executor.shutdown()
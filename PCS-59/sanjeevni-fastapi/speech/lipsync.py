@@ -0,0 +1,143 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import soundfile
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Analysis frames: 25 ms windows every 10 ms
+FRAME_SECONDS = 0.010
+WINDOW_SECONDS = 0.025
+# Frames this many dB below the loud parts of the speech, or below the
+# absolute floor, are silence
+SILENCE_DB = 35.0
+SILENCE_FLOOR_DB = -60.0
+# Silences shorter than this between sounds are lips closing, not rest
+MAX_CLOSURE_SECONDS = 0.15
+# Mouth shapes held for less than this are merged into the previous one
+MIN_CUE_SECONDS = 0.05
+
+# Mouth shapes, as named by Rhubarb Lip Sync which the avatar frontend follows:
+# A closed (P, B, M), B slightly open (K, S, T, EE), C open (EH, AE),
+# D wide open (AA), E rounded (AO, ER), F puckered (UW, OW, W),
+# G upper teeth on lower lip (F, V), X idle
+_VISEMES = np.array(list("ABCDEFGX"))
+_A, _B, _C, _D, _E, _F, _G, _X = range(len(_VISEMES))
+
+
+def decode_audio(path: str) -> Tuple[np.ndarray, int]:
+    """
+    Decode an audio file (MP3, WAV or any other format libsndfile reads).
+
+    Args:
+        path: Path of the audio file
+
+    Returns:
+        The samples as float32 mono, and the sample rate
+    """
+    samples, rate = soundfile.read(path, dtype="float32", always_2d=True)
+    return samples.mean(axis=1), rate
+
+
+def _classify(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Get the mouth shape of every analysis frame."""
+    hop = max(1, int(rate * FRAME_SECONDS))
+    window = max(hop, int(rate * WINDOW_SECONDS))
+
+    # Overlapping frames as a strided view of the samples, without copying
+    frames = sliding_window_view(samples, window)[::hop]
+
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    peak = np.percentile(rms, 95)
+    silent = rms < max(peak * 10 ** (-SILENCE_DB / 20), 10 ** (SILENCE_FLOOR_DB / 20))
+    # How far the mouth opens follows the amplitude relative to the loud parts
+    opening = np.clip(rms / (peak + 1e-10), 0.0, 1.0)
+
+    power = np.abs(np.fft.rfft(frames * np.hanning(window), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(window, 1.0 / rate)
+    total = power.sum(axis=1) + 1e-12
+    # Fricatives put most of their energy up high; rounded vowels have a
+    # low first formant and little energy above it
+    fricative = power[:, freqs >= 3000].sum(axis=1) / total > 0.5
+    rounded = power @ freqs / total < 750
+
+    return np.select(
+        [
+            silent,
+            # Labial fricatives (F, V) are much quieter than sibilants (S, T)
+            fricative & (opening < 0.2),
+            fricative,
+            opening < 0.15,
+            rounded & (opening < 0.5),
+            rounded,
+            opening > 0.7,
+            opening > 0.4,
+        ],
+        [_X, _G, _B, _A, _F, _E, _D, _C],
+        default=_B,
+    )
+
+
+def compute_cues(samples: np.ndarray, rate: int) -> Dict[str, Any]:
+    """
+    Compute lipsync mouth cues from speech audio.
+
+    Every 10 ms frame is classified into a mouth shape from its loudness
+    and spectrum; runs of equal shapes become cues. Short pauses between
+    sounds close the lips, and shapes held too briefly to be seen are
+    merged into the cue before them.
+
+    Args:
+        samples: The samples as float32 mono
+        rate: The sample rate
+
+    Returns:
+        {"metadata": {"duration": ...}, "mouthCues": [{"start", "end", "value"}, ...]}
+        with times in seconds; the cues cover the whole audio
+    """
+    duration = len(samples) / rate
+    if len(samples) < rate * WINDOW_SECONDS:
+        return {
+            "metadata": {"duration": round(duration, 2)},
+            "mouthCues": [{"start": 0.0, "end": round(duration, 2), "value": "X"}],
+        }
+
+    shapes = _classify(samples, rate)
+    # Runs of equal shapes
+    changes = np.flatnonzero(shapes[1:] != shapes[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(shapes)]))
+    values = shapes[starts]
+
+    frame = max(1, int(rate * FRAME_SECONDS)) / rate
+    closures = (values == _X) & (starts > 0) & (ends < len(shapes)) & ((ends - starts) * frame < MAX_CLOSURE_SECONDS)
+    values[closures] = _A
+    min_frames = MIN_CUE_SECONDS / frame
+
+    cues: List[Dict[str, Any]] = []
+    for start, end, value in zip(starts.tolist(), ends.tolist(), _VISEMES[values].tolist()):
+        if cues and (cues[-1]["value"] == value or end - start < min_frames):
+            cues[-1]["end"] = end
+        else:
+            cues.append({"start": start, "end": end, "value": value})
+
+    for cue in cues:
+        cue["start"] = round(cue["start"] * frame, 2)
+        cue["end"] = round(cue["end"] * frame, 2)
+    # The last frames don't reach the end of the audio
+    cues[-1]["end"] = round(duration, 2)
+
+    return {"metadata": {"duration": round(duration, 2)}, "mouthCues": cues}
+
+
+def write_cues(audio_path: str, filepath: str) -> None:
+    """
+    Compute the lipsync cues of an audio file and save them as JSON.
+
+    Args:
+        audio_path: Path of the audio file
+        filepath: Path the JSON file is written to
+    """
+    cues = compute_cues(*decode_audio(audio_path))
+    with open(filepath, "w") as f:
+        json.dump(cues, f)
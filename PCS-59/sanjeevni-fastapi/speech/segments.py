@@ -0,0 +1,123 @@
+import os
+import re
+from typing import List
+
+import numpy as np
+import soundfile
+
+from config import SPEECH_SEGMENT_MAX_CHARS
+
+# A sentence ends at terminal punctuation followed by whitespace, or at a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?…।。！？])\s+|\s*\n\s*")
+# Abbreviations whose period doesn't end a sentence, lowercased without the last period
+_ABBREVIATIONS = frozenset({
+    "dr", "mr", "mrs", "ms", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx",
+})
+# Places a long sentence is split at, best first
+_CLAUSE_BREAKS = (", ", "; ", ": ", " - ", " ")
+# Pieces without a word character (list markers, rules) have nothing to speak
+_SPEAKABLE = re.compile(r"\w")
+
+
+def _ends_sentence(sentence: str) -> bool:
+    """Whether the punctuation a sentence ends with ends it, rather than an abbreviation or list number."""
+    if not sentence.endswith("."):
+        return True
+    words = sentence.split()
+    word = words[-1][:-1].lstrip("([\"'").lower()
+    if word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+        # "Dr. Smith", "e.g. fever", "J. Smith"
+        return False
+    # "1. Take the tablets" starts a numbered list item
+    return not (len(words) == 1 and word.isdigit())
+
+
+def _split(text: str) -> List[str]:
+    """Split text at sentence ends and line breaks."""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[start:match.start()]
+        if "\n" in match.group() or _ends_sentence(sentence):
+            sentences.append(sentence)
+            start = match.end()
+    sentences.append(text[start:])
+    return sentences
+
+
+def _chunk(sentence: str, max_chars: int) -> List[str]:
+    """Split a sentence into pieces of at most max_chars, at clause breaks if possible."""
+    chunks = []
+    while len(sentence) > max_chars:
+        cut = -1
+        for separator in _CLAUSE_BREAKS:
+            position = sentence.rfind(separator, 0, max_chars)
+            # A break in the first half would leave a long tail; try the next kind
+            if position > max_chars // 2:
+                cut = position + len(separator.rstrip())
+                break
+        if cut <= 0:
+            cut = max_chars
+        chunks.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    chunks.append(sentence)
+    return chunks
+
+
+def split_sentences(text: str, max_chars: int = SPEECH_SEGMENT_MAX_CHARS, final: bool = True) -> List[str]:
+    """
+    Split text into the segments it is spoken in.
+
+    Segments are sentences or lines; sentences longer than max_chars are
+    split further. Periods of common abbreviations, initials and list
+    numbers don't end a sentence. Pieces with nothing to speak are left out.
+
+    Args:
+        text: The text to split
+        max_chars: Longest segment
+        final: Whether the text is complete. If not, the trailing sentence
+            may still grow and is left out, so the segments returned for a
+            growing text never change.
+
+    Returns:
+        The segments in order
+    """
+    sentences = _split(text)
+    if not final:
+        sentences = sentences[:-1]
+
+    segments = []
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if _SPEAKABLE.search(sentence):
+            segments.extend(_chunk(sentence, max_chars))
+    return segments
+
+
+def join_audio(paths: List[str], filepath: str) -> None:
+    """
+    Join audio files into one, in order.
+
+    The files are decoded and the joined audio encoded again, in the format
+    of filepath's extension. Plain concatenation isn't safe: MP3 files may
+    start with a header giving their length, and players stop there.
+
+    Args:
+        paths: The files to join, all with the same sample rate and channels
+        filepath: Path the joined file is written to
+
+    Raises:
+        ValueError: If the files can't be joined
+    """
+    parts = []
+    rate = channels = None
+    for path in paths:
+        samples, file_rate = soundfile.read(path, dtype="float32", always_2d=True)
+        if rate is None:
+            rate, channels = file_rate, samples.shape[1]
+        elif (file_rate, samples.shape[1]) != (rate, channels):
+            raise ValueError(f"Cannot join audio of different sample rates or channels: {path}")
+        parts.append(samples)
+
+    soundfile.write(filepath, np.concatenate(parts), rate,
+                    format=os.path.splitext(filepath)[1].lstrip(".").upper())
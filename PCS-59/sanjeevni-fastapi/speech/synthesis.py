@@ -0,0 +1,144 @@
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from config import logger
+from speech.cache import AudioCache
+
+if TYPE_CHECKING:
+    # speech.executor imports this module for its worker initializer
+    from speech.executor import SpeechExecutor
+
+# Engines in the order synthesize tries them, with the format each writes
+ENGINES = (("gtts", "mp3"), ("pyttsx3", "wav"))
+
+# pyttsx3 engine of this process, created once and reused for every job;
+# the lock matters only when jobs run on threads instead of processes
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def synthesize_gtts(text: str, lang: str, filepath: str) -> None:
+    """
+    Convert text to speech with gTTS (Google Text-to-Speech).
+
+    This doesn't require a Google Cloud subscription, but it does an HTTP
+    request, so it blocks until the service answers.
+
+    Args:
+        text: The text to convert to speech
+        lang: The language code
+        filepath: Path the MP3 file is written to
+    """
+    from gtts import gTTS
+
+    logger.info(f"Converting text to speech using gTTS. Language: {lang}")
+
+    tts = gTTS(text=text, lang=lang, slow=False)
+    tts.save(filepath)
+    logger.info(f"Saved audio file to {filepath}")
+
+
+def init_pyttsx3_engine() -> None:
+    """
+    Create this process's pyttsx3 engine.
+
+    Used as the initializer of the TTS worker processes. A failure is only
+    logged, so the pool still starts; jobs then fail and report it.
+    """
+    global _engine
+    try:
+        import pyttsx3
+
+        _engine = pyttsx3.init()
+        _engine.setProperty('rate', 150)  # Speed of speech
+    except Exception as e:
+        logger.error(f"Could not initialize pyttsx3: {e}")
+
+
+def synthesize_pyttsx3(text: str, lang: str, filepath: str) -> None:
+    """
+    Convert text to speech with pyttsx3 (offline text-to-speech engine).
+
+    Args:
+        text: The text to convert to speech
+        lang: The language code
+        filepath: Path the WAV file is written to
+    """
+    with _engine_lock:
+        if _engine is None:
+            init_pyttsx3_engine()
+            if _engine is None:
+                raise RuntimeError("pyttsx3 is not available")
+
+        logger.info("Using pyttsx3 fallback for text-to-speech")
+
+        # Try to set a voice based on language code (if available)
+        voices = _engine.getProperty('voices')
+        for voice in voices:
+            # This is a rough approximation - voice IDs vary by system
+            if lang in voice.id.lower():
+                _engine.setProperty('voice', voice.id)
+                break
+
+        # Save to file
+        _engine.save_to_file(text, filepath)
+        _engine.runAndWait()
+    logger.info(f"Saved audio file to {filepath}")
+
+
+async def synthesize(text: str, lang: str, cache: AudioCache, executor: "SpeechExecutor") -> str:
+    """
+    Convert text to speech, falling back to pyttsx3 if gTTS fails.
+
+    Speech already in the cache is reused instead of synthesized again.
+    gTTS runs on the executor's threads and pyttsx3 on its processes.
+
+    Args:
+        text: The text to convert to speech
+        lang: The language code
+        cache: Cache the audio file is looked up in and stored to
+        executor: Worker pools the engines run on
+
+    Returns:
+        Path of the audio file
+
+    Raises:
+        RuntimeError: If every engine failed
+    """
+    try:
+        path, _ = await cache.get_or_create(
+            "gtts", lang, text, "mp3",
+            lambda filepath: executor.run_in_thread(synthesize_gtts, text, lang, filepath)
+        )
+        return path
+    except Exception as e:
+        logger.warning(f"Error using gTTS: {e!r}. Falling back to pyttsx3.")
+
+    try:
+        path, _ = await cache.get_or_create(
+            "pyttsx3", lang, text, "wav",
+            lambda filepath: executor.run_in_process(synthesize_pyttsx3, text, lang, filepath)
+        )
+        return path
+    except Exception as e:
+        logger.error(f"Error in fallback TTS: {e!r}", exc_info=True)
+        raise RuntimeError("All TTS methods failed") from e
+
+
+def find_speech(text: str, lang: str, cache: AudioCache) -> Optional[str]:
+    """
+    Find speech synthesize has already stored, without synthesizing it.
+
+    Args:
+        text: The text that was converted to speech
+        lang: The language code
+        cache: Cache the audio file was stored to
+
+    Returns:
+        Path of the audio file, or None if it isn't cached
+    """
+    for engine, extension in ENGINES:
+        path = cache.find(engine, lang, text, extension)
+        if path is not None:
+            return path
+    return None
@@ -0,0 +1,58 @@
+import uuid
+
+import pytest
+
+from database.sqlite import SQLiteDatabase
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A database with one live conversation and one archived in January 2020."""
+    database = SQLiteDatabase(str(tmp_path / "conversations.db"), archive_dir=str(tmp_path / "archive"))
+
+    archived_id = str(uuid.uuid4())
+    database.import_records([
+        {"type": "conversation", "id": archived_id, "created_at": "2020-01-01T00:00:00"},
+        {"type": "message", "conversation_id": archived_id, "id": str(uuid.uuid4()),
+         "role": "user", "content": "I have a fever", "timestamp": "2020-01-01T00:00:00"},
+    ])
+    assert database.archive_idle_conversations(idle_days=1) == [archived_id]
+
+    live_id = database.create_conversation()
+    database.add_message(live_id, "user", "My head hurts")
+    database.flush()
+
+    yield database, live_id, archived_id
+    database.close()
+
+
+def test_archived_conversations_are_listed(database):
+    database, live_id, archived_id = database
+
+    conversations = database.get_all_conversations()
+    assert [conversation["id"] for conversation in conversations] == [live_id, archived_id]
+    assert conversations[1] == {
+        "id": archived_id,
+        "created_at": "2020-01-01T00:00:00",
+        "message_count": 1,
+        "last_activity": "2020-01-01T00:00:00",
+    }
+    assert [conversation["id"] for conversation in database.get_all_conversations(limit=1, offset=1)] == [archived_id]
+
+    # Keyset pages continue from a live conversation into the archive
+    first, cursor = database.get_conversations_page(limit=1)
+    assert [conversation["id"] for conversation in first] == [live_id]
+    second, cursor = database.get_conversations_page(limit=1, after=cursor)
+    assert [conversation["id"] for conversation in second] == [archived_id]
+    assert cursor is None
+
+
+def test_opening_a_listed_archived_conversation_restores_it(database):
+    database, live_id, archived_id = database
+
+    assert database.get_conversation_info(archived_id)["message_count"] == 1
+    messages = database.get_conversation(archived_id)
+    assert [message["content"] for message in messages] == ["I have a fever"]
+
+    # Restored conversations are listed once, from the live tables
+    assert [conversation["id"] for conversation in database.get_all_conversations()] == [live_id, archived_id]
@@ -0,0 +1,24 @@
+from speech.segments import split_sentences
+
+
+def test_list_numbers_and_abbreviations_do_not_end_sentences():
+    assert split_sentences("1. Take 2.5 mg daily. Dr. Smith said so.") == [
+        "1. Take 2.5 mg daily.",
+        "Dr. Smith said so.",
+    ]
+    assert split_sentences("Drink fluids, e.g. water.\n2. See a doctor (i.e. Dr. Rao) if it gets worse! Ok?") == [
+        "Drink fluids, e.g. water.",
+        "2. See a doctor (i.e. Dr. Rao) if it gets worse!",
+        "Ok?",
+    ]
+
+
+def test_numbers_ending_a_sentence_still_end_it():
+    assert split_sentences("The dose is 2. Take it now.") == ["The dose is 2.", "Take it now."]
+
+
+def test_growing_text_keeps_its_segments():
+    text = "1. Take 2.5 mg daily. Dr. Smith said so."
+    for end in range(len(text) + 1):
+        segments = split_sentences(text[:end], final=False)
+        assert segments == split_sentences(text)[:len(segments)]
@@ -0,0 +1,60 @@
+import os
+import uuid
+
+import pytest
+
+from database.archive import ArchiveStore
+from database.sharded import ShardedDatabase
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    """Two shards sharing one archive directory, each with one conversation archived in January 2020."""
+    database = ShardedDatabase(str(tmp_path / "conversations.db"), shards=2,
+                               archive_dir=str(tmp_path / "archive"))
+
+    # One old conversation per shard
+    conversations = {}
+    while len(conversations) < 2:
+        conversation_id = str(uuid.uuid4())
+        conversations.setdefault(database.shards.index(database.shard_for(conversation_id)), conversation_id)
+    records = []
+    for conversation_id in conversations.values():
+        records.append({"type": "conversation", "id": conversation_id, "created_at": "2020-01-01T00:00:00"})
+        records.append({"type": "message", "conversation_id": conversation_id, "id": str(uuid.uuid4()),
+                        "role": "user", "content": "I have a fever", "timestamp": "2020-01-01T00:00:00"})
+    database.import_records(records)
+
+    # Archive into a past month's file, which purging may delete
+    monkeypatch.setattr(ArchiveStore, "_current_filename", lambda self: f"{self.prefix}-202001.jsonl.gz")
+    for shard in database.shards:
+        assert shard.archive_idle_conversations(idle_days=1)
+    monkeypatch.undo()
+
+    yield database, [conversations[0], conversations[1]], str(tmp_path / "archive")
+    database.close()
+
+
+def test_shards_archive_to_separate_files(sharded):
+    database, _, archive_dir = sharded
+
+    assert sorted(os.listdir(archive_dir)) == [
+        "archive-conversations.shard0-202001.jsonl.gz",
+        "archive-conversations.shard1-202001.jsonl.gz",
+    ]
+
+
+def test_purging_one_shard_keeps_the_archive_of_the_others(sharded):
+    database, conversation_ids, archive_dir = sharded
+
+    # Nothing is past retention; the sweep must not delete the other shard's file
+    assert database.shards[0].purge_conversations(retention_days=100000) == []
+    assert len(os.listdir(archive_dir)) == 2
+
+    # Purging shard 0's conversation deletes only shard 0's file
+    assert database.shards[0].purge_conversations(retention_days=0) == [conversation_ids[0]]
+    assert os.listdir(archive_dir) == ["archive-conversations.shard1-202001.jsonl.gz"]
+
+    # Shard 1's conversation can still be restored from its archive
+    messages = database.get_conversation(conversation_ids[1])
+    assert [message["content"] for message in messages] == ["I have a fever"]
@@ -0,0 +1,32 @@
+import re
+
+# Words, and every other non-space character on its own
+_PIECES = re.compile(r"\w+|[^\w\s]")
+# Role markers and separators a message adds to the prompt besides its text
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate how many tokens text takes in a prompt.
+
+    The model's tokenizer isn't available offline, so this approximates
+    it: about four characters per token for Latin-script words, two for
+    other scripts (Devanagari, CJK), whose words split into more pieces,
+    and one token per punctuation mark. That is close enough to budget
+    prompts with, as long as budgets leave some headroom.
+
+    Args:
+        text: The text to count
+
+    Returns:
+        The estimated number of tokens
+    """
+    if not text:
+        return 0
+
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        chars_per_token = 4 if piece.isascii() else 2
+        tokens += -(-len(piece) // chars_per_token)
+    return tokens
@@ -153,5 +153,9 @@ tool_registry.register_tool(
     name="generate_pdf_table",
     description="Generate a PDF with a table based on the input dictionary data",
     parameters=pdf_table_params,
-    handler=generate_pdf_table
+    handler=generate_pdf_table,
+    # Rendering a large table takes a while, and two reports with the same
+    # title in the same second would be written to the same file
+    timeout=60,
+    parallel_safe=False,
 )
\ No newline at end of file
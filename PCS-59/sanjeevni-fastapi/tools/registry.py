@@ -1,4 +1,10 @@
-from typing import Dict, List, Any, Callable
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional
+
+from config import TOOL_TIMEOUT_SECONDS, TOOL_WORKERS, logger
 
 # Mapping from JSON Schema types to Genai Types
 TYPE_MAP = {
@@ -13,11 +19,31 @@ TYPE_MAP = {
 class ToolRegistry:
     """Registry for all available tools that can be called by the chatbot."""
     
-    def __init__(self):
+    def __init__(self, workers: int = TOOL_WORKERS, timeout: float = TOOL_TIMEOUT_SECONDS):
+        """
+        Initialize an empty registry.
+        
+        Args:
+            workers: Number of threads tool calls run on
+            timeout: Seconds a tool call may take unless the tool sets its own
+        """
         self.tools: Dict[str, Dict[str, Any]] = {}
+        # Bumped on every registration, so callers can tell when definitions change
+        self.version = 0
+        self.workers = workers
+        self.timeout = timeout
+        # Started on first use, so importing the tools starts no threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # One lock per tool that must not run alongside itself, held by the
+        # worker thread for as long as the call actually runs
+        self._locks: Dict[str, threading.Lock] = {}
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
     
     def register_tool(self, name: str, description: str, parameters: Dict[str, Any], 
-                      handler: Callable):
+                      handler: Callable, timeout: Optional[float] = None,
+                      parallel_safe: bool = True):
         """
         Register a new tool with the registry.
         
@@ -26,13 +52,19 @@ class ToolRegistry:
             description: Description of what the tool does
             parameters: JSON Schema object describing the parameters
             handler: Function that implements the tool's functionality
+            timeout: Seconds a call may take (default: the registry's timeout)
+            parallel_safe: Whether calls to the tool may run at the same time
+                as each other; unsafe tools still run alongside other tools
         """
         self.tools[name] = {
             "name": name,
             "description": description,
             "parameters": parameters, # Store original parameters schema
-            "handler": handler
+            "handler": handler,
+            "timeout": timeout,
+            "parallel_safe": parallel_safe,
         }
+        self.version += 1
     
     def get_tool_definitions(self) -> List[Dict[str, Any]]:
         """
@@ -88,5 +120,102 @@ class ToolRegistry:
                 "error": str(e)
             }
 
+    async def _execute(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run one tool call on the worker threads, within the tool's timeout.
+
+        The timeout starts when the call starts running. A call that waits
+        longer than the timeout to start, for a free worker or for another
+        call of an unsafe tool, is given up and never runs.
+        """
+        tool = self.tools.get(tool_name)
+        timeout = (tool and tool["timeout"]) or self.timeout
+        lock = None
+        if tool is not None and not tool["parallel_safe"]:
+            lock = self._locks.setdefault(tool_name, threading.Lock())
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tool")
+
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        abandoned = threading.Event()
+
+        def work() -> Optional[Dict[str, Any]]:
+            # A call that timed out keeps the lock until its thread finishes,
+            # so an unsafe tool never runs alongside itself
+            with lock if lock is not None else contextlib.nullcontext():
+                if abandoned.is_set():
+                    return None
+                loop.call_soon_threadsafe(started.set)
+                return self.execute_tool(tool_name, params)
+
+        future = asyncio.wrap_future(self._executor.submit(work))
+        try:
+            await asyncio.wait_for(started.wait(), timeout)
+        except asyncio.TimeoutError:
+            abandoned.set()
+            future.cancel()
+            self.timeouts += 1
+            logger.warning(f"Tool '{tool_name}' could not start within {timeout} seconds")
+            return {"status": "error", "error": f"Tool '{tool_name}' could not start within {timeout} seconds"}
+
+        try:
+            # A running call can't be interrupted; on timeout it finishes on
+            # its thread and its result is discarded
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Tool '{tool_name}' timed out after {timeout} seconds")
+            return {"status": "error", "error": f"Tool '{tool_name}' timed out after {timeout} seconds"}
+        except ValueError as e:
+            self.failed += 1
+            return {"status": "error", "error": str(e)}
+
+        if result["status"] == "success":
+            self.completed += 1
+        else:
+            self.failed += 1
+        return result
+
+    async def execute_tools(self, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Execute a batch of tool calls concurrently.
+        
+        Calls run on a bounded pool of worker threads, so the batch takes
+        about as long as its slowest call. Calls to a tool registered as not
+        parallel-safe wait for each other, including calls that already
+        timed out but are still running. A call that fails, times out or
+        names an unknown tool gets an error result; the others are unaffected.
+        
+        Args:
+            calls: Tool calls, each with a "name" and its "args"
+            
+        Returns:
+            The result of each call, in the order of the calls
+        """
+        return list(await asyncio.gather(
+            *(self._execute(call["name"], call["args"]) for call in calls)
+        ))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get tool execution counters.
+        
+        Returns:
+            Worker threads, and completed, failed and timed-out calls
+        """
+        return {
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker threads, dropping calls that haven't started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
 # Create a global tool registry
 tool_registry = ToolRegistry()